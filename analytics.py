@@ -0,0 +1,423 @@
+"""
+Vectorized analyses of the STI of the atoms over a captured timeseries
+
+Each analysis works on an STI matrix with one row per point in time and one
+column per atom, as returned by sti_matrix(). The matrix is either a dense
+NumPy array, in which atoms that are absent from a point in time are NaN,
+or a SciPy sparse matrix, which only stores the atoms that are present and
+suits timeseries of the attentional focus, where most atoms are absent at
+any point in time. Dense matrices are processed ANALYTICS_CHUNK_CELLS values
+at a time, so that no analysis makes a full-size temporary copy of them.
+
+Example:
+    timeseries = Experiment([importance_diffusion, importance_updating],
+                            capture=['atomspace']).run(num_steps=1000)
+    matrix, handles, timesteps = sti_matrix(timeseries['atomspace'])
+    steps, columns = af_events(matrix, boundary=100)['entered']
+    for step, column in zip(steps, columns):
+        print timesteps[step], handles[column]
+    print sti_drift(matrix)['max_relative_drift']
+
+Requires NumPy. Sparse matrices require SciPy.
+
+See README.md for documentation and instructions.
+"""
+
+from configuration import ANALYTICS_CHUNK_CELLS
+from timeseries import Timeseries
+from stifile import STIFile
+
+# NumPy is imported the first time it is needed, by _require_numpy()
+numpy = None
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("NumPy is required for this operation; to "
+                              "enable, install NumPy")
+
+
+def sti_matrix(timeseries, sparse=False):
+    """
+    Return the STI matrix of a timeseries
+
+    Parameters:
+    timeseries (required) A Timeseries, an STIFile, or any other sequence of
+      PointInTime dictionaries
+    sparse (optional) If True, return a SciPy sparse matrix (in CSR format)
+      rather than a dense NumPy array
+
+    Returns a (matrix, handles, timesteps) tuple, where 'handles' is the
+    handle of each column and 'timesteps' the timestep of each row.
+    """
+    _require_numpy()
+    if isinstance(timeseries, STIFile):
+        _, columns, sti = timeseries.arrays()
+        counts = timeseries.points['count'].astype(numpy.intp)
+        handles = timeseries.handles
+        timesteps = numpy.array(timeseries.timesteps)
+    else:
+        if not isinstance(timeseries, Timeseries):
+            points = timeseries
+            timeseries = Timeseries()
+            timeseries.extend(points)
+        _, columns, sti = timeseries.arrays()
+        counts = numpy.diff(numpy.frombuffer(timeseries.offsets,
+                                             dtype=numpy.int_))
+        handles = timeseries.handles
+        timesteps = numpy.frombuffer(timeseries.point_timesteps,
+                                     dtype=numpy.int_).copy()
+
+    shape = (len(counts), len(handles))
+    rows = numpy.repeat(numpy.arange(shape[0]), counts)
+    if sparse:
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            raise ImportError("Sparse STI matrices are not enabled; to "
+                              "enable, install SciPy")
+        matrix = csr_matrix((numpy.asarray(sti, dtype=numpy.float64),
+                             (rows, numpy.asarray(columns))), shape=shape)
+    else:
+        matrix = numpy.full(shape, numpy.nan)
+        matrix[rows, columns] = sti
+    return matrix, handles, timesteps
+
+
+def af_size(matrix, boundary):
+    """
+    Return the number of atoms in the attentional focus at each point in
+    time, that is the atoms whose STI is at least 'boundary', the value
+    given to set_af_boundary()
+    """
+    _require_numpy()
+    if _is_sparse(matrix):
+        rows, _, data = _triplets(matrix)
+        return numpy.bincount(rows[data >= boundary],
+                              minlength=matrix.shape[0])
+
+    sizes = numpy.empty(matrix.shape[0], dtype=numpy.int_)
+    with numpy.errstate(invalid='ignore'):
+        for start, block in _blocks(matrix):
+            sizes[start:start + len(block)] = (block >= boundary).sum(axis=1)
+    return sizes
+
+
+def af_events(matrix, boundary):
+    """
+    Return the atoms that enter and leave the attentional focus
+
+    An atom enters the attentional focus at a point in time if its STI is
+    at least 'boundary', the value given to set_af_boundary(), and it was
+    below or absent at the previous point in time. It leaves the attentional
+    focus in the opposite case.
+
+    Returns a dictionary with the keys 'entered' and 'exited', each a
+    (rows, columns) tuple of arrays that lists the events in order of row.
+    """
+    _require_numpy()
+    if _is_sparse(matrix):
+        rows, columns, data = _triplets(matrix)
+        width = matrix.shape[1]
+        members = rows[data >= boundary] * width + columns[data >= boundary]
+        later = members + width
+        entered = numpy.setdiff1d(members[members >= width], later,
+                                  assume_unique=True)
+        later = later[later < matrix.shape[0] * width]
+        exited = numpy.setdiff1d(later, members, assume_unique=True)
+        return {'entered': (entered // width, entered % width),
+                'exited': (exited // width, exited % width)}
+
+    events = {True: ([], []), False: ([], [])}
+    with numpy.errstate(invalid='ignore'):
+        for start, block in _pairs(matrix):
+            member = block >= boundary
+            rows, columns = numpy.nonzero(member[1:] != member[:-1])
+            entering = member[rows + 1, columns]
+            for direction in (True, False):
+                chosen = entering == direction
+                events[direction][0].append(rows[chosen] + start)
+                events[direction][1].append(columns[chosen])
+    return dict((name, (_concatenate(events[direction][0]),
+                        _concatenate(events[direction][1])))
+                for name, direction in (('entered', True), ('exited', False)))
+
+
+def top_k(matrix, k):
+    """
+    Return the columns of the 'k' atoms with the highest STI at each point in
+    time, as an array with one row per point in time, in decreasing order of
+    STI. Rows with fewer than 'k' atoms are padded with -1.
+    """
+    _require_numpy()
+    if _is_sparse(matrix):
+        rows, columns, ranks = _ranks(matrix)
+        keep = ranks < k
+        top = numpy.full((matrix.shape[0], k), -1, dtype=numpy.int_)
+        top[rows[keep], ranks[keep]] = columns[keep]
+        return top
+
+    count = min(k, matrix.shape[1])
+    top = numpy.full((matrix.shape[0], k), -1, dtype=numpy.int_)
+    if not count:
+        return top
+    for start, block in _blocks(matrix):
+        values = numpy.where(numpy.isnan(block), -numpy.inf, block)
+        columns = numpy.argpartition(-values, count - 1, axis=1)[:, :count]
+        selected = numpy.take_along_axis(values, columns, axis=1)
+        order = numpy.argsort(-selected, axis=1, kind='mergesort')
+        columns = numpy.take_along_axis(columns, order, axis=1)
+        columns[numpy.take_along_axis(selected, order, axis=1) ==
+                -numpy.inf] = -1
+        top[start:start + len(block), :count] = columns
+    return top
+
+
+def rank_changes(matrix, k=None):
+    """
+    Return the mean absolute change of rank of the atoms from each point in
+    time to the next, as an array with one entry per point in time after the
+    first
+
+    Atoms are ranked from 0, the atom with the highest STI. Only the atoms
+    that are ranked at both points in time are counted, and entries with no
+    such atoms are NaN.
+
+    Parameters:
+    k (optional) If given, only the 'k' atoms with the highest STI are
+      ranked, which is much faster than ranking every atom
+    """
+    _require_numpy()
+    steps = matrix.shape[0]
+    if _is_sparse(matrix):
+        rows, columns, ranks = _ranks(matrix)
+        if k is not None:
+            keep = ranks < k
+            rows, columns, ranks = rows[keep], columns[keep], ranks[keep]
+    elif k is not None:
+        top = top_k(matrix, k)
+        rows = numpy.repeat(numpy.arange(steps), k)
+        ranks = numpy.tile(numpy.arange(k), steps)
+        columns = top.ravel()
+        keep = columns >= 0
+        rows, columns, ranks = rows[keep], columns[keep], ranks[keep]
+    else:
+        return _dense_rank_changes(matrix)
+
+    # Matches each ranked atom with the same atom at the previous point in
+    # time, through their position in the row-major order of the matrix
+    width = matrix.shape[1]
+    keys = rows * width + columns
+    order = numpy.argsort(keys, kind='mergesort')
+    keys, rows, ranks = keys[order], rows[order], ranks[order]
+    previous = numpy.searchsorted(keys, keys - width)
+    previous[previous >= len(keys)] = 0
+    matched = (keys[previous] == keys - width) & (rows > 0)
+    changes = numpy.abs(ranks[matched] - ranks[previous[matched]])
+    return _row_means(rows[matched], changes, steps)
+
+
+def _dense_rank_changes(matrix):
+    steps = matrix.shape[0]
+    sums = numpy.zeros(steps)
+    counts = numpy.zeros(steps)
+    for start, block in _pairs(matrix):
+        ranks = _dense_ranks(block)
+        both = (ranks[:-1] >= 0) & (ranks[1:] >= 0)
+        changes = numpy.where(both, numpy.abs(ranks[1:] - ranks[:-1]), 0)
+        sums[start:start + len(changes)] = changes.sum(axis=1)
+        counts[start:start + len(changes)] = both.sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts)[1:]
+
+
+def _dense_ranks(block):
+    # Ranks of the atoms of each row of a dense block, -1 for absent atoms
+    values = numpy.where(numpy.isnan(block), -numpy.inf, block)
+    order = numpy.argsort(-values, axis=1, kind='mergesort')
+    ranks = numpy.empty(block.shape, dtype=numpy.int_)
+    numpy.put_along_axis(ranks, order,
+                         numpy.arange(block.shape[1])[numpy.newaxis, :],
+                         axis=1)
+    ranks[numpy.isnan(block)] = -1
+    return ranks
+
+
+def rolling_stats(matrix, window, columns=None):
+    """
+    Return the mean and standard deviation of the STI of atoms over a
+    sliding window of points in time, computed from cumulative sums
+
+    Absent atoms are left out of the statistics of the windows they are
+    absent from.
+
+    Parameters:
+    matrix (required) An STI matrix, or a one-dimensional array such as the
+      'total' of sti_drift()
+    window (required) Number of points in time in each window
+    columns (optional) The columns to compute the statistics of. Defaults to
+      every column. A sparse matrix is made dense for these columns only.
+
+    Returns a dictionary with the 'mean', 'std' and 'count' of each window,
+    as arrays with one row per window: row i covers the points in time i to
+    i + window - 1.
+    """
+    _require_numpy()
+    if columns is not None:
+        matrix = matrix[:, columns]
+    if _is_sparse(matrix):
+        dense = numpy.full(matrix.shape, numpy.nan)
+        rows, columns, data = _triplets(matrix)
+        dense[rows, columns] = data
+        matrix = dense
+    values = numpy.asarray(matrix, dtype=numpy.float64)
+    if not 0 < window <= len(values):
+        raise ValueError("The window must be between 1 and the number of "
+                         "points in time")
+
+    present = ~numpy.isnan(values)
+    values = numpy.where(present, values, 0.0)
+    stats = {}
+    for name, series in (('count', present), ('sum', values),
+                         ('squares', values * values)):
+        total = numpy.cumsum(series, axis=0, dtype=numpy.float64)
+        total = numpy.concatenate([numpy.zeros((1,) + total.shape[1:]),
+                                   total])
+        stats[name] = total[window:] - total[:-window]
+
+    count = stats['count']
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        mean = stats['sum'] / count
+        variance = numpy.maximum(stats['squares'] / count - mean * mean, 0.0)
+    return {'mean': mean, 'std': numpy.sqrt(variance),
+            'count': count.astype(numpy.int_)}
+
+
+def sti_drift(matrix):
+    """
+    Check the conservation of STI: return the total STI at each point in
+    time, its 'change' from each point in time to the next, its 'drift'
+    from the first point in time, and the largest drift relative to the
+    first total, 'max_relative_drift'
+    """
+    _require_numpy()
+    if _is_sparse(matrix):
+        rows, _, data = _triplets(matrix)
+        total = numpy.bincount(rows, weights=data, minlength=matrix.shape[0])
+    else:
+        total = numpy.empty(matrix.shape[0])
+        for start, block in _blocks(matrix):
+            total[start:start + len(block)] = numpy.nansum(block, axis=1)
+
+    drift = total - total[0] if len(total) else total
+    relative = None
+    if len(total) and total[0]:
+        relative = float(numpy.abs(drift).max() / abs(total[0]))
+    return {'total': total, 'change': numpy.diff(total), 'drift': drift,
+            'max_relative_drift': relative}
+
+
+def diffusion_rate(matrix, boundary):
+    """
+    Return the fraction of the STI of the atoms in the attentional focus
+    that they lose from each point in time to the next, as an array with one
+    entry per point in time after the first
+
+    The atoms in the attentional focus are those whose STI is at least
+    'boundary', the value given to set_af_boundary(). An atom that is absent
+    at the next point in time loses all of its STI. The loss includes rent
+    as well as diffusion, so the rate of diffusion alone is measured by
+    stepping only the diffusion agent between captures.
+    """
+    _require_numpy()
+    steps = matrix.shape[0]
+    if _is_sparse(matrix):
+        rows, columns, data = _triplets(matrix)
+        width = matrix.shape[1]
+        keys = rows * width + columns
+        focus = (data >= boundary) & (rows < steps - 1)
+        following = keys[focus] + width
+        position = numpy.searchsorted(keys, following)
+        position[position >= len(keys)] = 0
+        after = numpy.where(keys[position] == following, data[position], 0.0)
+        before = data[focus]
+        loss = numpy.bincount(rows[focus], weights=numpy.maximum(
+            before - after, 0.0), minlength=steps)
+        total = numpy.bincount(rows[focus], weights=before, minlength=steps)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return (loss / total)[:-1]
+
+    loss = numpy.zeros(steps)
+    total = numpy.zeros(steps)
+    with numpy.errstate(invalid='ignore'):
+        for start, block in _pairs(matrix):
+            before = block[:-1]
+            focus = before >= boundary
+            # The STI lost is the STI before, less the part of it that is
+            # kept, which is none of it for an absent atom
+            lost = numpy.nan_to_num(block[1:])
+            numpy.minimum(lost, before, out=lost)
+            numpy.subtract(before, lost, out=lost)
+            loss[start:start + len(lost)] = \
+                numpy.where(focus, lost, 0.0).sum(axis=1)
+            total[start:start + len(lost)] = \
+                numpy.where(focus, before, 0.0).sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (loss / total)[1:]
+
+
+def _is_sparse(matrix):
+    return hasattr(matrix, 'tocoo')
+
+
+def _triplets(matrix):
+    # The rows, columns and values of the atoms present in a sparse matrix,
+    # in row-major order
+    coo = matrix.tocoo()
+    coo.sum_duplicates()
+    return (coo.row.astype(numpy.int_), coo.col.astype(numpy.int_),
+            coo.data.astype(numpy.float64))
+
+
+def _ranks(matrix):
+    # The rows, columns and ranks of the atoms present in a sparse matrix,
+    # in order of row and of rank
+    rows, columns, data = _triplets(matrix)
+    order = numpy.lexsort((-data, rows))
+    rows, columns = rows[order], columns[order]
+    starts = numpy.searchsorted(rows, numpy.arange(matrix.shape[0]))
+    ranks = numpy.arange(len(rows)) - starts[rows]
+    return rows, columns, ranks
+
+
+def _blocks(matrix):
+    # Consecutive blocks of rows of a dense matrix, with the index of their
+    # first row
+    size = max(1, ANALYTICS_CHUNK_CELLS // max(1, matrix.shape[1]))
+    for start in range(0, matrix.shape[0], size):
+        yield start, matrix[start:start + size]
+
+
+def _pairs(matrix):
+    # Blocks of consecutive rows of a dense matrix, starting from the row
+    # before each block of _blocks(), with the index of the row after it
+    size = max(1, ANALYTICS_CHUNK_CELLS // max(1, matrix.shape[1]))
+    for start in range(1, matrix.shape[0], size):
+        yield start, matrix[start - 1:start + size]
+
+
+def _row_means(rows, values, steps):
+    # Mean of the values of each row after the first, NaN for empty rows
+    sums = numpy.bincount(rows, weights=values, minlength=steps)
+    counts = numpy.bincount(rows, minlength=steps)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts)[1:]
+
+
+def _concatenate(arrays):
+    return numpy.concatenate(arrays) if arrays else \
+        numpy.zeros(0, dtype=numpy.int_)
@@ -0,0 +1,351 @@
+"""
+Benchmarks of the client hot paths against a FakeCogServer
+
+For each atomspace size, measures the latency of:
+
+- create_point: building a PointInTime from an already decoded atom list
+- atomspace: requesting and decoding the whole atomspace
+- export_timeseries_csv: exporting a timeseries of 'steps' points
+- capture_loop: one step of the loop in example.py, capturing the
+  attentional focus and the atomspace and stepping two agents
+
+and reports the throughput, the p50 and p99 latency of each call, and the
+peak resident set size. The FakeCogServer runs in a separate process, and
+each benchmark in a fresh interpreter of its own, so that the peak resident
+set size is that of the client alone. It also reports the memory taken by
+the atoms of a PointInTime created from a snapshot of each size, compared
+with storing each atom as a dictionary. It also measures how long
+'import opencog' takes in a fresh interpreter, against IMPORT_TIME_BUDGET in
+configuration.py. The results are printed and written as JSON, so that they
+can be compared between commits.
+
+Example usage:
+
+python benchmark.py --sizes 1000 10000 --output results.json
+
+The default sizes go up to 1,000,000 atoms, which needs several GB of
+memory for the synthetic atomspace.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import itertools
+import argparse
+import platform
+import tempfile
+import socket
+from subprocess import check_output, Popen
+import opencog
+from configuration import IMPORT_TIME_BUDGET, OPENCOG_STARTUP_TIMEOUT
+from fakeserver import API_PREFIX
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Benchmarks that are run against the server, in their own interpreter
+BENCHMARKS = ['create_point', 'atomspace', 'export_timeseries_csv',
+              'capture_loop']
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which 'fraction' of the values fall, using the
+    nearest-rank method
+    """
+    ordered = sorted(values)
+    rank = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, which
+    includes the server when it runs in the same process
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, Mac OS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(function, repeat, atoms):
+    """
+    Calls a function 'repeat' times and returns a dictionary of statistics
+
+    Parameters:
+    function (required) Function to call with no arguments
+    repeat (required) Number of calls
+    atoms (required) Number of atoms processed by each call, used to report
+      the throughput in atoms per second
+    """
+    latencies = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        latencies.append(time.time() - start)
+
+    total = sum(latencies)
+    return {
+        'calls': repeat,
+        'atoms_per_call': atoms,
+        'calls_per_second': repeat / total if total else None,
+        'atoms_per_second': repeat * atoms / total if total else None,
+        'p50_seconds': percentile(latencies, 0.50),
+        'p99_seconds': percentile(latencies, 0.99),
+        'peak_rss_bytes': peak_rss()
+    }
+
+
+def benchmark_create_point(client, repeat, size):
+    atoms = client.get_atoms()
+    return measure(lambda: opencog.create_point(0, atoms), repeat, size)
+
+
+def benchmark_export_csv(repeat, size, steps):
+    timeseries = [opencog.get_atomspace(timestep=t) for t in range(steps)]
+    descriptor, filename = tempfile.mkstemp(suffix='.csv')
+    os.close(descriptor)
+    try:
+        return measure(
+            lambda: opencog.export_timeseries_csv(timeseries, filename),
+            repeat, size * steps)
+    finally:
+        os.remove(filename)
+
+
+def benchmark_capture_loop(repeat, size):
+    timesteps = itertools.count()
+
+    def capture_step():
+        t = next(timesteps)
+        opencog.get_attentional_focus(timestep=t)
+        opencog.get_atomspace(timestep=t)
+        opencog.importance_diffusion()
+        opencog.importance_updating()
+
+    return measure(capture_step, repeat, size)
+
+
+def measure_point_memory(size):
+    """
+    Returns the number of bytes taken by the atoms of a PointInTime of 'size'
+    atoms, as created by create_point() and as dictionaries, counting the
+    records, their values and the list that holds them
+    """
+    atoms = [{'handle': handle, 'attentionvalue': {'sti': handle % 200}}
+             for handle in range(1, size + 1)]
+    records = opencog.create_point(0, atoms)['atoms']
+    dicts = [{'handle': atom['handle'], 'sti': atom['attentionvalue']['sti']}
+             for atom in atoms]
+
+    # Handles are shared between every point in time, so they are counted
+    # once for the compact records
+    handles = sum(sys.getsizeof(atom.handle) for atom in records)
+    compact = sys.getsizeof(records) + sum(sys.getsizeof(atom) +
+                                           sys.getsizeof(atom.sti)
+                                           for atom in records)
+    dictionary = sys.getsizeof(dicts) + sum(sys.getsizeof(atom) +
+                                            sys.getsizeof(atom['handle']) +
+                                            sys.getsizeof(atom['sti'])
+                                            for atom in dicts)
+    return {
+        'atoms': size,
+        'bytes_per_point': compact,
+        'bytes_per_point_dict': dictionary,
+        'bytes_shared_handles': handles,
+        'saving': 1 - float(compact) / dictionary
+    }
+
+
+def run_benchmark(name, uri, size, repeat, steps):
+    """
+    Runs one benchmark in this process against the REST API at 'uri', and
+    returns its statistics
+
+    Parameters:
+    name (required) One of BENCHMARKS, or 'point_memory'
+    uri (required) Base URI of the REST API
+    size (required) Number of atoms of the atomspace
+    repeat (required) Number of calls measured
+    steps (required) Number of points in the exported timeseries
+    """
+    if name == 'point_memory':
+        return measure_point_memory(size)
+
+    client = opencog.CogServerClient(uri)
+    opencog.set_default_client(client)
+    try:
+        if name == 'create_point':
+            return benchmark_create_point(client, repeat, size)
+        elif name == 'atomspace':
+            return measure(opencog.atomspace, repeat, size)
+        elif name == 'export_timeseries_csv':
+            return benchmark_export_csv(repeat, size, steps)
+        elif name == 'capture_loop':
+            return benchmark_capture_loop(repeat, size)
+        raise ValueError("Unknown benchmark {0!r}".format(name))
+    finally:
+        client.close()
+
+
+def run_in_child(name, uri, size, repeat, steps):
+    """
+    Runs one benchmark in a fresh interpreter, so that its peak resident set
+    size is not inflated by the benchmarks that ran before it, and returns
+    its statistics
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    script = "import json, benchmark; print(json.dumps(" \
+             "benchmark.run_benchmark({0!r}, {1!r}, {2}, {3}, {4})))" \
+             .format(name, uri, size, repeat, steps)
+    output = check_output([sys.executable, '-c', script], cwd=folder)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def free_port():
+    """
+    Returns a TCP port that is free on the local host
+    """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+def benchmark_size(size, repeat, steps):
+    """
+    Runs every benchmark against a FakeCogServer with 'size' atoms, which is
+    started in a separate process
+
+    Returns a dictionary that maps the name of each benchmark to its
+    statistics.
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    port = free_port()
+    uri = 'http://127.0.0.1:{0}{1}'.format(port, API_PREFIX)
+    with open(os.devnull, 'w') as devnull:
+        server = Popen([sys.executable, 'fakeserver.py', '--atoms', str(size),
+                        '--port', str(port), '--seed', str(size)],
+                       cwd=folder, stdout=devnull, stderr=devnull)
+    try:
+        # Generating the synthetic atomspace takes about 20 seconds per
+        # million atoms
+        opencog.wait_until(
+            lambda: server.poll() is not None or opencog.restapi_ready(uri),
+            "the fake REST API",
+            timeout=OPENCOG_STARTUP_TIMEOUT + size / 10000.0)
+        if server.poll() is not None:
+            raise RuntimeError("The fake REST API exited with status "
+                               "{0}".format(server.returncode))
+
+        results = {}
+        for name in BENCHMARKS:
+            results[name] = run_in_child(name, uri, size, repeat, steps)
+    finally:
+        if server.poll() is None:
+            server.terminate()
+        server.wait()
+
+    results['point_memory'] = run_in_child('point_memory', uri, size, repeat,
+                                           steps)
+    return results
+
+
+def measure_import_time(repeat=5):
+    """
+    Returns the median number of seconds that 'import opencog' takes in a
+    fresh interpreter
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    script = "import time; start = time.time(); import opencog; " \
+             "print(time.time() - start)"
+    timings = [float(check_output([sys.executable, '-c', script], cwd=folder))
+               for _ in range(repeat)]
+    return percentile(timings, 0.5)
+
+
+def git_commit():
+    """
+    Returns the commit hash of the working copy, or None
+    """
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        with open(os.devnull, 'w') as devnull:
+            return check_output(['git', 'rev-parse', 'HEAD'], cwd=folder,
+                                stderr=devnull).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, repeat=10, steps=5):
+    """
+    Runs the benchmarks for each atomspace size and returns the results
+    """
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'steps': steps,
+        'import_seconds': measure_import_time(),
+        'import_time_budget': IMPORT_TIME_BUDGET,
+        'sizes': {}
+    }
+    print("import opencog: {0:.3f}s (budget {1:.3f}s)"
+          .format(results['import_seconds'], IMPORT_TIME_BUDGET))
+    for size in sizes:
+        results['sizes'][str(size)] = benchmark_size(size, repeat, steps)
+        print_size(size, results['sizes'][str(size)])
+    return results
+
+
+def print_size(size, results):
+    print("{0} atoms".format(size))
+    memory = results['point_memory']
+    print("  {0:<24} {1:>10.1f} MB per point, {2:.1f} MB as dictionaries "
+          "({3:.0%} less)".format('point_memory',
+                                   memory['bytes_per_point'] / 1048576.0,
+                                   memory['bytes_per_point_dict'] / 1048576.0,
+                                   memory['saving']))
+    for name in sorted(results):
+        if name == 'point_memory':
+            continue
+        stats = results[name]
+        print("  {0:<24} {1:>10.1f} calls/s {2:>12.0f} atoms/s "
+              "p50 {3:>9.4f}s p99 {4:>9.4f}s peak RSS {5:>7.1f} MB"
+              .format(name,
+                      stats['calls_per_second'] or 0,
+                      stats['atoms_per_second'] or 0,
+                      stats['p50_seconds'],
+                      stats['p99_seconds'],
+                      stats['peak_rss_bytes'] / 1048576.0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the client hot paths against a FakeCogServer")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Atomspace sizes to benchmark")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="Number of calls measured for each benchmark")
+    parser.add_argument('--steps', type=int, default=5,
+                        help="Number of points in the exported timeseries")
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help="File that the JSON results are written to")
+    parser.add_argument('--check-import-time', action='store_true',
+                        help="Exit with an error if importing the client "
+                             "takes longer than IMPORT_TIME_BUDGET")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.steps)
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+    print("Results written to {0}".format(args.output))
+
+    if args.check_import_time and \
+            results['import_seconds'] > IMPORT_TIME_BUDGET:
+        sys.exit("import opencog took {0:.3f}s, over the budget of {1:.3f}s"
+                 .format(results['import_seconds'], IMPORT_TIME_BUDGET))
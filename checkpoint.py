@@ -0,0 +1,302 @@
+"""
+Periodic checkpoints of an experiment, so that a long run that fails can be
+resumed instead of started over
+
+Each checkpoint stores the Scheme dump of the atomspace, the agent parameters
+and the next timestep to run. The timeseries captured so far is kept in an
+append-only file next to the checkpoints, 'timeseries.pickle', to which each
+checkpoint only adds the points captured since the previous one, and records
+how far the file goes. The atomspace dump is the expensive part, so the
+interval between checkpoints sets the overhead: the time spent checkpointing
+is recorded in 'seconds'.
+
+Example:
+    checkpointer = Checkpointer('checkpoints/smokes', interval=500)
+    experiment = Experiment([importance_diffusion, importance_updating],
+                            checkpointer=checkpointer,
+                            parameters={'rent': 8, 'wages': 3})
+    # Starts from the latest checkpoint, if there is one
+    timeseries = experiment.resume(num_steps=10000, server=Server())
+
+See README.md for documentation and instructions.
+"""
+
+import os
+import re
+import time
+import struct
+import tempfile
+import opencog
+from cStringIO import StringIO
+from sweep import apply_parameters
+from schemestore import SchemeSnapshotStore
+from timeseries import Timeseries, DeltaTimeseries
+from configuration import CHECKPOINT_INTERVAL, CHECKPOINT_KEEP
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Checkpoint files are named after the next timestep to run, so that they
+# sort in the order they were written
+_CHECKPOINT_FILENAME = re.compile(r'^checkpoint-(\d+)\.pickle$')
+
+_TIMESERIES_FILENAME = 'timeseries.pickle'
+
+# Each record of the timeseries file is a pickle preceded by its length
+_LENGTH = struct.Struct('<Q')
+
+
+class Checkpointer(object):
+    """
+    Writes and reads the checkpoints of an experiment in a folder
+
+    Parameters:
+    directory (required) The folder in which the checkpoints are stored
+    interval (optional) Number of timesteps between checkpoints
+    keep (optional) Number of the most recent checkpoints that are kept
+    dump (optional) Function that returns the Scheme representation of the
+      atomspace. Defaults to dump_atomspace_scheme.
+    """
+    def __init__(self, directory, interval=CHECKPOINT_INTERVAL,
+                 keep=CHECKPOINT_KEEP, dump=None):
+        if interval < 1 or keep < 1:
+            raise ValueError("The checkpoint interval and the number of "
+                             "checkpoints kept must be at least 1")
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.dump = dump or opencog.dump_atomspace_scheme
+        self.checkpoints = 0
+        self.seconds = 0.0
+        # Number of points of each timeseries in the timeseries file, and its
+        # size, or None until the file is started or resumed
+        self._saved = None
+        self._size = None
+        # SchemeSnapshotStores referenced by the points, which are stored in
+        # the checkpoints rather than with every record
+        self._stores = []
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def due(self, timestep):
+        """
+        Return True if a checkpoint should be saved before running 'timestep'
+        """
+        return timestep > 0 and timestep % self.interval == 0
+
+    def save(self, timestep, timeseries, parameters=None):
+        """
+        Save a checkpoint
+
+        Parameters:
+        timestep (required) The next timestep to run
+        timeseries (required) The timeseries captured so far. Only the
+          points added since the previous checkpoint are written.
+        parameters (optional) Dictionary of the agent parameters, which are
+          applied again by resume()
+
+        Returns the path of the checkpoint.
+        """
+        start = time.time()
+        self._append(timeseries)
+        checkpoint = {
+            'timestep': timestep,
+            'parameters': parameters,
+            'names': list(timeseries),
+            'containers': dict((name, _empty_like(points))
+                               for name, points in timeseries.items()),
+            'timeseries_size': self._size,
+            'stores': self._stores,
+            'atomspace': self.dump(),
+            'time': start
+        }
+
+        # Written to a temporary file first, so that a run that fails while
+        # saving does not leave a partial checkpoint behind
+        path = self.path(timestep)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as outfile:
+            pickle.dump(checkpoint, outfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, path)
+
+        for old in self.list()[:-self.keep]:
+            os.remove(self.path(old))
+
+        self.checkpoints += 1
+        self.seconds += time.time() - start
+        return path
+
+    def path(self, timestep):
+        """
+        Return the path of the checkpoint saved before 'timestep'
+        """
+        return os.path.join(self.directory,
+                            'checkpoint-{0:08d}.pickle'.format(timestep))
+
+    def list(self):
+        """
+        Return the timesteps of the checkpoints in the folder, in increasing
+        order
+        """
+        timesteps = []
+        for filename in os.listdir(self.directory):
+            match = _CHECKPOINT_FILENAME.match(filename)
+            if match:
+                timesteps.append(int(match.group(1)))
+        return sorted(timesteps)
+
+    def latest(self):
+        """
+        Return the timestep of the most recent checkpoint, or None
+        """
+        timesteps = self.list()
+        return timesteps[-1] if timesteps else None
+
+    def load(self, timestep=None):
+        """
+        Return the checkpoint saved before 'timestep' as a dictionary with
+        the keys 'timestep', 'parameters', 'timeseries', 'atomspace' and
+        'time'. Each timeseries is a container of the type that was saved: a
+        list, a Timeseries or a DeltaTimeseries.
+
+        Parameters:
+        timestep (optional) Defaults to the most recent checkpoint
+        """
+        if timestep is None:
+            timestep = self.latest()
+            if timestep is None:
+                raise IOError("No checkpoint in {0}".format(self.directory))
+        with open(self.path(timestep), 'rb') as infile:
+            checkpoint = pickle.load(infile)
+        checkpoint['timeseries'] = self._read(checkpoint)
+        return checkpoint
+
+    def _append(self, timeseries):
+        # Writes the points added since the previous checkpoint at the end of
+        # the part of the timeseries file that the checkpoints reference, so
+        # that a record left by a save that failed is overwritten
+        filename = os.path.join(self.directory, _TIMESERIES_FILENAME)
+        if self._size is None or not os.path.exists(filename):
+            self._saved = {}
+            self._size = 0
+        saved = self._saved
+        record = dict((name, _points_since(points, saved.get(name, 0)))
+                      for name, points in timeseries.items())
+
+        buffer = StringIO()
+        pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+        if pickle.__name__ == 'cPickle':
+            # Only called for objects that are not of a built-in type, which
+            # is much faster than persistent_id
+            pickler.inst_persistent_id = self._store_id
+        else:
+            pickler.persistent_id = self._store_id
+        pickler.dump(record)
+        data = buffer.getvalue()
+
+        with open(filename, 'r+b' if self._size else 'wb') as outfile:
+            outfile.seek(self._size)
+            outfile.truncate()
+            outfile.write(_LENGTH.pack(len(data)))
+            outfile.write(data)
+        self._size += _LENGTH.size + len(data)
+        self._saved = dict((name, len(points))
+                           for name, points in timeseries.items())
+
+    def _store_id(self, obj):
+        if not isinstance(obj, SchemeSnapshotStore):
+            return None
+        for index, store in enumerate(self._stores):
+            if store is obj:
+                return index
+        self._stores.append(obj)
+        return len(self._stores) - 1
+
+    def _read(self, checkpoint):
+        # Rebuilds the timeseries of a checkpoint from the records of the
+        # timeseries file that it references, in containers of the type
+        # that was saved
+        containers = checkpoint.get('containers') or {}
+        timeseries = dict((name, containers.get(name, []))
+                          for name in checkpoint['names'])
+        filename = os.path.join(self.directory, _TIMESERIES_FILENAME)
+        end = checkpoint['timeseries_size']
+        with open(filename, 'rb') as infile:
+            position = 0
+            while position < end:
+                length, = _LENGTH.unpack(infile.read(_LENGTH.size))
+                unpickler = pickle.Unpickler(StringIO(infile.read(length)))
+                unpickler.persistent_load = checkpoint['stores'].__getitem__
+                for name, points in unpickler.load().items():
+                    for point in points:
+                        timeseries[name].append(point)
+                position += _LENGTH.size + length
+        return timeseries
+
+    def resume(self, experiment=None, server=None, timestep=None):
+        """
+        Reload a checkpoint into the CogServer, and into an experiment so that
+        it continues from there
+
+        The atomspace is cleared and replaced by the atomspace of the
+        checkpoint, and the agent parameters are applied again. The next
+        checkpoint continues the timeseries file from this one.
+
+        Parameters:
+        experiment (optional) Experiment whose timestep and timeseries are
+          set to those of the checkpoint
+        server (optional) Server that is started before the atomspace is
+          loaded, for when the previous one has failed. The module-level
+          functions are routed to it with set_default_client().
+        timestep (optional) Defaults to the most recent checkpoint
+
+        Returns the checkpoint dictionary.
+        """
+        checkpoint = self.load(timestep)
+        if server is not None:
+            server.start()
+            opencog.set_default_client(opencog.CogServerClient(server.uri))
+
+        opencog.clear_atomspace()
+        opencog.scheme(checkpoint['atomspace'])
+        if checkpoint['parameters']:
+            apply_parameters(checkpoint['parameters'])
+
+        # Later checkpoints reference the part of the timeseries file that
+        # the next checkpoint overwrites
+        for later in self.list():
+            if later > checkpoint['timestep']:
+                os.remove(self.path(later))
+        self._saved = dict((name, len(points)) for name, points
+                           in checkpoint['timeseries'].items())
+        self._size = checkpoint['timeseries_size']
+        self._stores = checkpoint['stores']
+
+        if experiment is not None:
+            experiment.timestep = checkpoint['timestep']
+            experiment.timeseries = checkpoint['timeseries']
+        return checkpoint
+
+
+def _points_since(points, start):
+    # Returns the points of a timeseries from position 'start' on. The
+    # containers of timeseries.py are not sliced: a DeltaTimeseries is
+    # replayed, and a Timeseries rebuilds each point.
+    if isinstance(points, DeltaTimeseries):
+        return list(points.replay(start))
+    if isinstance(points, Timeseries):
+        return [points.point(position)
+                for position in range(start, len(points))]
+    return list(points[start:])
+
+
+def _empty_like(points):
+    # Returns an empty container of the type of a timeseries, which the
+    # points of a checkpoint are appended to when it is loaded
+    if isinstance(points, DeltaTimeseries):
+        return DeltaTimeseries(points.keyframe_interval)
+    if isinstance(points, Timeseries):
+        return Timeseries()
+    return []
@@ -26,43 +26,71 @@ VAGRANT_ID_RELEX = "XXXX"
 MONGODB_CONNECTION_STRING = "mongodb://localhost:27017"
 MONGODB_DATABASE = 'attention-timeseries'
 
+# Number of points in time sent to MongoDB in each bulk write
+MONGODB_BATCH_SIZE = 100
+
+# Maximum number of atom documents queued before they are sent to MongoDB,
+# whatever the number of points they belong to
+MONGODB_BATCH_ATOMS = 100000
+
+# Number of rows buffered in memory before they are written to a CSV file
+CSV_BUFFER_ROWS = 10000
+
 ### Vagrant setup
 
-try:
-    import vagrant
-    from fabric.api import task, run, settings, hide
-
-    # Allows bash commands to be sent to a specific Vagrant VM
-    @task
-    def run_vagrant_command(machine_name, command):
-        v = vagrant.Vagrant()
-        with settings(host_string=v.user_hostname_port(vm_name=machine_name),
-                      key_filename=v.keyfile(vm_name=machine_name),
-                      disable_known_hosts=True,
-                      warn_only=True):
-            with hide('output', 'running', 'warnings'):
-                return run(command)
-except ImportError:
-    print "Optional Vagrant functionality not enabled; to enable, install " \
-          "python-vagrant, fabric"
+# python-vagrant and fabric are only imported the first time a command is sent
+# to a Vagrant VM, so that importing the client does not depend on them
+
+
+def run_vagrant_command(machine_name, command):
+    """
+    Allows bash commands to be sent to a specific Vagrant VM
+    """
+    try:
+        import vagrant
+        from fabric.api import run, settings, hide
+    except ImportError:
+        raise ImportError("Optional Vagrant functionality not enabled; to "
+                          "enable, install python-vagrant, fabric")
+
+    v = vagrant.Vagrant()
+    with settings(host_string=v.user_hostname_port(vm_name=machine_name),
+                  key_filename=v.keyfile(vm_name=machine_name),
+                  disable_known_hosts=True,
+                  warn_only=True):
+        with hide('output', 'running', 'warnings'):
+            return run(command)
 
 ### MongoDB setup
 
-try:
-    import pymongo
-    # Create a MongoDB connection
-    client = pymongo.MongoClient(MONGODB_CONNECTION_STRING)
-    mongo = client[MONGODB_DATABASE]
-except ImportError:
-    print "Optional MongoDB functionality not enabled; to enable, install " \
-          "MongoDB and PyMongo"
+# The MongoDB connection is only opened the first time it is used, so that
+# importing the client does not depend on PyMongo or on a reachable server.
+# Use get_mongo() rather than 'mongo' and 'client', which are None until then.
+client = None
+mongo = None
+
+
+def get_mongo():
+    """
+    Returns the MongoDB database, connecting to MongoDB on first use
+    """
+    global client, mongo
+    if mongo is None:
+        try:
+            import pymongo
+        except ImportError:
+            raise ImportError("Optional MongoDB functionality not enabled; "
+                              "to enable, install MongoDB and PyMongo")
+        client = pymongo.MongoClient(MONGODB_CONNECTION_STRING)
+        mongo = client[MONGODB_DATABASE]
+    return mongo
 
 
 def clear_mongodb():
-    if client is not None:
-        client.drop_database(MONGODB_DATABASE)
-        global mongo
-        mongo = client[MONGODB_DATABASE]
+    global mongo
+    get_mongo()
+    client.drop_database(MONGODB_DATABASE)
+    mongo = client[MONGODB_DATABASE]
 
 ### OpenCog REST API client setup
 
@@ -71,17 +99,93 @@ PORT = '5000'
 uri = 'http://' + IP_ADDRESS + ':' + PORT + '/api/v1.1/'
 headers = {'content-type': 'application/json'}
 
+# Configure the pool of keep-alive HTTP connections used for the REST API.
+# Timeouts are in seconds; failed connections are retried with an exponential
+# backoff of REST_BACKOFF_FACTOR * (2 ^ retry number) seconds
+REST_POOL_SIZE = 10
+REST_CONNECT_TIMEOUT = 5
+REST_READ_TIMEOUT = 120
+REST_MAX_RETRIES = 3
+REST_BACKOFF_FACTOR = 0.2
+
+# If True, responses listing atoms are parsed one atom at a time as they
+# arrive, instead of being read and decoded as a whole (requires ijson)
+REST_STREAM_JSON = False
+
+# Number of atoms requested at a time when iterating over the atomspace with
+# iter_atoms()
+REST_PAGE_SIZE = 10000
+
+# Maximum time in seconds that 'import opencog' should take, checked by
+# benchmark.py
+IMPORT_TIME_BUDGET = 0.25
+
+# If True, the client records call counts, latencies, bytes transferred and
+# JSON decoding time from startup (see metrics.py)
+CLIENT_METRICS = False
+
+# Number of worker threads (and pooled connections) used by each
+# AsyncCogServerClient to send requests concurrently
+ASYNC_WORKERS = 4
+
+# Number of processes an Experiment uses to decode the snapshots it captures
+EXPERIMENT_WORKERS = 2
+
+# Number of timesteps an Experiment can run ahead of the processing of the
+# points it captured, before it waits for them to be processed
+EXPERIMENT_MAX_PENDING = 4
+
+# Number of values of a dense STI matrix that analytics.py processes at a
+# time, which bounds the size of the temporary arrays of each analysis and
+# keeps them in the processor cache
+ANALYTICS_CHUNK_CELLS = 1 << 18
+
 # Configure the path of the OpenCog source folder relative to the user's
 # home directory, including parameters to allow automatic bootstrapping of the
 # CogServer
 
 OPENCOG_INIT_DELAY = 3
-OPENCOG_RESTAPI_START = 'echo "restapi.Start" | nc localhost 17001&'
+COGSERVER_PORT = 17001
+OPENCOG_RESTAPI_START = 'echo "restapi.Start" | nc localhost ' + \
+                        str(COGSERVER_PORT) + '&'
+
+# Number of timesteps between the checkpoints of an Experiment, and number of
+# checkpoints kept (see checkpoint.py)
+CHECKPOINT_INTERVAL = 100
+CHECKPOINT_KEEP = 2
+
+# Command templates used by Server, so that several CogServers can run side
+# by side, each with its own ports and work folder (see sweep.py). The
+# CogServer shell port and log file are set with its -D configuration
+# options. The server on the default ports starts its REST API with
+# OPENCOG_RESTAPI_START; running more than one REST API requires a REST API
+# module that accepts the port to listen on as an argument of restapi.Start.
+OPENCOG_COGSERVER_ARGS = '-DSERVER_PORT={cogserver_port}'
+OPENCOG_COGSERVER_LOG_ARGS = '-DLOG_FILE={workdir}/cogserver.log'
+OPENCOG_RESTAPI_START_TEMPLATE = 'echo "restapi.Start {rest_port}" | ' \
+                                 'nc localhost {cogserver_port} &'
+
+# Parameter sweeps start one CogServer per instance, on consecutive ports
+# from COGSERVER_PORT and PORT, with their work folders in SWEEP_FOLDER
+SWEEP_FOLDER = 'sweeps'
+
+# Starting and stopping the CogServer, REST API and RelEx server waits until
+# their ports respond (or stop responding), polling with an exponential
+# backoff from OPENCOG_POLL_DELAY up to OPENCOG_POLL_MAX_DELAY seconds, for at
+# most OPENCOG_STARTUP_TIMEOUT seconds. When using Vagrant, the CogServer and
+# RelEx ports must be forwarded to the host, like the REST API port.
+OPENCOG_STARTUP_TIMEOUT = 60
+OPENCOG_POLL_DELAY = 0.05
+OPENCOG_POLL_MAX_DELAY = 1
+RELEX_PORT = 4444
 
 VAGRANT_PREFIX = "vagrant ssh " + VAGRANT_ID + " -c "
 if not USE_VAGRANT:
     OPENCOG_COGSERVER_START = './opencog/server/cogserver'
     OPENCOG_COGSERVER_STOP = "pkill cogserver"
+    # Stops only the CogServer started with a given shell port
+    OPENCOG_COGSERVER_STOP_TEMPLATE = \
+        "pkill -f -- '-DSERVER_PORT={cogserver_port}( |$)'"
     OPENCOG_SOURCE_FOLDER = expanduser("~") + "/opencog/opencog/"
     OPENCOG_SUBFOLDER = expanduser("~") + '/opencog/build'
 else:
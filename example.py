@@ -47,33 +47,39 @@ load_scheme_files(["python/pln/examples/tuffy/smokes/smokes.scm",
 # The PLN agent will constantly give stimulus to the query
 scheme("(define query hasCancer)")
 
-# Set the configuration parameters for diffusion
-set_stimulus_amount("20")
-set_diffusion_percent("0.50")
-set_wages("3")
-set_rent("8")
-
-af_timeseries = []
-atomspace_timeseries = []
-
-for t in range(0, num_steps):
-    af_point_in_time = get_attentional_focus(timestep=t, scheme=True)
-    atomspace_point_in_time = get_atomspace(timestep=t, scheme=True)
-    af_timeseries.append(af_point_in_time)
-    atomspace_timeseries.append(atomspace_point_in_time)
-
-    importance_diffusion()
-    importance_updating()
-    step_python_agent(agent_path, agent_name)
-
-    print("Timestep {0}, {1} atoms captured in attentional focus. "
-          "{2} atoms captured in atomspace."
-          .format(t, len(af_point_in_time['atoms']),
-                  len(atomspace_point_in_time['atoms'])))
+# Set the configuration parameters for diffusion, in a single request
+with batched():
+    set_stimulus_amount("20")
+    set_diffusion_percent("0.50")
+    set_wages("3")
+    set_rent("8")
 
+
+def count_people_with_cancer():
     print "People with cancer: {0}".format(
         scheme("(count-people-with-cancer)"))
 
+
+# At each timestep, the attentional focus and the atomspace are captured and
+# then the agents are stepped in this order. The points of each timestep are
+# processed in the background while the agents of the next one run.
+experiment = Experiment(
+    schedule=[importance_diffusion,
+              importance_updating,
+              (agent_path, agent_name),
+              count_people_with_cancer],
+    capture=['attentional_focus', 'atomspace'],
+    scheme=True,
+    # Most atoms do not change from one timestep to the next, so only the
+    # changes in the atomspace are stored
+    timeseries={'attentional_focus': [],
+                'atomspace': DeltaTimeseries()},
+    progress=print_progress)
+
+timeseries = experiment.run(num_steps)
+af_timeseries = timeseries['attentional_focus']
+atomspace_timeseries = timeseries['atomspace']
+
 #export_timeseries_mongodb(af_timeseries)
 export_timeseries_mongodb(atomspace_timeseries)
 export_timeseries_csv(atomspace_timeseries, "output.csv", scheme=False)
@@ -0,0 +1,486 @@
+"""
+Exporters that write a timeseries to disk or to MongoDB while an experiment
+is running
+
+See README.md for documentation and instructions.
+"""
+
+import os
+import csv
+import gzip
+import uuid
+import itertools
+import configuration
+from configuration import CSV_BUFFER_ROWS, MONGODB_BATCH_SIZE, \
+    MONGODB_BATCH_ATOMS
+from timeseries import Timeseries
+from schemestore import SchemeSnapshot
+
+# Size in bytes of the buffer used for files that are written to
+FILE_BUFFER_SIZE = 1 << 20
+
+
+def open_compressed(filename, compression=None):
+    """
+    Open a file for writing in binary mode, optionally compressed
+
+    Parameters:
+    filename (required) The name of the file that will be written to
+    compression (optional) None, 'gzip' or 'zstd'. zstd requires the
+      zstandard package.
+    """
+    if compression is None:
+        return open(filename, 'wb', FILE_BUFFER_SIZE)
+    elif compression == 'gzip':
+        return gzip.open(filename, 'wb', 6)
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression is not enabled; to enable, "
+                              "install zstandard")
+        raw = open(filename, 'wb', FILE_BUFFER_SIZE)
+        return zstandard.ZstdCompressor().stream_writer(raw)
+    else:
+        raise ValueError("Unknown compression: {0}".format(compression))
+
+
+def read_compressed_lines(filename, compression=None):
+    """
+    Iterate over the lines of a file written by open_compressed()
+
+    Parameters:
+    filename (required) The name of the file
+    compression (optional) None, 'gzip' or 'zstd', as it was written with
+    """
+    if compression is None:
+        infile = open(filename, 'rb', FILE_BUFFER_SIZE)
+    elif compression == 'gzip':
+        infile = gzip.open(filename, 'rb')
+    elif compression == 'zstd':
+        import zstandard
+        with open(filename, 'rb', FILE_BUFFER_SIZE) as raw:
+            pending = b''
+            for chunk in zstandard.ZstdDecompressor().read_to_iter(raw):
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield line + b'\n'
+            if pending:
+                yield pending
+        return
+    else:
+        raise ValueError("Unknown compression: {0}".format(compression))
+    with infile:
+        for line in infile:
+            yield line
+
+
+def scheme_filename_for(filename):
+    """
+    Return the name of the side file that holds the Scheme representations
+    for a normalized CSV file, for example 'output-scheme.csv.gz' for
+    'output.csv.gz'
+    """
+    if '.csv' in filename:
+        return filename.replace('.csv', '-scheme.csv', 1)
+    else:
+        return filename + '-scheme'
+
+
+class CSVTimeseriesWriter(object):
+    """
+    Writes points in time to a CSV file as they are captured
+
+    Rows are buffered and written in bulk. The format of the rows is the same
+    as export_timeseries_csv():
+      time, handle, sti
+
+    If scheme is True, the Scheme representation of each point in time is
+    also written. By default it is appended to each row:
+      time, handle, sti, scheme
+
+    If normalize_scheme is True, it is instead written once per point in time
+    to a side file (see scheme_filename_for()), with the format:
+      time, scheme
+
+    Parameters:
+    filename (required) The name of the file that will be written to.
+    scheme (optional) If True, the Scheme representation of each point in
+      time is written. Defaults to False.
+    normalize_scheme (optional) If True, the Scheme representation is written
+      to a side file once per point in time. Defaults to False.
+    compression (optional) None, 'gzip' or 'zstd'. Applies to the side file
+      as well. Defaults to None.
+    buffer_rows (optional) Number of rows to buffer before writing them
+
+    Example:
+        with CSVTimeseriesWriter('output.csv.gz', compression='gzip') as out:
+            for t in range(0, num_steps):
+                out.write(get_attentional_focus(timestep=t))
+                importance_diffusion()
+    """
+    def __init__(self, filename, scheme=False, normalize_scheme=False,
+                 compression=None, buffer_rows=CSV_BUFFER_ROWS):
+        self.filename = filename
+        self.scheme = scheme
+        self.normalize_scheme = normalize_scheme
+        self.compression = compression
+        self.buffer_rows = buffer_rows
+        self.rows = []
+
+        self.file = open_compressed(filename, compression)
+        self.writer = csv.writer(self.file, delimiter=',')
+
+        if scheme and normalize_scheme:
+            self.scheme_file = open_compressed(scheme_filename_for(filename),
+                                               compression)
+            self.scheme_writer = csv.writer(self.scheme_file, delimiter=',')
+        else:
+            self.scheme_file = None
+
+    def write(self, point):
+        """
+        Write a point in time
+
+        Parameters:
+        point (required) A PointInTime dictionary
+        """
+        timestep = point['timestep']
+        rows = self.rows
+        if point['scheme'] is not None and self.scheme:
+            if self.normalize_scheme:
+                self.scheme_writer.writerow([timestep, point['scheme']])
+                for atom in point['atoms']:
+                    rows.append((timestep, atom['handle'], atom['sti']))
+            else:
+                for atom in point['atoms']:
+                    rows.append((timestep, atom['handle'], atom['sti'],
+                                 point['scheme']))
+        else:
+            for atom in point['atoms']:
+                rows.append((timestep, atom['handle'], atom['sti']))
+
+        if len(rows) >= self.buffer_rows:
+            self.flush()
+
+    def write_all(self, timeseries):
+        """
+        Write every point in time of a timeseries
+
+        Parameters:
+        timeseries (required) A list of PointInTime dictionaries, or one of the
+          timeseries containers
+        """
+        if isinstance(timeseries, Timeseries) and not self.scheme:
+            self.flush()
+            self.writer.writerows(timeseries.rows())
+        else:
+            for point in timeseries:
+                self.write(point)
+
+    def flush(self):
+        """
+        Write the buffered rows
+        """
+        self.writer.writerows(self.rows)
+        del self.rows[:]
+
+    def rewind(self, timestep):
+        """
+        Discard the rows of 'timestep' and of the timesteps after it, so
+        that an experiment resumed from a checkpoint does not write them
+        twice
+
+        The files are written again up to the first discarded row, as
+        compressed files cannot be truncated.
+
+        Parameters:
+        timestep (required) The first timestep to discard
+        """
+        self.rows = [row for row in self.rows if row[0] < timestep]
+        self.flush()
+        self.file = self._rewrite(self.file, self.filename, timestep)
+        self.writer = csv.writer(self.file, delimiter=',')
+        if self.scheme_file is not None:
+            self.scheme_file = self._rewrite(
+                self.scheme_file, scheme_filename_for(self.filename),
+                timestep)
+            self.scheme_writer = csv.writer(self.scheme_file, delimiter=',')
+
+    def _rewrite(self, outfile, filename, timestep):
+        # Copies the rows of the timesteps before 'timestep' to a new file,
+        # which is returned open for writing. The rows are in order of
+        # timestep, which is their first column.
+        outfile.close()
+        previous = filename + '.rewind'
+        os.rename(filename, previous)
+        outfile = open_compressed(filename, self.compression)
+        writer = csv.writer(outfile, delimiter=',')
+        for row in csv.reader(read_compressed_lines(previous,
+                                                    self.compression)):
+            if int(float(row[0])) >= timestep:
+                break
+            writer.writerow(row)
+        os.remove(previous)
+        return outfile
+
+    def close(self):
+        """
+        Write the buffered rows and close the files
+        """
+        self.flush()
+        self.file.close()
+        if self.scheme_file is not None:
+            self.scheme_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def new_experiment_id():
+    """
+    Return a new unique identifier for an experiment
+    """
+    return uuid.uuid4().hex
+
+
+class MongoTimeseriesExporter(object):
+    """
+    Appends points in time to MongoDB as they are captured
+
+    Each point in time is stored as a document in the 'points' collection,
+    and the STI of each of its atoms as a separate document in the
+    'point_atoms' collection, so that no document grows with the size of
+    the atomspace past the 16 MB limit of MongoDB. Every document is tagged
+    with an experiment identifier, so that the points of several
+    experiments can be kept in the same database. Documents are sent in
+    unordered bulk writes of 'batch_size' points, or sooner once
+    MONGODB_BATCH_ATOMS atom documents are queued. The atom documents are
+    indexed on (experiment, timestep, handle) and on
+    (experiment, handle, timestep),
+    so that reading the points of an experiment, or the STI of an atom over
+    time, does not scan the whole collection.
+
+    Document formats:
+      points: {'experiment': ..., 'timestep': ..., 'atom_count': ...,
+               'scheme': ...}
+      point_atoms: {'experiment': ..., 'timestep': ..., 'handle': ...,
+                    'sti': ...}
+
+    points() joins them back into PointInTime dictionaries.
+
+    If the Scheme representation of a point is a SchemeSnapshot (see
+    schemestore.py), 'scheme' is instead {'expressions': [...]}, the list of
+    the SHA-1 hashes of its expressions, and each distinct expression is sent
+    once to the 'scheme_expressions' collection as {'_id': hash, 'text': ...}.
+    scheme() rebuilds the text of a document.
+
+    Parameters:
+    experiment (optional) Identifier of the experiment. Defaults to a new
+      unique identifier, available as 'experiment'.
+    batch_size (optional) Number of points sent in each bulk write
+    database (optional) The database to write to, for example a database
+      from a mongomock client. Defaults to the database configured in
+      configuration.py.
+
+    Example:
+        with MongoTimeseriesExporter() as exporter:
+            for t in range(0, num_steps):
+                exporter.write(get_attentional_focus(timestep=t))
+                importance_diffusion()
+            print exporter.sti_history(handle)
+    """
+    def __init__(self, experiment=None, batch_size=MONGODB_BATCH_SIZE,
+                 database=None):
+        if database is None:
+            database = configuration.get_mongo()
+        self.experiment = experiment if experiment is not None \
+            else new_experiment_id()
+        self.batch_size = batch_size
+        self.collection = database['points']
+        self.atoms = database['point_atoms']
+        self.expressions = database['scheme_expressions']
+        self.documents = []
+        self.atom_documents = []
+        self.expression_documents = {}
+        self._sent = set()
+
+        self.collection.create_index([('experiment', 1), ('timestep', 1)])
+        self.atoms.create_index([('experiment', 1), ('timestep', 1),
+                                 ('handle', 1)])
+        self.atoms.create_index([('experiment', 1), ('handle', 1),
+                                 ('timestep', 1)])
+
+    def write(self, point):
+        """
+        Queue a point in time, and send the queued points if there are
+        'batch_size' of them, or MONGODB_BATCH_ATOMS of their atoms
+
+        Parameters:
+        point (required) A PointInTime dictionary
+        """
+        scheme = point['scheme']
+        if isinstance(scheme, SchemeSnapshot):
+            digests = scheme.digests()
+            for digest in digests:
+                if digest not in self._sent:
+                    self._sent.add(digest)
+                    self.expression_documents[digest] = \
+                        scheme.store.expression(digest)
+            scheme = {'expressions': digests}
+
+        experiment = self.experiment
+        timestep = point['timestep']
+        self.atom_documents.extend({'experiment': experiment,
+                                    'timestep': timestep,
+                                    'handle': atom['handle'],
+                                    'sti': atom['sti']}
+                                   for atom in point['atoms'])
+        self.documents.append({
+            'experiment': experiment,
+            'timestep': timestep,
+            'atom_count': len(point['atoms']),
+            'scheme': scheme
+        })
+        if len(self.documents) >= self.batch_size or \
+                len(self.atom_documents) >= MONGODB_BATCH_ATOMS:
+            self.flush()
+
+    def write_all(self, timeseries):
+        """
+        Queue every point in time of a timeseries
+        """
+        for point in timeseries:
+            self.write(point)
+
+    def flush(self):
+        """
+        Send the queued points in a single unordered bulk write
+        """
+        if not self.documents:
+            return
+
+        # Expressions are sent before the points that reference them, and
+        # only if no other experiment has sent them already
+        if self.expression_documents:
+            existing = self.expressions.find(
+                {'_id': {'$in': list(self.expression_documents)}}, {'_id': 1})
+            for document in existing:
+                del self.expression_documents[document['_id']]
+            if self.expression_documents:
+                _insert(self.expressions,
+                        [{'_id': digest, 'text': text} for digest, text
+                         in self.expression_documents.items()])
+            self.expression_documents = {}
+
+        # The points are sent after their atoms, so that a point that has
+        # been sent is complete
+        if self.atom_documents:
+            _insert(self.atoms, self.atom_documents)
+            self.atom_documents = []
+        _insert(self.collection, self.documents)
+        self.documents = []
+
+    def rewind(self, timestep):
+        """
+        Remove the points of 'timestep' and of the timesteps after it from
+        this experiment, so that an experiment resumed from a checkpoint
+        does not write them twice
+
+        Parameters:
+        timestep (required) The first timestep to remove
+        """
+        self.documents = [document for document in self.documents
+                          if document['timestep'] < timestep]
+        self.atom_documents = [document for document in self.atom_documents
+                               if document['timestep'] < timestep]
+        self.flush()
+
+        # The points are removed before their atoms, so that a point that is
+        # left is complete
+        query = {'experiment': self.experiment,
+                 'timestep': {'$gte': timestep}}
+        _delete(self.collection, query)
+        _delete(self.atoms, query)
+
+    def close(self):
+        """
+        Send the queued points
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def points(self):
+        """
+        Iterate over the points of this experiment that have been sent, in
+        order of timestep, as PointInTime dictionaries with the 'experiment'
+        they belong to. The atoms of each point are in order of handle.
+        """
+        points = self.collection.find({'experiment': self.experiment}) \
+            .sort('timestep', 1)
+        atoms = self.atoms.find({'experiment': self.experiment},
+                                {'timestep': 1, 'handle': 1, 'sti': 1}) \
+            .sort([('timestep', 1), ('handle', 1)])
+        groups = itertools.groupby(atoms, lambda atom: atom['timestep'])
+        group = next(groups, None)
+        for point in points:
+            while group is not None and group[0] < point['timestep']:
+                group = next(groups, None)
+            point['atoms'] = []
+            if group is not None and group[0] == point['timestep']:
+                point['atoms'] = [{'handle': atom['handle'],
+                                   'sti': atom['sti']} for atom in group[1]]
+                group = next(groups, None)
+            yield point
+
+    def sti_history(self, handle):
+        """
+        Return a list of (timestep, sti) tuples for an atom over the points of
+        this experiment that have been sent, in order of timestep
+
+        Parameters:
+        handle (required) The handle of the atom
+        """
+        cursor = self.atoms.find(
+            {'experiment': self.experiment, 'handle': handle},
+            {'timestep': 1, 'sti': 1}).sort('timestep', 1)
+        return [(document['timestep'], document['sti'])
+                for document in cursor]
+
+    def scheme(self, document):
+        """
+        Return the Scheme text of a point document returned by points()
+        """
+        scheme = document.get('scheme')
+        if not isinstance(scheme, dict):
+            return scheme
+        digests = scheme['expressions']
+        texts = dict((expression['_id'], expression['text'])
+                     for expression in self.expressions.find(
+                         {'_id': {'$in': list(set(digests))}}))
+        return ''.join(texts[digest] for digest in digests)
+
+
+def _insert(collection, documents):
+    # Unordered bulk insert, with the API of PyMongo 2 or 3
+    if hasattr(collection, 'insert_many'):
+        collection.insert_many(documents, ordered=False)
+    else:
+        collection.insert(documents, continue_on_error=True)
+
+
+def _delete(collection, query):
+    # Removes every matching document, with the API of PyMongo 2 or 3
+    if hasattr(collection, 'delete_many'):
+        collection.delete_many(query)
+    else:
+        collection.remove(query)
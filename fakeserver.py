@@ -0,0 +1,434 @@
+"""
+In-process stand-in for the OpenCog REST API
+
+Serves a synthetic atomspace over the same endpoints that opencog.py uses:
+
+  GET  atoms                          (including filterby=attentionalfocus,
+                                       filterby=stirange, type, dot=True,
+                                       limit and offset)
+  POST scheme
+  POST shell
+
+so that the client can be benchmarked and tested without a CogServer. The
+STI values of the atoms change each time an agent is stepped, and latency and
+errors can be injected into the responses.
+
+Example:
+    with FakeCogServer(num_atoms=10000) as server:
+        set_default_client(CogServerClient(server.uri))
+        point = get_atomspace(timestep=0)
+
+It can also be run on its own, in place of a CogServer:
+    python fakeserver.py --atoms 10000 --port 5000
+
+See README.md for documentation and instructions.
+"""
+
+import re
+import json
+import time
+import random
+import threading
+import argparse
+from restclient import SCHEME_BATCH_DELIMITER, SCHEME_BATCH_ERROR
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+API_PREFIX = '/api/v1.1/'
+
+# Matches each command in a batch sent by CogServerClient.scheme_batch()
+_BATCH_COMMAND = re.compile(r'\(display \(catch #t \(lambda \(\) (.*?)\) '
+                            r'\(lambda \(key \. args\)', re.DOTALL)
+
+# Matches a top-level form sent on its own by CogServerClient.scheme_batch()
+_TOP_LEVEL_COMMAND = re.compile(r'\(begin (.*)\n\(display "{0}"\)\)$'
+                                .format(re.escape(SCHEME_BATCH_DELIMITER)),
+                                re.DOTALL)
+
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+class _SchemeError(Exception):
+    # An error raised while evaluating a Scheme command
+    pass
+
+
+class FakeCogServer(object):
+    """
+    Serves a synthetic atomspace over the OpenCog REST API
+
+    Parameters:
+    num_atoms (optional) Number of atoms in the atomspace
+    link_fraction (optional) Fraction of the atoms that are InheritanceLinks
+      between two nodes; the rest are ConceptNodes
+    af_boundary (optional) Atoms with an STI of at least this value are in
+      the attentional focus
+    churn (optional) Fraction of the atoms whose STI changes each time an
+      agent is stepped
+    latency (optional) Seconds added to every response
+    error_rate (optional) Probability that a request fails with an HTTP 500
+      error
+    seed (optional) Seed for the random number generator
+    host (optional) Address to listen on
+    port (optional) Port to listen on. Defaults to 0, which picks a free port.
+    """
+    def __init__(self, num_atoms=1000, link_fraction=0.5, af_boundary=100,
+                 churn=0.1, latency=0, error_rate=0, seed=None,
+                 host='127.0.0.1', port=0):
+        self.link_fraction = link_fraction
+        self.af_boundary = af_boundary
+        self.churn = churn
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.steps = 0
+
+        self.generate(num_atoms)
+
+        self.httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def uri(self):
+        """
+        Base URI of the REST API, to be passed to a CogServerClient
+        """
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}{2}'.format(host, port, API_PREFIX)
+
+    def start(self):
+        """
+        Serve requests on a background thread, and return the base URI
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.uri
+
+    def stop(self):
+        """
+        Stop serving requests
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def generate(self, num_atoms):
+        """
+        Replace the atomspace with 'num_atoms' new synthetic atoms
+        """
+        with self.lock:
+            self.atoms = []
+            num_links = int(num_atoms * self.link_fraction)
+            num_nodes = num_atoms - num_links
+            for handle in range(1, num_nodes + 1):
+                self.atoms.append(self._atom(handle, 'ConceptNode',
+                                             'concept-{0}'.format(handle), []))
+            for handle in range(num_nodes + 1, num_atoms + 1):
+                outgoing = [self.random.randint(1, num_nodes),
+                            self.random.randint(1, num_nodes)]
+                self.atoms.append(self._atom(handle, 'InheritanceLink', '',
+                                             outgoing))
+                for target in outgoing:
+                    self.atoms[target - 1]['incoming'].append(handle)
+            self._invalidate()
+
+    def step(self):
+        """
+        Change the STI of a random 'churn' fraction of the atoms, as happens
+        when an attention allocation agent is stepped
+        """
+        with self.lock:
+            if self.atoms:
+                count = int(len(self.atoms) * self.churn)
+                for _ in range(count):
+                    atom = self.atoms[self.random.randrange(len(self.atoms))]
+                    av = atom['attentionvalue']
+                    av['sti'] = int(av['sti'] * 0.9) + \
+                        self.random.randint(-10, 30)
+            self.steps += 1
+            self._invalidate()
+
+    def clear(self):
+        """
+        Remove every atom
+        """
+        with self.lock:
+            self.atoms = []
+            self._invalidate()
+
+    def _atom(self, handle, atom_type, name, outgoing):
+        return {
+            'handle': handle,
+            'type': atom_type,
+            'name': name,
+            'attentionvalue': {
+                'sti': self.random.randint(0, 2 * self.af_boundary),
+                'lti': 0,
+                'vlti': False
+            },
+            'truthvalue': {
+                'type': 'simple',
+                'details': {'strength': self.random.random(),
+                            'count': self.random.randint(0, 100)}
+            },
+            'outgoing': outgoing,
+            'incoming': []
+        }
+
+    def _invalidate(self):
+        self._bodies = {}
+
+    def _attentional_focus(self):
+        return [atom for atom in self.atoms
+                if atom['attentionvalue']['sti'] >= self.af_boundary]
+
+    def get_atoms(self, query):
+        """
+        Return the body of the response to GET atoms with a query string
+        """
+        with self.lock:
+            body = self._bodies.get(query)
+            if body is not None:
+                return body
+
+            parameters = dict((key, values[0]) for key, values
+                              in parse_qs(query).items())
+            if parameters.get('filterby') == 'attentionalfocus':
+                atoms = self._attentional_focus()
+            elif parameters.get('filterby') == 'stirange':
+                atoms = self._sti_range(
+                    float(parameters.get('stimin', '-inf')),
+                    float(parameters.get('stimax', 'inf')), self.atoms)
+            else:
+                atoms = self.atoms
+            if 'type' in parameters:
+                atoms = [atom for atom in atoms
+                         if atom['type'] == parameters['type']]
+
+            if parameters.get('dot') == 'True':
+                body = json.dumps({'result': self._dot(atoms)})
+            else:
+                total = len(atoms)
+                offset = int(parameters.get('offset', 0))
+                limit = parameters.get('limit')
+                end = total if limit is None else offset + int(limit)
+                body = json.dumps({'result': {'atoms': atoms[offset:end],
+                                              'total': total}})
+
+            self._bodies[query] = body
+            return body
+
+    def scheme(self, command):
+        """
+        Return the response of the Scheme interpreter to a command
+
+        Commands with unbalanced parentheses and commands that call
+        (error "message") fail with an error message, as they would in Guile.
+        """
+        try:
+            return self._eval(command)
+        except _SchemeError as error:
+            return 'ERROR: {0}\n'.format(error)
+
+    def _eval(self, command):
+        command = command.strip()
+        bare = _STRING.sub('', command)
+        if bare.count('(') != bare.count(')'):
+            raise _SchemeError('In procedure scm_i_lreadparen: end of file')
+
+        commands = _BATCH_COMMAND.findall(command)
+        top_level = _TOP_LEVEL_COMMAND.match(command)
+        if commands:
+            # Runs each command of a batch sent by CogServerClient, with the
+            # error handler that wraps it
+            return '\n' + ''.join(self._catch(batched) +
+                                  SCHEME_BATCH_DELIMITER
+                                  for batched in commands)
+        elif top_level:
+            return self._eval(top_level.group(1)) + SCHEME_BATCH_DELIMITER
+        elif '(error ' in bare:
+            message = _STRING.search(command, command.index('(error '))
+            raise _SchemeError(message.group() if message else 'error')
+        elif command == '(clear)':
+            self.clear()
+        elif command == '(cog-af)':
+            with self.lock:
+                return self._scheme(self._attentional_focus())
+        elif command == '(cog-prt-atomspace)':
+            with self.lock:
+                return self._scheme(self.atoms)
+
+        if command.startswith('(map (lambda (a) (list (cog-handle a) '
+                              '(cog-av-sti a)))'):
+            return self._projection(command)
+
+        match = re.match(r'\(cog-set-af-boundary! (-?\d+)\)', command)
+        if match:
+            with self.lock:
+                self.af_boundary = int(match.group(1))
+                self._invalidate()
+        return ''
+
+    def _catch(self, command):
+        try:
+            return self._eval(command)
+        except _SchemeError as error:
+            return '{0} misc-error ({1})'.format(SCHEME_BATCH_ERROR, error)
+
+    def shell(self, command):
+        """
+        Run a command in the CogServer shell
+        """
+        if command.strip().startswith('agents-step'):
+            self.step()
+
+    def _projection(self, command):
+        # Evaluates the handle and STI listing built by
+        # CogServerClient.query_atoms
+        with self.lock:
+            if '(cog-af)' in command:
+                atoms = self._attentional_focus()
+            else:
+                atoms = self.atoms
+            match = re.search(r"'(\w+) #t\)|cog-subtype\? '(\w+)", command)
+            atom_type = match and (match.group(1) or match.group(2))
+            if atom_type and atom_type != 'Atom':
+                atoms = [atom for atom in atoms if atom['type'] == atom_type]
+            sti_min = re.search(r'\(>= s (-?[\d.]+)\)', command)
+            sti_max = re.search(r'\(<= s (-?[\d.]+)\)', command)
+            atoms = self._sti_range(
+                float(sti_min.group(1)) if sti_min else float('-inf'),
+                float(sti_max.group(1)) if sti_max else float('inf'), atoms)
+            return '({0})\n'.format(' '.join(
+                '({0} {1})'.format(atom['handle'],
+                                   atom['attentionvalue']['sti'])
+                for atom in atoms))
+
+    @staticmethod
+    def _sti_range(sti_min, sti_max, atoms):
+        return [atom for atom in atoms
+                if sti_min <= atom['attentionvalue']['sti'] <= sti_max]
+
+    @staticmethod
+    def _scheme(atoms):
+        lines = []
+        for atom in atoms:
+            av = '(av {0} 0 0)'.format(atom['attentionvalue']['sti'])
+            if atom['outgoing']:
+                lines.append('({0} {1}\n  (ConceptNode "concept-{2}")\n'
+                             '  (ConceptNode "concept-{3}")\n)\n'
+                             .format(atom['type'], av, *atom['outgoing']))
+            else:
+                lines.append('({0} "{1}" {2})\n'
+                             .format(atom['type'], atom['name'], av))
+        return ''.join(lines)
+
+    @staticmethod
+    def _dot(atoms):
+        lines = ['digraph OpenCog {']
+        for atom in atoms:
+            label = atom['name'] or atom['type']
+            lines.append('  {0} [label="{1}"];'.format(atom['handle'], label))
+            for target in atom['outgoing']:
+                lines.append('  {0} -> {1};'.format(atom['handle'], target))
+        lines.append('}')
+        return '\n'.join(lines)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive, as the CogServer REST API does, without
+    # delaying the small writes of each response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not self._begin(url.path):
+            return
+        if url.path == API_PREFIX + 'atoms':
+            self._respond(200, self.server.fake.get_atoms(url.query))
+        else:
+            self._respond(404, json.dumps({'error': 'Not found'}))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if not self._begin(url.path):
+            return
+        command = json.loads(body.decode('utf-8'))['command']
+        if url.path == API_PREFIX + 'scheme':
+            response = self.server.fake.scheme(command)
+            self._respond(200, json.dumps({'response': response}))
+        elif url.path == API_PREFIX + 'shell':
+            self.server.fake.shell(command)
+            self._respond(200, json.dumps({'status': 'success'}))
+        else:
+            self._respond(404, json.dumps({'error': 'Not found'}))
+
+    def _begin(self, path):
+        # Applies the injected latency and errors
+        fake = self.server.fake
+        fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.error_rate and fake.random.random() < fake.error_rate:
+            self._respond(500, json.dumps({'error': 'Injected error'}))
+            return False
+        return True
+
+    def _respond(self, status, body):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a synthetic atomspace over the OpenCog REST API")
+    parser.add_argument('--atoms', type=int, default=1000,
+                        help="Number of atoms in the atomspace")
+    parser.add_argument('--port', type=int, default=5000,
+                        help="Port to listen on")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help="Probability that a request fails")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for the random number generator")
+    args = parser.parse_args()
+
+    server = FakeCogServer(num_atoms=args.atoms, latency=args.latency,
+                           error_rate=args.error_rate, seed=args.seed,
+                           port=args.port)
+    print("Serving {0} atoms at {1}".format(args.atoms, server.uri))
+    server.httpd.serve_forever()
@@ -0,0 +1,156 @@
+"""
+On-disk cache of the DOT graph descriptions and PNG images rendered from
+Scheme snapshots
+
+Consecutive points in time of an experiment often have the same attentional
+focus. Keying the rendered output by a hash of the Scheme snapshot lets
+graphics.py skip both the CogServer round trips and the Graphviz call for a
+snapshot it has already rendered, and link the existing image instead.
+
+See README.md for documentation and instructions.
+"""
+
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+# Maximum total size in bytes of the files kept in a cache
+FRAME_CACHE_MAX_BYTES = 1 << 30
+
+# Number of frames rendered into a cache between evictions
+FRAME_CACHE_EVICT_INTERVAL = 100
+
+
+class FrameCache(object):
+    """
+    Size-bounded cache of DOT graph descriptions and PNG images, keyed by a
+    hash of the Scheme snapshot they were rendered from
+
+    The least recently used entries are removed by evict() once the total
+    size of the cache exceeds 'max_bytes'. render_points() in graphics.py
+    calls it every 'evict_interval' rendered frames, so the cache stays
+    within about 'max_bytes' plus that many frames during a long run.
+
+    Parameters:
+    directory (required) The folder in which the cached files are stored
+    max_bytes (optional) Maximum total size of the cached files in bytes
+    evict_interval (optional) Number of frames rendered between evictions
+    """
+    def __init__(self, directory, max_bytes=FRAME_CACHE_MAX_BYTES,
+                 evict_interval=FRAME_CACHE_EVICT_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(scheme):
+        """
+        Return the cache key of a Scheme snapshot
+        """
+        if not isinstance(scheme, bytes):
+            scheme = scheme.encode('utf-8')
+        return hashlib.sha1(scheme).hexdigest()
+
+    def dot_path(self, key):
+        return os.path.join(self.directory, key + '.dot')
+
+    def png_path(self, key):
+        return os.path.join(self.directory, key + '.png')
+
+    def get_dot(self, key):
+        """
+        Return the cached DOT graph description for a key, or None
+        """
+        path = self.dot_path(key)
+        try:
+            with open(path, 'rb') as infile:
+                dot = infile.read().decode('utf-8')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        self._touch(path)
+        return dot
+
+    def put_dot(self, key, dot):
+        """
+        Store the DOT graph description for a key
+        """
+        self._write(self.dot_path(key), dot.encode('utf-8'))
+
+    def has_png(self, key):
+        """
+        Return True if an image is cached for a key
+        """
+        return os.path.exists(self.png_path(key))
+
+    def link_png(self, key, destination):
+        """
+        Make the cached image for a key available at 'destination', as a hard
+        link where the filesystem supports it and as a copy otherwise
+        """
+        source = self.png_path(key)
+        self._touch(source)
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except (OSError, AttributeError):
+            shutil.copyfile(source, destination)
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used files until the total size of the
+        cache is at most 'max_bytes'
+
+        Files that are still being written are counted but never removed.
+
+        Parameters:
+        keep (optional) Collection of keys whose files must not be removed,
+          such as those of images that are being rendered
+
+        Returns the number of files that were removed.
+        """
+        entries = []
+        total = 0
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Renamed or removed since it was listed
+                continue
+            total += stat.st_size
+            key, extension = os.path.splitext(filename)
+            if extension in ('.dot', '.png') and key not in keep:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+
+        return removed
+
+    def _write(self, path, data):
+        # Write to a temporary file first, so that readers never see a
+        # partially written entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as outfile:
+            outfile.write(data)
+        os.rename(temporary, path)
+
+    @staticmethod
+    def _touch(path):
+        # The modification time records when an entry was last used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
@@ -31,22 +31,54 @@ Example usage:
 sudo service mongod start
 cd ~/external-tools/client/
 python example.py
-python attentional_focus_slideshow.py
+python graphics.py [experiment] [--workers N] [--frames N]
 gwenview ./timeseries -s
 """
 
 import os
-from subprocess import check_call
+import argparse
+from multiprocessing import Pool, cpu_count
+from subprocess import Popen, PIPE, CalledProcessError
 from opencog import *
+from framecache import FrameCache, FRAME_CACHE_MAX_BYTES
+from schemestore import SchemeSnapshot
 
 __author__ = 'Cosmo Harrigan'
 
 # Sets the subfolder for storing the analysis files
 ANALYSIS_FOLDER = os.path.dirname(__file__)
 
+# Number of processes that render images in parallel
+RENDER_WORKERS = cpu_count()
+
+# Sets the subfolder for caching rendered images between runs
+FRAME_CACHE_FOLDER = os.path.join(ANALYSIS_FOLDER, "frame-cache")
+
 sub_dir = "images"
-if not os.path.exists(sub_dir):
-    os.makedirs(sub_dir)
+if not os.path.exists(os.path.join(ANALYSIS_FOLDER, sub_dir)):
+    os.makedirs(os.path.join(ANALYSIS_FOLDER, sub_dir))
+
+
+def frame_path(uid):
+    """
+    Returns the path of the PNG image for a unique identifier
+    """
+    png_filename = "{0:05d}.png".format(uid)
+    return os.path.join(ANALYSIS_FOLDER, sub_dir, png_filename)
+
+
+def render_png(dot, png_full_path):
+    """
+    Renders a PNG image from a DOT graph description to a given path
+
+    The DOT graph description is passed to Graphviz on its standard input, so
+    no intermediate file is written.
+    """
+    command = ['dot', '-Tpng', '-o', png_full_path]
+    process = Popen(command, stdin=PIPE)
+    process.communicate(dot.encode('utf-8'))
+    if process.returncode != 0:
+        raise CalledProcessError(process.returncode, command)
 
 
 def render_image(dot, uid):
@@ -58,41 +90,170 @@ def render_image(dot, uid):
     dot (required) The DOT graph description of the point in time
     uid (required) A unique identifier, which should increment at each time interval
     """
-    dot_filename = "{0:05d}.dot".format(uid)
-    png_filename = "{0:05d}.png".format(uid)
+    render_png(dot, frame_path(uid))
+
+
+def render_cached_image(dot, cache, key, uid):
+    """
+    Renders a PNG image into a FrameCache, and links it as the image for a
+    unique identifier
+    """
+    cached_full_path = cache.png_path(key)
+    temporary_path = cached_full_path + '.rendering'
+    render_png(dot, temporary_path)
+    os.rename(temporary_path, cached_full_path)
+    cache.link_png(key, frame_path(uid))
 
-    dot_full_path = os.path.join(ANALYSIS_FOLDER, sub_dir, dot_filename)
-    png_full_path = os.path.join(ANALYSIS_FOLDER, sub_dir, png_filename)
 
-    with open(dot_full_path, 'w') as outfile:
-        outfile.write(dot)
+def render_points(points, workers=RENDER_WORKERS, max_frames=None,
+                  cache=None):
+    """
+    Renders a PNG image for each point in time that has a Scheme
+    representation
 
-    # Render the image using Graphviz
-    check_call(['dot', '-Tpng', dot_full_path, '-o', png_full_path])
-    os.remove(dot_full_path)
+    The DOT graph description of each point is requested from the CogServer
+    one point at a time, since each point has to be loaded into the
+    atomspace first. The images are rendered by a pool of processes in the
+    meantime, so that Graphviz runs on several cores while the next DOT graph
+    description is being requested.
 
+    If a FrameCache is given, points whose Scheme representation has already
+    been rendered are linked to the cached image without contacting the
+    CogServer or running Graphviz. The cache is evicted every
+    'evict_interval' rendered frames, and once more at the end.
 
-# Example application
-if __name__ == "__main__":
-    client = pymongo.MongoClient(MONGODB_CONNECTION_STRING)
-    mongo = client[MONGODB_DATABASE]
+    Parameters:
+
+    points (required) An iterable of PointInTime dictionaries, whose Scheme
+      representation is either text or a SchemeSnapshot
+    workers (optional) Number of processes that render images in parallel
+    max_frames (optional) Maximum number of images to render. Defaults to
+      rendering every point.
+    cache (optional) A FrameCache. Defaults to None, which renders every
+      point.
 
-    points = mongo['points']
+    Returns the number of images that were produced.
+    """
+    pool = Pool(workers)
+    renders = []
+
+    # Maps the key of each image that is being rendered to its render and
+    # the frames of the later points that are waiting for it
+    in_progress = {}
 
-    # Iterate over the point in time snapshots
     sequence_number = 0
-    for point in points.find():
+    for point in points:
+        if max_frames is not None and sequence_number >= max_frames:
+            break
         if len(point['atoms']) == 0:
             continue
+        text = point['scheme']
+        if isinstance(text, SchemeSnapshot):
+            text = text.text
+
+        key = None
+        dot = None
+        if cache is not None:
+            key = cache.key(text)
+            if key in in_progress:
+                in_progress[key][1].append(sequence_number)
+                sequence_number += 1
+                continue
+            elif cache.has_png(key):
+                cache.link_png(key, frame_path(sequence_number))
+                sequence_number += 1
+                continue
+            dot = cache.get_dot(key)
 
-        # Insert the Scheme representation of this point in time to the atomspace
-        clear_atomspace()
-        scheme(point['scheme'])
+        if dot is None:
+            # Insert the Scheme representation of this point in time to the atomspace
+            clear_atomspace()
+            scheme(text)
 
-        # Request the DOT graph representation
-        dot = dump_atomspace_dot()
+            # Request the DOT graph representation
+            dot = dump_atomspace_dot()
 
-        # Render the graph to an image
-        render_image(dot, sequence_number)
+            if cache is not None:
+                cache.put_dot(key, dot)
+
+        # Render the graph to an image in the background
+        if cache is None:
+            renders.append(pool.apply_async(
+                render_image, (dot, sequence_number)))
+        else:
+            render = pool.apply_async(
+                render_cached_image, (dot, cache, key, sequence_number))
+            renders.append(render)
+            in_progress[key] = (render, [])
+            if len(renders) % cache.evict_interval == 0:
+                _link_rendered(cache, in_progress)
+                cache.evict(keep=in_progress)
 
         sequence_number += 1
+
+    pool.close()
+    for render in renders:
+        render.get()
+    pool.join()
+
+    if cache is not None:
+        _link_rendered(cache, in_progress)
+        cache.evict()
+
+    return sequence_number
+
+
+def _link_rendered(cache, in_progress):
+    # Links the images that have finished rendering to the frames that were
+    # waiting for them, so that they can be evicted
+    for key, (render, frames) in list(in_progress.items()):
+        if render.ready():
+            render.get()
+            for uid in frames:
+                cache.link_png(key, frame_path(uid))
+            del in_progress[key]
+
+
+# Example application
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the points of an experiment stored in MongoDB")
+    parser.add_argument('experiment', nargs='?',
+                        help="Experiment to render. Defaults to the most "
+                             "recently exported experiment.")
+    parser.add_argument('--workers', type=int, default=RENDER_WORKERS,
+                        help="Number of processes that render images")
+    parser.add_argument('--frames', type=int, default=None,
+                        help="Maximum number of images to render")
+    parser.add_argument('--cache', default=FRAME_CACHE_FOLDER,
+                        help="Folder for caching rendered images")
+    parser.add_argument('--cache-size', type=int,
+                        default=FRAME_CACHE_MAX_BYTES,
+                        help="Maximum size of the cache in bytes")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Render every point without caching")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        cache = FrameCache(args.cache, max_bytes=args.cache_size)
+
+    experiment = args.experiment
+    if experiment is None:
+        experiment = get_mongo()['points'].find_one(
+            sort=[('_id', -1)])['experiment']
+
+    # Points exported with a SchemeSnapshotStore only hold the hashes of
+    # their Scheme expressions, so their text is rebuilt first
+    exporter = MongoTimeseriesExporter(experiment)
+    points = (dict(document, scheme=exporter.scheme(document))
+              for document in exporter.points())
+
+    # Render the point in time snapshots
+    rendered = render_points(
+        points,
+        workers=args.workers,
+        max_frames=args.frames,
+        cache=cache)
+
+    print("Rendered {0} images".format(rendered))
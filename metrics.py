@@ -0,0 +1,210 @@
+"""
+Optional instrumentation of the client
+
+When enabled, records for each instrumented call the number of calls, a
+histogram of their latency, the bytes sent and received over HTTP and the time
+spent decoding JSON. The functions of opencog.py that talk to the CogServer
+are recorded under their own names, and the HTTP requests and JSON decoding
+underneath them under 'http.get', 'http.post' and 'json.decode'.
+
+When disabled, which is the default, each instrumented call only checks the
+'enabled' flag.
+
+Example:
+    metrics.enable()
+    run_experiment()
+    print metrics.snapshot()['get_atomspace']['count']
+    print metrics.prometheus_text()
+
+See README.md for documentation and instructions.
+"""
+
+import json
+import time
+import threading
+import functools
+from configuration import CLIENT_METRICS
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+enabled = CLIENT_METRICS
+
+
+class Metric(object):
+    """
+    Statistics of the calls recorded under one name
+    """
+    __slots__ = ('count', 'seconds', 'buckets', 'bytes_sent',
+                 'bytes_received')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'seconds': self.seconds,
+            'buckets': list(zip(LATENCY_BUCKETS, self.buckets)),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received
+        }
+
+
+class Registry(object):
+    """
+    In-memory registry of the recorded metrics
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def record(self, name, seconds, sent=0, received=0):
+        """
+        Record a call
+
+        Parameters:
+        name (required) Name the call is recorded under
+        seconds (required) Latency of the call in seconds
+        sent (optional) Number of bytes sent
+        received (optional) Number of bytes received
+        """
+        bucket = 0
+        while seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric()
+            metric.count += 1
+            metric.seconds += seconds
+            metric.buckets[bucket] += 1
+            metric.bytes_sent += sent
+            metric.bytes_received += received
+
+    def snapshot(self):
+        """
+        Return a dictionary that maps each name to a dictionary of its
+        statistics
+        """
+        with self.lock:
+            return dict((name, metric.to_dict())
+                        for name, metric in self.metrics.items())
+
+    def reset(self):
+        """
+        Remove every recorded metric
+        """
+        with self.lock:
+            self.metrics = {}
+
+
+registry = Registry()
+
+
+def enable():
+    """
+    Start recording metrics
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Stop recording metrics. The metrics recorded so far are kept.
+    """
+    global enabled
+    enabled = False
+
+
+def record(name, seconds, sent=0, received=0):
+    """
+    Record a call in the default registry
+    """
+    registry.record(name, seconds, sent, received)
+
+
+def snapshot():
+    """
+    Return the statistics of the default registry
+    """
+    return registry.snapshot()
+
+
+def reset():
+    """
+    Remove every metric recorded in the default registry
+    """
+    registry.reset()
+
+
+def instrumented(name):
+    """
+    Decorator that records the latency of each call to a function under
+    'name' while metrics are enabled
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.record(name, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def prometheus_text(prefix='opencog_client'):
+    """
+    Return the statistics of the default registry in the Prometheus text
+    exposition format
+    """
+    # The samples of each metric family must follow its TYPE line together
+    stats = sorted(snapshot().items())
+    lines = ['# TYPE {0}_seconds histogram'.format(prefix)]
+    for name, metric in stats:
+        label = 'name="{0}"'.format(name)
+        cumulative = 0
+        for bound, count in metric['buckets']:
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('{0}_seconds_bucket{{{1},le="{2}"}} {3}'
+                         .format(prefix, label, le, cumulative))
+        lines.append('{0}_seconds_sum{{{1}}} {2!r}'
+                     .format(prefix, label, metric['seconds']))
+        lines.append('{0}_seconds_count{{{1}}} {2}'
+                     .format(prefix, label, metric['count']))
+    for family, key in (('bytes_sent_total', 'bytes_sent'),
+                        ('bytes_received_total', 'bytes_received')):
+        lines.append('# TYPE {0}_{1} counter'.format(prefix, family))
+        for name, metric in stats:
+            lines.append('{0}_{1}{{name="{2}"}} {3}'
+                         .format(prefix, family, name, metric[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_jsonl(outfile):
+    """
+    Append the statistics of the default registry to a file as JSON lines,
+    one line per name, each with the current time
+
+    Parameters:
+    outfile (required) A file object opened for writing
+    """
+    now = time.time()
+    for name, stats in sorted(snapshot().items()):
+        stats['name'] = name
+        stats['time'] = now
+        stats['buckets'] = [['+Inf' if bound == float('inf') else bound,
+                             count] for bound, count in stats['buckets']]
+        outfile.write(json.dumps(stats, sort_keys=True) + '\n')
@@ -0,0 +1,258 @@
+"""
+Indexed client-side copy of the atomspace
+
+atomspace() returns a static dictionary, so that every lookup by type, name
+or STI is a scan of all of the atoms, and every update downloads the whole
+atomspace again. An AtomSpaceMirror keeps the atoms indexed by type, by name,
+by STI (in sorted order, for range queries) and by their incoming and
+outgoing links, and refresh() only updates the atoms that changed since the
+last refresh.
+
+Example:
+    mirror = AtomSpaceMirror()
+    mirror.refresh()
+    for t in range(100):
+        importance_diffusion()
+        mirror.refresh()
+        print len(mirror.sti_range(sti_min=100))
+
+See README.md for documentation and instructions.
+"""
+
+import time
+from bisect import bisect_left, bisect_right, insort
+from restclient import PROJECTED_FIELDS
+
+
+class AtomSpaceMirror(object):
+    """
+    Copy of the atomspace of a CogServer, indexed for fast queries
+
+    The REST API cannot list the changes since a given time, so refresh()
+    requests the handle and STI of every atom, which is an order of
+    magnitude smaller than the full atoms, and only updates the indexes of
+    the atoms whose STI changed. The full atoms are only requested again
+    when atoms were added, or when refresh(full=True) is called, which also
+    picks up changes to truth values.
+
+    Parameters:
+    client (optional) The CogServerClient used to query the CogServer.
+      Defaults to the default client of opencog.py.
+    page_size (optional) If given, full refreshes request the atoms one page
+      at a time with iter_atoms()
+    """
+    def __init__(self, client=None, page_size=None):
+        self.client = client
+        self.page_size = page_size
+        self.atoms = {}
+        self.refreshes = 0
+        self.refresh_seconds = None
+        self._types = {}
+        self._names = {}
+        self._sti = []
+        self._incoming = {}
+
+    def refresh(self, full=False):
+        """
+        Bring the mirror up to date with the atomspace
+
+        Parameters:
+        full (optional) If True, every atom is requested again, so that
+          changes other than to the STI of the atoms are also applied
+
+        Returns a dictionary with the number of atoms that were 'added',
+        'changed' and 'removed'.
+        """
+        start = time.time()
+        client = self._client()
+        if full or not self.atoms:
+            changes = self._apply_atoms(self._all_atoms(client))
+        else:
+            current = client.query_atoms(fields=PROJECTED_FIELDS)
+            handles = set(atom['handle'] for atom in current)
+            if handles - set(self.atoms):
+                changes = self._apply_atoms(self._all_atoms(client))
+            else:
+                changes = self._apply_sti(current, handles)
+
+        self.refreshes += 1
+        self.refresh_seconds = time.time() - start
+        return changes
+
+    def get(self, handle, default=None):
+        """
+        Return the atom with a handle, or 'default'
+        """
+        return self.atoms.get(handle, default)
+
+    def __getitem__(self, handle):
+        return self.atoms[handle]
+
+    def __contains__(self, handle):
+        return handle in self.atoms
+
+    def __len__(self):
+        return len(self.atoms)
+
+    def __iter__(self):
+        return iter(self.atoms.values())
+
+    def of_type(self, atom_type):
+        """
+        Return the atoms of a type, for example 'ConceptNode'
+        """
+        return [self.atoms[handle]
+                for handle in self._types.get(atom_type, ())]
+
+    def named(self, name):
+        """
+        Return the nodes with a name
+        """
+        return [self.atoms[handle] for handle in self._names.get(name, ())]
+
+    def sti_range(self, sti_min=None, sti_max=None):
+        """
+        Return the atoms whose STI is between 'sti_min' and 'sti_max'
+        (inclusive), in increasing order of STI
+        """
+        low = 0 if sti_min is None else \
+            bisect_left(self._sti, (sti_min, float('-inf')))
+        high = len(self._sti) if sti_max is None else \
+            bisect_right(self._sti, (sti_max, float('inf')))
+        return [self.atoms[handle] for _, handle in self._sti[low:high]]
+
+    def top(self, count):
+        """
+        Return the 'count' atoms with the highest STI, in decreasing order of
+        STI
+        """
+        if count <= 0:
+            return []
+        return [self.atoms[handle]
+                for _, handle in reversed(self._sti[-count:])]
+
+    def outgoing(self, handle):
+        """
+        Return the atoms in the outgoing set of a link
+        """
+        return [self.atoms[target]
+                for target in self.atoms[handle].get('outgoing', ())
+                if target in self.atoms]
+
+    def incoming(self, handle):
+        """
+        Return the links whose outgoing set contains an atom
+        """
+        return [self.atoms[source]
+                for source in self._incoming.get(handle, ())]
+
+    def _client(self):
+        if self.client is not None:
+            return self.client
+        # Imported here, as opencog.py imports this module
+        import opencog
+        return opencog.default_client
+
+    def _all_atoms(self, client):
+        if self.page_size is not None:
+            return client.iter_atoms(page_size=self.page_size)
+        return client.get_atoms()
+
+    def _apply_atoms(self, atoms):
+        # Applies the difference between the mirror and a full listing
+        added = []
+        changed = []
+        seen = set()
+        for atom in atoms:
+            handle = atom['handle']
+            seen.add(handle)
+            old = self.atoms.get(handle)
+            if old is None:
+                added.append(atom)
+            elif old != atom:
+                changed.append(atom)
+
+        removed = set(self.atoms) - seen
+        for handle in removed:
+            self._unindex(self.atoms[handle])
+
+        # Inserting into the sorted STI index one atom at a time is only
+        # faster than sorting it again when few atoms changed
+        bulk = self._bulk(len(added) + len(changed))
+        for atom in changed:
+            self._unindex(self.atoms[atom['handle']], sti=not bulk)
+        for atom in added + changed:
+            self._index(atom, sti=not bulk)
+        if bulk:
+            self._sort_sti()
+
+        return {'added': len(added), 'changed': len(changed),
+                'removed': len(removed)}
+
+    def _apply_sti(self, current, handles):
+        # Applies the difference between the mirror and a listing of the
+        # handle and STI of every atom, none of which are new
+        removed = set(self.atoms) - handles
+        for handle in removed:
+            self._unindex(self.atoms[handle])
+
+        changed = []
+        for atom in current:
+            old = self.atoms[atom['handle']]
+            if old['attentionvalue']['sti'] != atom['attentionvalue']['sti']:
+                changed.append((old, atom['attentionvalue']['sti']))
+
+        bulk = self._bulk(len(changed))
+        for old, sti in changed:
+            if not bulk:
+                self._remove_sti(old)
+                insort(self._sti, (sti, old['handle']))
+            old['attentionvalue']['sti'] = sti
+        if bulk:
+            self._sort_sti()
+
+        return {'added': 0, 'changed': len(changed), 'removed': len(removed)}
+
+    def _bulk(self, count):
+        return count > len(self._sti) // 64
+
+    def _sort_sti(self):
+        self._sti = sorted((atom['attentionvalue']['sti'], handle)
+                           for handle, atom in self.atoms.items())
+
+    def _index(self, atom, sti=True):
+        handle = atom['handle']
+        self.atoms[handle] = atom
+        self._types.setdefault(atom.get('type'), set()).add(handle)
+        if atom.get('name'):
+            self._names.setdefault(atom['name'], set()).add(handle)
+        if sti:
+            insort(self._sti, (atom['attentionvalue']['sti'], handle))
+        for target in atom.get('outgoing', ()):
+            self._incoming.setdefault(target, set()).add(handle)
+
+    def _unindex(self, atom, sti=True):
+        handle = atom['handle']
+        del self.atoms[handle]
+        _discard(self._types, atom.get('type'), handle)
+        if atom.get('name'):
+            _discard(self._names, atom['name'], handle)
+        if sti:
+            self._remove_sti(atom)
+        for target in atom.get('outgoing', ()):
+            _discard(self._incoming, target, handle)
+
+    def _remove_sti(self, atom):
+        entry = (atom['attentionvalue']['sti'], atom['handle'])
+        position = bisect_left(self._sti, entry)
+        if position < len(self._sti) and self._sti[position] == entry:
+            del self._sti[position]
+
+
+def _discard(index, key, handle):
+    # Removes a handle from an index, and the key once it has no handles
+    handles = index.get(key)
+    if handles is not None:
+        handles.discard(handle)
+        if not handles:
+            del index[key]
@@ -8,9 +8,36 @@ See README.md for documentation and instructions.
 __author__ = 'Cosmo Harrigan'
 
 from configuration import *
+from restclient import CogServerClient
+from timeseries import Timeseries, DeltaTimeseries
+from mirror import AtomSpaceMirror
+from export import CSVTimeseriesWriter, MongoTimeseriesExporter
+from metrics import instrumented
+import metrics
 import os
+import time
+import socket
+import shlex
 from subprocess import check_call, Popen
-from multiprocessing import Process
+from multiprocessing import Process, Pool
+from multiprocessing.pool import ThreadPool
+from collections import deque
+
+# Client used by the module-level functions to talk to the REST API
+default_client = CogServerClient()
+
+
+def set_default_client(client):
+    """
+    Route the module-level functions through a different CogServerClient,
+    for example one with a larger connection pool or pointing at another
+    CogServer
+
+    Parameters:
+    client (required) The CogServerClient to use
+    """
+    global default_client
+    default_client = client
 
 
 class Atom(object):
@@ -19,13 +46,76 @@ class Atom(object):
 
     Represents the STI value of an atom at a particular point in time.
     Intended to be contained in a PointInTime object with a timestep value.
+
+    Uses __slots__, so that each Atom takes a fraction of the memory of a
+    dictionary. For compatibility with code written for dictionaries, the
+    fields can also be read as atom['handle'] and atom['sti'].
     """
-    def __init__(self):
-        self.handle = None
-        self.sti = None
+    __slots__ = ('handle', 'sti')
+
+    def __init__(self, handle=None, sti=None):
+        self.handle = handle
+        self.sti = sti
+
+    def __getitem__(self, key):
+        if key == 'handle':
+            return self.handle
+        elif key == 'sti':
+            return self.sti
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return ['handle', 'sti']
+
+    def to_dict(self):
+        """
+        Return the atom as a {'handle': ..., 'sti': ...} dictionary
+        """
+        return {'handle': self.handle, 'sti': self.sti}
+
+    def __eq__(self, other):
+        if isinstance(other, Atom):
+            return self.handle == other.handle and self.sti == other.sti
+        elif isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Atom(handle={0!r}, sti={1!r})'.format(self.handle, self.sti)
+
+    # Classes with __slots__ need these to be pickled with protocols 0 and 1
+    def __getstate__(self):
+        return self.handle, self.sti
+
+    def __setstate__(self, state):
+        self.handle, self.sti = state
+
+
+# Every point in time refers to the same object for a given handle, instead
+# of each holding its own copy of the number. Points created by an
+# Experiment share the handles of that experiment instead, and this table is
+# emptied by clear_atomspace(), after which its handles are no longer used.
+_handles = {}
 
+# Fields of an atom that create_point() reads, in the form of the 'fields'
+# argument of CogServerClient.query_atoms
+_POINT_FIELDS = ('handle', 'sti')
 
-def create_point(timestep, atoms, scheme=None):
+
+@instrumented('create_point')
+def create_point(timestep, atoms, scheme=None, handles=None):
     """
     Create a PointInTime dictionary from a JSON atom representation
 
@@ -38,16 +128,14 @@ def create_point(timestep, atoms, scheme=None):
       (Refer to the definition of the Atom object)
     - an integer "timestep"
     - (optional) A Scheme representation of the point in time
-    """
-
-    atom_list = []
 
-    for atom in atoms:
-        data = {
-            'handle': atom['handle'],
-            'sti': atom['attentionvalue']['sti']
-        }
-        atom_list.append(data)
+    The points share a single object for each handle, from the dictionary
+    'handles' if it is given, or else from a table kept by this module.
+    """
+    shared = (_handles if handles is None else handles).setdefault
+    atom_list = [Atom(shared(atom['handle'], atom['handle']),
+                      atom['attentionvalue']['sti'])
+                 for atom in atoms]
 
     point = {
         'timestep': timestep,
@@ -57,33 +145,73 @@ def create_point(timestep, atoms, scheme=None):
 
     return point
 
+
+def _point_filters(filters):
+    # Adds the fields that create_point() reads to the 'fields' of the
+    # filters of CogServerClient.query_atoms, if it is given
+    fields = filters.get('fields')
+    if fields is None:
+        return filters
+    missing = [field for field in _POINT_FIELDS if field not in fields]
+    return dict(filters, fields=list(fields) + missing)
+
+
+@instrumented('shell')
 def shell(command):
     """
     Send a command to the CogServer shell
     """
-    data = {'command': command + '\n'}
-
-    post(uri + 'shell', data=json.dumps(data), headers=headers)
+    default_client.shell(command)
 
 
+@instrumented('scheme')
 def scheme(command):
     """
     Send a Scheme command to the Scheme interpreter
     """
-    data = {'command': command + '\n'}
+    return default_client.scheme(command)
 
-    result = post(uri + 'scheme', data=json.dumps(data), headers=headers)
-    return result.json()['response']
+
+@instrumented('scheme_batch')
+def scheme_batch(commands):
+    """
+    Send a list of Scheme commands to the Scheme interpreter in as few
+    requests as possible
+
+    Returns a list of the responses to each command. Raises a SchemeBatchError
+    identifying the commands that failed, if any.
+
+    Parameters:
+    commands (required) List of Scheme commands
+    """
+    return default_client.scheme_batch(commands)
+
+
+def batched():
+    """
+    Context manager that queues every Scheme command sent inside the block,
+    including those sent by functions such as set_rent() and set_wages(), and
+    sends them in a single request when the block exits
+
+    A block inside another batched() block joins it, and its commands are
+    sent in order with those of the outer block.
+
+    Example:
+        with batched() as batch:
+            set_diffusion_percent("0.50")
+            set_rent("8")
+        print batch.responses
+    """
+    return default_client.batched()
 
 
 def load_scheme_files(files):
     """
     Loads a list of Scheme files into the cogserver
     """
-    for datafile in files:
-        command = "(load-scm-from-file \"" + \
+    scheme_batch(["(load-scm-from-file \"" +
                   OPENCOG_SOURCE_FOLDER + datafile + "\")"
-        scheme(command)
+                  for datafile in files])
 
 
 def load_python_agent(path):
@@ -121,6 +249,7 @@ def start_python_agent(path, name):
     shell(arg)
 
 
+@instrumented('step_agent')
 def step_agent(name):
     """
     Run a step of an arbitrary C++ agent in the CogServer
@@ -135,6 +264,7 @@ def step_agent(name):
     shell(arg)
 
 
+@instrumented('step_python_agent')
 def step_python_agent(path, name):
     """
     Run a step of an arbitrary Python agent in the CogServer
@@ -153,7 +283,9 @@ def step_python_agent(path, name):
     shell(arg)
 
 
-def get_attentional_focus(timestep, scheme=False):
+@instrumented('get_attentional_focus')
+def get_attentional_focus(timestep, scheme=False, stream=REST_STREAM_JSON,
+                          **filters):
     """
     Get the atoms in the attentional focus
 
@@ -163,18 +295,30 @@ def get_attentional_focus(timestep, scheme=False):
       snapshot.
     scheme (optional) If True, the Scheme representation of the attentional
       focus will also be captured. Default is False.
-    """
-    get_response = get(uri + 'atoms?filterby=attentionalfocus')
-    get_result = get_response.json()['result']['atoms']
-
-    if not scheme:
-        return create_point(timestep, get_result)
+    stream (optional) If True, the response is parsed one atom at a time as
+      it arrives, so that memory use does not grow with the size of the
+      response. Requires ijson. Defaults to REST_STREAM_JSON.
+    filters (optional) Keyword arguments of CogServerClient.query_atoms that
+      restrict the atoms that are captured (sti_min, sti_max, atom_type,
+      handles, limit, offset) or the fields retrieved for each atom (fields).
+      For example, fields=['handle', 'sti'] retrieves only what the
+      PointInTime keeps. 'handle' and 'sti' are always added to the fields.
+    """
+    if filters:
+        get_result = default_client.query_atoms(
+            attentional_focus=True, stream=stream, **_point_filters(filters))
     else:
-        af_contents = dump_attentional_focus_scheme()
-        return create_point(timestep, get_result, scheme=af_contents)
+        get_result = default_client.get_atoms('filterby=attentionalfocus',
+                                              stream=stream)
+
+    point = create_point(timestep, get_result)
+    if scheme:
+        point['scheme'] = dump_attentional_focus_scheme()
+    return point
 
 
-def get_atomspace(timestep, scheme=False):
+@instrumented('get_atomspace')
+def get_atomspace(timestep, scheme=False, stream=REST_STREAM_JSON, **filters):
     """
     Take a snapshot of the atomspace at a given point in time
 
@@ -182,27 +326,39 @@ def get_atomspace(timestep, scheme=False):
     timestep value which identifies the timestep of this atomspace snapshot
     :param scheme: If True, the Scheme representation of the atomspace will
     also be captured.
+    :param stream: If True, the response is parsed one atom at a time as it
+    arrives, so that memory use does not grow with the size of the response.
+    Requires ijson. Defaults to REST_STREAM_JSON.
+    :param filters: Keyword arguments of CogServerClient.query_atoms that
+    restrict the atoms that are captured (sti_min, sti_max, atom_type, handles,
+    limit, offset) or the fields retrieved for each atom (fields), to which
+    'handle' and 'sti' are always added.
     :return: a PointInTime dictionary that captures the atomspace at the given
     timestep
     """
-    get_response = get(uri + 'atoms')
-    get_result = get_response.json()['result']['atoms']
-
-    if not scheme:
-        return create_point(timestep, get_result)
+    if filters:
+        get_result = default_client.query_atoms(stream=stream,
+                                                **_point_filters(filters))
     else:
-        atomspace_contents = dump_atomspace_scheme()
-        return create_point(timestep, get_result, scheme=atomspace_contents)
+        get_result = default_client.get_atoms(stream=stream)
+
+    point = create_point(timestep, get_result)
+    if scheme:
+        point['scheme'] = dump_atomspace_scheme()
+    return point
 
 
-def atomspace():
+@instrumented('atomspace')
+def atomspace(stream=REST_STREAM_JSON):
     """
     Retrieves a snapshot of the atomspace. Take note that the snapshot returned
     is static, and must be called again when you want it to be updated.
+    :param stream: If True, the response is parsed one atom at a time as it
+    arrives, instead of being held in memory alongside the result. Requires
+    ijson. Defaults to REST_STREAM_JSON.
     :return: a dictionary of atoms
     """
-    get_response = get(uri + 'atoms')
-    get_result = get_response.json()['result']['atoms']
+    get_result = default_client.get_atoms(stream=stream)
 
     result = {}
     for atom in get_result:
@@ -211,7 +367,162 @@ def atomspace():
     return result
 
 
-def export_timeseries_csv(timeseries, filename, scheme=False):
+def iter_atoms(page_size=REST_PAGE_SIZE, cursor=0, prefetch=True):
+    """
+    Iterates over the atoms of the atomspace, requesting them one page at a
+    time, so that large atomspaces can be processed without holding all of
+    their atoms in memory or in a single response.
+    :param page_size: Number of atoms requested at a time. Defaults to
+    REST_PAGE_SIZE.
+    :param cursor: Number of atoms to skip. To resume after a failed request,
+    pass the 'cursor' attribute of the iterator that failed.
+    :param prefetch: If True, the next page is requested on a background
+    thread while the current one is being iterated over.
+    :return: an AtomPages iterator
+    """
+    return default_client.iter_atoms(page_size=page_size, cursor=cursor,
+                                     prefetch=prefetch)
+
+
+class PendingPoint(object):
+    """
+    A PointInTime whose atoms and Scheme representation are still being
+    retrieved by an AsyncCogServerClient
+
+    Call get() to wait for the requests to finish and obtain the PointInTime
+    dictionary.
+    """
+    def __init__(self, timestep, atoms, scheme=None):
+        self.timestep = timestep
+        self.atoms = atoms
+        self.scheme = scheme
+
+    def ready(self):
+        """
+        Returns True if all of the requests have finished
+        """
+        return self.atoms.ready() and \
+            (self.scheme is None or self.scheme.ready())
+
+    def get(self, timeout=None):
+        """
+        Wait for the requests to finish and return the PointInTime dictionary
+
+        Parameters:
+        timeout (optional) Maximum number of seconds to wait for each request
+        """
+        atoms = self.atoms.get(timeout)
+        if self.scheme is None:
+            return create_point(self.timestep, atoms)
+        else:
+            return create_point(self.timestep, atoms,
+                                scheme=self.scheme.get(timeout))
+
+
+class AsyncCogServerClient(object):
+    """
+    Concurrent interface to a single CogServer
+
+    Each method sends its request from a pool of worker threads and returns
+    immediately with a pending result; call get() on the result to wait for
+    the response. Independent reads, such as the attentional focus and
+    atomspace snapshots and their Scheme dumps, are then in flight at the
+    same time instead of waiting on each other's round trips. Create one
+    instance per CogServer to drive several servers from one process.
+
+    Agent steps change the state of the server, so wait for the snapshots of
+    a timestep before stepping the agents.
+
+    Parameters:
+    uri (optional) Base URI of the REST API. Defaults to the 'uri' defined in
+      configuration.py
+    workers (optional) Number of worker threads and pooled connections
+    """
+    def __init__(self, uri=uri, workers=ASYNC_WORKERS):
+        self.client = CogServerClient(uri, pool_size=workers)
+        self.pool = ThreadPool(workers)
+
+    def shell(self, command):
+        """
+        Send a command to the CogServer shell
+        """
+        return self.pool.apply_async(self.client.shell, (command,))
+
+    def scheme(self, command):
+        """
+        Send a Scheme command to the Scheme interpreter
+        """
+        return self.pool.apply_async(self.client.scheme, (command,))
+
+    def get_attentional_focus(self, timestep, scheme=False, **filters):
+        """
+        Get the atoms in the attentional focus
+
+        Returns a PendingPoint. If scheme is True, the Scheme representation
+        of the attentional focus is requested at the same time. Filters are
+        passed to CogServerClient.query_atoms.
+        """
+        if filters:
+            filters['attentional_focus'] = True
+            atoms = self.pool.apply_async(self.client.query_atoms, (),
+                                          filters)
+        else:
+            atoms = self.pool.apply_async(self.client.get_atoms,
+                                          ('filterby=attentionalfocus',))
+        af_contents = self.scheme("(cog-af)") if scheme else None
+        return PendingPoint(timestep, atoms, af_contents)
+
+    def get_atomspace(self, timestep, scheme=False, **filters):
+        """
+        Take a snapshot of the atomspace at a given point in time
+
+        Returns a PendingPoint. If scheme is True, the Scheme representation
+        of the atomspace is requested at the same time. Filters are passed to
+        CogServerClient.query_atoms.
+        """
+        if filters:
+            atoms = self.pool.apply_async(self.client.query_atoms, (),
+                                          filters)
+        else:
+            atoms = self.pool.apply_async(self.client.get_atoms)
+        atomspace_contents = \
+            self.scheme("(cog-prt-atomspace)") if scheme else None
+        return PendingPoint(timestep, atoms, atomspace_contents)
+
+    def capture(self, timestep, scheme=False, **filters):
+        """
+        Request snapshots of both the attentional focus and the atomspace
+
+        Returns a list of two PendingPoint objects: [attentional focus,
+        atomspace]. Use gather() to wait for both of them. Filters are passed
+        to CogServerClient.query_atoms for both snapshots.
+        """
+        return [self.get_attentional_focus(timestep, scheme=scheme,
+                                           **filters),
+                self.get_atomspace(timestep, scheme=scheme, **filters)]
+
+    @staticmethod
+    def gather(pending, timeout=None):
+        """
+        Wait for a list of pending results and return their values in order
+
+        Parameters:
+        pending (required) List of pending results returned by this client
+        timeout (optional) Maximum number of seconds to wait for each result
+        """
+        return [result.get(timeout) for result in pending]
+
+    def close(self):
+        """
+        Stop the worker threads and close the pooled connections
+        """
+        self.pool.close()
+        self.pool.join()
+        self.client.close()
+
+
+def export_timeseries_csv(timeseries, filename, scheme=False,
+                          normalize_scheme=False, compression=None):
     """
     Export the timeseries to a CSV file.
 
@@ -220,39 +531,52 @@ def export_timeseries_csv(timeseries, filename, scheme=False):
     filename (required) The name of the file that will be written to.
     scheme (optional) If True, the full Scheme representation of the point in
       in time will be included with each row. Defaults to False.
+    normalize_scheme (optional) If True, the Scheme representation is instead
+      written once per point in time to a side file. Defaults to False.
+    compression (optional) None, 'gzip' or 'zstd'. Defaults to None.
 
     Format:
     time, handle, sti
 
     If the timeseries contains a Scheme representation, the format is:
       time, handle, sti, scheme
+
+    If normalize_scheme is True, the format of the side file is:
+      time, scheme
+
+    To write the points while they are being captured instead, use
+    CSVTimeseriesWriter.
     """
-    with open(filename, 'wb') as csvfile:
-        writer = csv.writer(csvfile, delimiter=',')
-        for point in timeseries:
-            for atom in point['atoms']:
-                if point['scheme'] is not None and scheme is True:
-                    writer.writerow([point['timestep'],
-                                     atom['handle'],
-                                     atom['sti'],
-                                     point['scheme']])
-                else:
-                    writer.writerow([point['timestep'],
-                                     atom['handle'],
-                                     atom['sti']])
+    with CSVTimeseriesWriter(filename, scheme=scheme,
+                             normalize_scheme=normalize_scheme,
+                             compression=compression) as writer:
+        writer.write_all(timeseries)
 
 
-def export_timeseries_mongodb(timeseries):
+def export_timeseries_mongodb(timeseries, experiment=None):
     """
     Export the timeseries to a MongoDB database.
 
+    The points are appended to the 'points' and 'point_atoms' collections
+    and tagged with an experiment identifier, so that exporting does not remove the points of
+    earlier experiments. Use clear_mongodb() to remove every experiment.
+
     Parameters:
     timeseries (required) The timeseries that will be exported.
+    experiment (optional) Identifier of the experiment. Defaults to a new
+      unique identifier.
+
+    Returns the experiment identifier.
+
+    To export the points while they are being captured instead, use
+    MongoTimeseriesExporter.
     """
-    clear_mongodb()
-    mongo['points'].insert(timeseries)
+    with MongoTimeseriesExporter(experiment) as exporter:
+        exporter.write_all(timeseries)
+    return exporter.experiment
 
 
+@instrumented('dump_atomspace_scheme')
 def dump_atomspace_scheme():
     """
     Returns all atoms in the atomspace in Scheme format
@@ -260,16 +584,18 @@ def dump_atomspace_scheme():
     return scheme("(cog-prt-atomspace)")
 
 
+@instrumented('dump_atomspace_dot')
 def dump_atomspace_dot():
     """
     Returns all atoms in the atomspace in DOT graph description language
     format
     """
-    get_response = get(uri + 'atoms?dot=True')
-    get_result = get_response.json()['result']
+    get_response = default_client.get('atoms?dot=True')
+    get_result = default_client.decode(get_response)['result']
     return get_result
 
 
+@instrumented('dump_attentional_focus_scheme')
 def dump_attentional_focus_scheme():
     """
     Returns all atoms in the attentional focus in Scheme format
@@ -282,6 +608,7 @@ def clear_atomspace():
     Clear the atomspace
     """
     scheme("(clear)")
+    _handles.clear()
 
 
 def stop_agent_loop():
@@ -374,6 +701,302 @@ def set_wages(value):
            '(NumberNode "{0}")))'.format(value))
 
 
+# Paths of the REST API resources and the Scheme commands used to capture
+# each kind of snapshot
+CAPTURES = {
+    'attentional_focus': ('atoms?filterby=attentionalfocus', '(cog-af)'),
+    'atomspace': ('atoms', '(cog-prt-atomspace)')
+}
+
+
+class Experiment(object):
+    """
+    Runs the capture and step loop of an experiment, pipelining the
+    processing of each timestep with the next one
+
+    At each timestep, the snapshots in the capture spec are requested
+    concurrently, and then every agent in the schedule is stepped in order.
+    While the agents of the next timestep run on the server, the snapshots
+    are decoded by a pool of worker processes, and a worker thread turns them
+    into points in time, appends them to the timeseries, exports them and
+    calls the progress callback. Decoding runs in processes rather than
+    threads so that it does not hold up the requests of the next timestep.
+
+    Parameters:
+    schedule (required) List of the agents to step at each timestep, in
+      order. Each entry is either a function that takes no arguments, such
+      as importance_diffusion, the name of a C++ agent, such as
+      'SimpleImportanceDiffusionAgent', or a (path, name) tuple of a Python
+      agent.
+    capture (optional) The snapshots captured at each timestep, among
+      'attentional_focus' and 'atomspace'. Defaults to both.
+    scheme (optional) If True, the Scheme representation of each snapshot is
+      also captured. Defaults to False.
+    filters (optional) Dictionary of the keyword arguments of
+      CogServerClient.query_atoms applied to each snapshot, for example
+      {'fields': ['handle', 'sti']}
+    timeseries (optional) Dictionary mapping each captured snapshot to the
+      timeseries that its points are appended to, such as a list or a
+      DeltaTimeseries. Defaults to a list for each snapshot.
+    exporters (optional) Dictionary mapping each captured snapshot to a list
+      of objects with a write(point) method, such as CSVTimeseriesWriter or
+      MongoTimeseriesExporter, that its points are written to
+    progress (optional) Function called after each timestep has been
+      processed, with the experiment, the timestep and a dictionary mapping
+      each captured snapshot to its point in time. print_progress prints a
+      line for each timestep.
+    workers (optional) Number of processes that decode the snapshots
+    max_pending (optional) Number of timesteps that can be waiting to be
+      processed before the loop waits for the oldest one
+    checkpointer (optional) A Checkpointer from checkpoint.py, which saves a
+      checkpoint of the atomspace, the parameters, the next timestep and the
+      timeseries every 'interval' timesteps
+    parameters (optional) Dictionary of the agent parameters of the
+      experiment, which are saved in its checkpoints
+    scheme_store (optional) A SchemeSnapshotStore from schemestore.py. If
+      given, the Scheme representation of each point in time is added to the
+      store, and the point keeps a SchemeSnapshot that references it.
+
+    Example:
+        experiment = Experiment([importance_diffusion, importance_updating,
+                                 (agent_path, agent_name)],
+                                progress=print_progress)
+        timeseries = experiment.run(num_steps=50)
+        export_timeseries_csv(timeseries['atomspace'], "output.csv")
+    """
+    def __init__(self, schedule, capture=('attentional_focus', 'atomspace'),
+                 scheme=False, filters=None, timeseries=None, exporters=None,
+                 progress=None, workers=EXPERIMENT_WORKERS,
+                 max_pending=EXPERIMENT_MAX_PENDING, checkpointer=None,
+                 parameters=None, scheme_store=None):
+        for name in capture:
+            if name not in CAPTURES:
+                raise ValueError("Unknown snapshot {0!r}; expected one of "
+                                 "{1}".format(name, ', '.join(CAPTURES)))
+        self.schedule = schedule
+        self.capture = tuple(capture)
+        self.scheme = scheme
+        self.filters = _point_filters(filters or {})
+        self.timeseries = timeseries if timeseries is not None else \
+            dict((name, []) for name in self.capture)
+        self.exporters = exporters or {}
+        self.progress = progress
+        self.max_pending = max_pending
+        self.workers = workers
+        self.checkpointer = checkpointer
+        self.parameters = parameters
+        self.scheme_store = scheme_store
+
+        self.timestep = 0
+        self.steps = 0
+        self.atoms = 0
+        self.capture_seconds = 0.0
+        self.step_seconds = 0.0
+        self.elapsed = 0.0
+        self._began = None
+        # Shared by the points of this experiment only, so that the handles
+        # are released with them
+        self._handles = {}
+
+    def run(self, num_steps, start=None):
+        """
+        Run 'num_steps' timesteps, and wait until all of them have been
+        processed
+
+        Parameters:
+        num_steps (required) Number of timesteps to run
+        start (optional) Timestep of the first step. Defaults to the timestep
+          after the last one that was run.
+
+        Returns the dictionary of timeseries.
+        """
+        if start is not None:
+            self.timestep = start
+
+        requests = ThreadPool(len(self.capture) * (2 if self.scheme else 1))
+        decoders = Pool(self.workers)
+        # A single thread processes the decoded timesteps, so that they are
+        # appended and exported in order
+        sink = ThreadPool(1)
+        pending = deque()
+        self._began = time.time()
+        try:
+            for _ in range(num_steps):
+                responses = self._capture(requests)
+                self._step()
+
+                decoded = [(name, decoders.apply_async(
+                                _decode_snapshot, (atoms, metrics.enabled))
+                            if isinstance(atoms, bytes) else atoms, dump)
+                           for name, atoms, dump in responses]
+                pending.append(sink.apply_async(self._process,
+                                                (self.timestep, decoded)))
+                self.timestep += 1
+                while len(pending) > self.max_pending:
+                    pending.popleft().get()
+
+                if self.checkpointer is not None and \
+                        self.checkpointer.due(self.timestep):
+                    # The timeseries must include every timestep before the
+                    # checkpoint
+                    while pending:
+                        pending.popleft().get()
+                    self.checkpointer.save(self.timestep, self.timeseries,
+                                           self.parameters)
+
+            while pending:
+                pending.popleft().get()
+        finally:
+            self.elapsed += time.time() - self._began
+            self._began = None
+            for pool in (requests, decoders, sink):
+                pool.close()
+                pool.join()
+
+        return self.timeseries
+
+    def resume(self, num_steps, server=None):
+        """
+        Run the experiment up to timestep 'num_steps', continuing from its
+        latest checkpoint if it has one
+
+        The checkpoint is loaded into the CogServer by
+        Checkpointer.resume(), after starting 'server' if it is given and
+        routing the module-level functions to it. Exporters with a
+        rewind(timestep) method, such as CSVTimeseriesWriter,
+        MongoTimeseriesExporter and STIFileWriter, are rewound to the
+        timestep of the checkpoint, so that the points of the timesteps that
+        are run again are not written to them twice.
+
+        Parameters:
+        num_steps (required) Total number of timesteps of the experiment
+        server (optional) Server to start before loading the checkpoint
+
+        Returns the dictionary of timeseries.
+        """
+        if self.checkpointer is None:
+            raise ValueError("The experiment has no checkpointer")
+        if self.checkpointer.latest() is not None:
+            self.checkpointer.resume(self, server)
+        elif server is not None:
+            server.start()
+            set_default_client(CogServerClient(server.uri))
+        for exporters in self.exporters.values():
+            for exporter in exporters:
+                if hasattr(exporter, 'rewind'):
+                    exporter.rewind(self.timestep)
+        return self.run(max(num_steps - self.timestep, 0))
+
+    def throughput(self):
+        """
+        Return a dictionary with the number of timesteps processed, the
+        number of 'steps_per_second' and 'atoms_per_second' processed over
+        the time spent in run(), and the total time spent capturing
+        snapshots, stepping agents and saving checkpoints
+        """
+        elapsed = self.elapsed
+        if self._began is not None:
+            elapsed += time.time() - self._began
+        return {
+            'steps': self.steps,
+            'atoms': self.atoms,
+            'seconds': elapsed,
+            'steps_per_second': self.steps / elapsed if elapsed else None,
+            'atoms_per_second': self.atoms / elapsed if elapsed else None,
+            'capture_seconds': self.capture_seconds,
+            'step_seconds': self.step_seconds,
+            'checkpoint_seconds': self.checkpointer.seconds
+            if self.checkpointer is not None else 0.0
+        }
+
+    def _capture(self, requests):
+        # Waits until every snapshot of the timestep has been received, as
+        # the agents must not be stepped before
+        start = time.time()
+        results = []
+        for name in self.capture:
+            path, command = CAPTURES[name]
+            if self.filters:
+                filters = dict(self.filters,
+                               attentional_focus=name == 'attentional_focus')
+                atoms = requests.apply_async(default_client.query_atoms, (),
+                                             filters)
+            else:
+                atoms = requests.apply_async(_get_content, (path,))
+            dump = requests.apply_async(default_client.scheme, (command,)) \
+                if self.scheme else None
+            results.append((name, atoms, dump))
+
+        responses = [(name, atoms.get(), dump.get() if dump else None)
+                     for name, atoms, dump in results]
+        self.capture_seconds += time.time() - start
+        return responses
+
+    def _step(self):
+        start = time.time()
+        for agent in self.schedule:
+            if callable(agent):
+                agent()
+            elif isinstance(agent, tuple):
+                step_python_agent(*agent)
+            else:
+                step_agent(agent)
+        self.step_seconds += time.time() - start
+
+    def _process(self, timestep, decoded):
+        points = {}
+        for name, atoms, dump in decoded:
+            if not isinstance(atoms, list):
+                atoms, seconds = atoms.get()
+                if seconds is not None:
+                    metrics.record('json.decode', seconds)
+            if self.scheme_store is not None:
+                dump = self.scheme_store.add(dump)
+            points[name] = create_point(timestep, atoms, dump,
+                                        self._handles)
+        for name in self.capture:
+            point = points[name]
+            self.timeseries[name].append(point)
+            for exporter in self.exporters.get(name, ()):
+                exporter.write(point)
+            self.atoms += len(point['atoms'])
+        self.steps += 1
+        if self.progress is not None:
+            self.progress(self, timestep, points)
+
+
+def _get_content(path):
+    # The body of a response from the REST API
+    return default_client.get(path).content
+
+
+def _decode_snapshot(body, timed=False):
+    # Runs in the worker processes of an Experiment. Only the fields that a
+    # PointInTime keeps are sent back, as they are much faster to transfer.
+    # Metrics recorded in a worker would be lost, so the time spent decoding
+    # is sent back too, and recorded by the sink thread.
+    start = time.time()
+    atoms = json.loads(body)['result']['atoms']
+    seconds = time.time() - start if timed else None
+    return [{'handle': atom['handle'],
+             'attentionvalue': {'sti': atom['attentionvalue']['sti']}}
+            for atom in atoms], seconds
+
+
+def print_progress(experiment, timestep, points):
+    """
+    Progress callback for Experiment that prints the number of atoms
+    captured in each snapshot and the throughput so far
+    """
+    counts = ', '.join('{0} atoms in {1}'.format(len(point['atoms']),
+                                                 name.replace('_', ' '))
+                       for name, point in sorted(points.items()))
+    throughput = experiment.throughput()
+    print("Timestep {0}: {1} ({2:.1f} steps/s, {3:.0f} atoms/s)"
+          .format(timestep, counts, throughput['steps_per_second'] or 0,
+                  throughput['atoms_per_second'] or 0))
+
+
 def relex(sentence, display=True, concise=True):
     """
     :param sentence: The sentence to send to RelEx for parsing
@@ -409,19 +1032,106 @@ def to_logic(sentence, clear=True, display=True):
         print scheme("(cog-outgoing-set (car (cog-get-atoms 'SetLink)))")
 
 
+class ServerTimeoutError(Exception):
+    """
+    Raised when a server does not become ready, or does not stop, within
+    OPENCOG_STARTUP_TIMEOUT seconds
+    """
+    pass
+
+
+def wait_until(condition, description, timeout=OPENCOG_STARTUP_TIMEOUT,
+               delay=OPENCOG_POLL_DELAY, max_delay=OPENCOG_POLL_MAX_DELAY):
+    """
+    Poll a condition until it is true, doubling the delay between polls
+
+    Parameters:
+    condition (required) Function that returns True when the wait is over
+    description (required) Description of what is being waited for, used in
+      the error message
+    timeout (optional) Maximum number of seconds to wait
+    delay (optional) Initial delay between polls in seconds
+    max_delay (optional) Maximum delay between polls in seconds
+
+    Returns the number of seconds that were waited. Raises a
+    ServerTimeoutError if the condition is still false after 'timeout'
+    seconds.
+    """
+    start = time.time()
+    while not condition():
+        elapsed = time.time() - start
+        if elapsed >= timeout:
+            raise ServerTimeoutError(
+                "Timed out after {0:.1f} seconds waiting for {1}"
+                .format(elapsed, description))
+        sleep(min(delay, timeout - elapsed))
+        delay = min(delay * 2, max_delay)
+    return time.time() - start
+
+
+def port_open(host, port):
+    """
+    Returns True if a TCP connection can be made to a port
+    """
+    try:
+        connection = socket.create_connection((host, port), timeout=1)
+    except (socket.error, socket.timeout):
+        return False
+    connection.close()
+    return True
+
+
+def restapi_ready(uri=None):
+    """
+    Returns True if the REST API responds to requests
+
+    Parameters:
+    uri (optional) Base URI of the REST API. Defaults to the URI of the
+      default client.
+    """
+    try:
+        # Sent without the default client's retries, so that each poll is a
+        # single attempt
+        response = get((uri or default_client.uri) + 'atoms?limit=1',
+                       timeout=1)
+    except (ConnectionError, Timeout):
+        return False
+    return response.ok
+
+
+def cogserver_ready(port=COGSERVER_PORT):
+    """
+    Returns True if the CogServer accepts connections on its shell port
+    """
+    return port_open(IP_ADDRESS, port)
+
+
 class RelExServer(object):
     """
     RelEx server daemon
     """
     def __init__(self):
         self.process = None
+        self.startup_time = None
+
+    @staticmethod
+    def ready():
+        """
+        Returns True if the RelEx server accepts connections on its socket API
+        """
+        return port_open(IP_ADDRESS, RELEX_PORT)
 
     def start(self):
         """
         Bootstraps the RelEx daemon so that it will run in the
          background with the socket API so that further commands can be issued by
          sending them to the socket API
+
+        Returns as soon as the socket API accepts connections, with the number
+        of seconds that startup took. Raises NotImplementedError when not
+        using Vagrant.
         """
+        start = time.time()
         self.stop()
         # Start the OpenCog CogServer daemon
         if USE_VAGRANT:
@@ -430,13 +1140,20 @@ class RelExServer(object):
             self.process.daemon = True
             self.process.start()
         else:
-            assert "Currently only implemented for Vagrant"
+            raise NotImplementedError("The RelEx server can currently only "
+                                      "be managed with Vagrant")
 
-        sleep(OPENCOG_INIT_DELAY)
+        wait_until(self.ready, "the RelEx server to start")
+
+        self.startup_time = time.time() - start
+        return self.startup_time
 
     def stop(self):
         """
         Terminate the RelEx daemon
+
+        Returns as soon as the socket API stops accepting connections. Raises
+        NotImplementedError when not using Vagrant.
         """
         if USE_VAGRANT:
             self.process = Process(target=run_vagrant_command,
@@ -444,58 +1161,135 @@ class RelExServer(object):
             self.process.daemon = True
             self.process.start()
         else:
-            assert "Currently only implemented for Vagrant"
+            raise NotImplementedError("The RelEx server can currently only "
+                                      "be managed with Vagrant")
+
+        wait_until(lambda: not self.ready(), "the RelEx server to stop")
 
 
 class Server(object):
     """
     OpenCog server daemon
-    """
-    def __init__(self):
+
+    Several servers can run at the same time on different ports, for example
+    to run experiments in parallel (see sweep.py).
+
+    Parameters:
+    cogserver_port (optional) Port of the CogServer shell. Defaults to
+      COGSERVER_PORT.
+    rest_port (optional) Port of the REST API. Defaults to PORT.
+    workdir (optional) Folder for the files written by this server, such as
+      its log file. Defaults to None, which uses the CogServer configuration.
+    """
+    def __init__(self, cogserver_port=COGSERVER_PORT, rest_port=PORT,
+                 workdir=None):
+        self.cogserver_port = int(cogserver_port)
+        self.rest_port = int(rest_port)
+        self.workdir = workdir
         self.process = None
+        self.startup_time = None
+        # Only the server with the default ports and configuration may stop
+        # a CogServer that it did not start itself with 'pkill cogserver'
+        self.default = self.cogserver_port == COGSERVER_PORT and \
+            self.rest_port == int(PORT) and workdir is None
+
+    @property
+    def uri(self):
+        """
+        Base URI of the REST API of this server
+        """
+        return 'http://{0}:{1}/api/v1.1/'.format(IP_ADDRESS, self.rest_port)
+
+    def ready(self):
+        """
+        Returns True if the REST API of this server responds to requests
+        """
+        return restapi_ready(self.uri)
 
     def start(self):
         """
         Bootstraps the OpenCog CogServer daemon so that it will run in the
          background with the REST API so that further commands can be issued by
          sending them to the REST API
+
+        Returns as soon as the REST API responds, with the number of seconds
+        that startup took.
         """
+        start = time.time()
         self.stop()
         # Start the OpenCog CogServer daemon
         if USE_VAGRANT:
             self.process = Process(target=run_vagrant_command,
-                                   args=(VAGRANT_ID, OPENCOG_COGSERVER_START))
+                                   args=(VAGRANT_ID, self._command()))
             self.process.daemon = True
             self.process.start()
 
         else:
-            os.chdir(OPENCOG_SUBFOLDER)
-            Popen([OPENCOG_COGSERVER_START])
-
-        sleep(OPENCOG_INIT_DELAY)
-
-        # Start the OpenCog REST API
+            if self.workdir is not None and not os.path.isdir(self.workdir):
+                os.makedirs(self.workdir)
+            self.process = Popen(shlex.split(self._command()),
+                                 cwd=OPENCOG_SUBFOLDER)
+
+        wait_until(lambda: cogserver_ready(self.cogserver_port),
+                   "the CogServer to start on port {0}"
+                   .format(self.cogserver_port))
+
+        # Start the OpenCog REST API. The port is only passed to
+        # restapi.Start for additional servers, as the stock REST API module
+        # does not accept it.
+        if self.cogserver_port == COGSERVER_PORT and \
+                self.rest_port == int(PORT):
+            restapi_start = OPENCOG_RESTAPI_START
+        else:
+            restapi_start = OPENCOG_RESTAPI_START_TEMPLATE.format(
+                cogserver_port=self.cogserver_port, rest_port=self.rest_port)
         if USE_VAGRANT:
-            self.process = Process(target=run_vagrant_command,
-                                   args=(VAGRANT_ID, OPENCOG_RESTAPI_START))
-            self.process.daemon = True
-            self.process.start()
+            process = Process(target=run_vagrant_command,
+                              args=(VAGRANT_ID, restapi_start))
+            process.daemon = True
+            process.start()
         else:
-            os.system(OPENCOG_RESTAPI_START)
+            os.system(restapi_start)
 
-        sleep(OPENCOG_INIT_DELAY)
+        wait_until(self.ready, "the REST API to start on port {0}"
+                   .format(self.rest_port))
 
-    @staticmethod
-    def stop():
+        self.startup_time = time.time() - start
+        return self.startup_time
+
+    def stop(self):
         """
         Terminate the OpenCog CogServer daemon
+
+        Returns as soon as the CogServer stops accepting connections.
         """
         if USE_VAGRANT:
             try:
-                shell('shutdown')
-                sleep(OPENCOG_INIT_DELAY)
+                CogServerClient(self.uri, retries=0).shell('shutdown')
             except ConnectionError:
                 pass
-        else:
+        elif isinstance(self.process, Popen):
+            if self.process.poll() is None:
+                self.process.terminate()
+                self.process.wait()
+        elif self.default:
+            # A CogServer that was not started by this object
             os.system(OPENCOG_COGSERVER_STOP)
-            sleep(OPENCOG_INIT_DELAY)
+        else:
+            # Other servers may be running side by side, so only the
+            # CogServer started with this shell port is stopped
+            os.system(OPENCOG_COGSERVER_STOP_TEMPLATE.format(
+                cogserver_port=self.cogserver_port))
+        self.process = None
+
+        wait_until(lambda: not cogserver_ready(self.cogserver_port),
+                   "the CogServer to stop on port {0}"
+                   .format(self.cogserver_port))
+
+    def _command(self):
+        arguments = OPENCOG_COGSERVER_ARGS
+        if self.workdir is not None:
+            arguments += ' ' + OPENCOG_COGSERVER_LOG_ARGS
+        return OPENCOG_COGSERVER_START + ' ' + arguments.format(
+            cogserver_port=self.cogserver_port,
+            workdir=os.path.abspath(self.workdir or '.'))
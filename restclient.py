@@ -0,0 +1,662 @@
+"""
+HTTP transport for the OpenCog REST API
+
+Keeps a pool of keep-alive connections open to the REST API, so that the many
+calls made by an experiment loop do not each pay for a new TCP connection.
+
+See README.md for documentation and instructions.
+"""
+
+from configuration import *
+from requests.adapters import HTTPAdapter
+import re
+import time
+import threading
+import metrics
+from decimal import Decimal
+from itertools import islice
+
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    from urllib3.util.retry import Retry
+
+# A faster JSON decoder is used for response bodies when one is installed
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = None
+
+# Written between the responses of the commands in a Scheme batch, and in
+# front of the response of a command that raised an error
+SCHEME_BATCH_DELIMITER = '#<end-of-batch-command>'
+SCHEME_BATCH_ERROR = '#<batch-command-error>'
+
+# Fields that a projected atom query can return without downloading the rest
+# of each atom, by evaluating a Scheme expression that lists only them
+PROJECTED_FIELDS = ('handle', 'sti')
+
+# Matches each (handle sti) pair in the response to a projected atom query
+_PROJECTION_PAIR = re.compile(r'\((\d+) (-?[0-9.eE+-]+)\)')
+
+# Scheme forms that are only valid at the top level, and so cannot be wrapped
+# inside the error handler of each command of a batch
+SCHEME_TOP_LEVEL_FORMS = ('(define', '(use-modules', '(load ')
+
+
+class SchemeBatchError(Exception):
+    """
+    Raised when one or more commands in a Scheme batch failed
+
+    Attributes:
+    failures List of (index, command, response) tuples for each command that
+      failed, in the order they were submitted
+    responses List of the responses to every command in the batch
+    """
+    def __init__(self, failures, responses):
+        index, command, response = failures[0]
+        message = "{0} of {1} Scheme commands failed; first failure was " \
+                  "command {2} {3!r}: {4}".format(len(failures),
+                                                  len(responses),
+                                                  index, command, response)
+        super(SchemeBatchError, self).__init__(message)
+        self.failures = failures
+        self.responses = responses
+
+
+class SchemeBatch(object):
+    """
+    Queue of Scheme commands that are sent in a single request when the batch
+    is exited
+
+    Returned by CogServerClient.batched(). The responses to each command are
+    available in 'responses' after the batch has been sent. A batch entered
+    inside another batch joins it: its commands are queued in order with
+    those of the outer batch, and sent when the outer batch exits.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.responses = None
+        self.outer = None
+        self.nested = []
+
+    def __enter__(self):
+        self.outer = getattr(self.client._local, 'batch', None)
+        self.client._local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.client._local.batch = self.outer
+        if exc_type is not None:
+            return
+        if self.outer is not None:
+            self.outer.nested.append((self, len(self.outer.commands)))
+            self.outer.commands.extend(self.commands)
+        else:
+            self._set_responses(self.client.scheme_batch(self.commands))
+
+    def _set_responses(self, responses):
+        self.responses = responses
+        for batch, start in self.nested:
+            batch._set_responses(
+                responses[start:start + len(batch.commands)])
+
+
+class CogServerClient(object):
+    """
+    Client for the OpenCog REST API with a persistent, pooled HTTP session
+
+    Parameters:
+    uri (optional) Base URI of the REST API. Defaults to the 'uri' defined in
+      configuration.py
+    pool_size (optional) Maximum number of connections kept open to the REST
+      API. Should be at least the number of threads sharing this client.
+    timeout (optional) Tuple of (connect, read) timeouts in seconds
+    retries (optional) Number of times a failed connection is retried
+    backoff (optional) Backoff factor in seconds between retries
+    """
+    def __init__(self, uri=uri, pool_size=REST_POOL_SIZE,
+                 timeout=(REST_CONNECT_TIMEOUT, REST_READ_TIMEOUT),
+                 retries=REST_MAX_RETRIES, backoff=REST_BACKOFF_FACTOR):
+        self.uri = uri
+        self.timeout = timeout
+
+        # GET requests are retried after connection errors, read errors and
+        # gateway errors. urllib3 only retries connection errors for POST
+        # requests, which never reached the server, as shell and Scheme
+        # commands are not idempotent
+        retry = Retry(total=retries,
+                      connect=retries,
+                      read=retries,
+                      backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+
+        self.session = Session()
+        self.session.headers.update(headers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Holds the SchemeBatch that is active in each thread, if any
+        self._local = threading.local()
+
+    def get(self, path):
+        """
+        Send a GET request to the REST API
+
+        Parameters:
+        path (required) Path of the resource, relative to the base URI
+        """
+        if not metrics.enabled:
+            return self.session.get(self.uri + path, timeout=self.timeout)
+
+        start = time.time()
+        response = self.session.get(self.uri + path, timeout=self.timeout)
+        metrics.record('http.get', time.time() - start,
+                       received=len(response.content))
+        return response
+
+    def post(self, path, data):
+        """
+        Send a POST request with a JSON body to the REST API
+
+        Parameters:
+        path (required) Path of the resource, relative to the base URI
+        data (required) Dictionary that will be sent as the JSON body
+        """
+        body = json.dumps(data)
+        if not metrics.enabled:
+            return self.session.post(self.uri + path, data=body,
+                                     timeout=self.timeout)
+
+        start = time.time()
+        response = self.session.post(self.uri + path, data=body,
+                                     timeout=self.timeout)
+        metrics.record('http.post', time.time() - start,
+                       sent=len(body), received=len(response.content))
+        return response
+
+    @staticmethod
+    def decode(response):
+        """
+        Decode the JSON body of a response
+        """
+        if not metrics.enabled:
+            return _loads(response)
+
+        start = time.time()
+        result = _loads(response)
+        metrics.record('json.decode', time.time() - start)
+        return result
+
+    def shell(self, command):
+        """
+        Send a command to the CogServer shell
+        """
+        self.post('shell', {'command': command + '\n'})
+
+    def scheme(self, command):
+        """
+        Send a Scheme command to the Scheme interpreter
+
+        Inside a batched() block, the command is queued instead and None is
+        returned.
+        """
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            batch.commands.append(command)
+            return None
+
+        return self._send_scheme(command)
+
+    def _send_scheme(self, command):
+        result = self.post('scheme', {'command': command + '\n'})
+        return self.decode(result)['response']
+
+    def scheme_batch(self, commands):
+        """
+        Send a list of Scheme commands in as few requests as possible
+
+        The commands are wrapped in a single (begin ...) expression, with each
+        one guarded by its own error handler so that a failing command does
+        not prevent the rest from running. Commands that are only valid at
+        the top level, such as (define ...), are sent on their own, followed
+        by a marker that is only displayed if they did not raise an error.
+
+        Returns a list of the responses to each command. Raises a
+        SchemeBatchError identifying the failed commands if any of them
+        raised an error. Inside a batched() block, the commands are queued
+        instead and None is returned.
+
+        Parameters:
+        commands (required) List of Scheme commands
+        """
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            batch.commands.extend(commands)
+            return None
+
+        responses = []
+        queued = []
+        for command in commands:
+            if command.lstrip().startswith(SCHEME_TOP_LEVEL_FORMS):
+                responses.extend(self._send_scheme_batch(queued))
+                queued = []
+                responses.append(self._send_top_level_scheme(command))
+            else:
+                queued.append(command)
+        responses.extend(self._send_scheme_batch(queued))
+
+        failures = [(index, command, response)
+                    for index, (command, response)
+                    in enumerate(zip(commands, responses))
+                    if response.startswith(SCHEME_BATCH_ERROR)]
+        if failures:
+            raise SchemeBatchError(failures, responses)
+
+        return responses
+
+    def _send_scheme_batch(self, commands):
+        """
+        Send a list of commands wrapped in a single (begin ...) expression and
+        split the combined response into the response to each command
+        """
+        if not commands:
+            return []
+
+        guarded = []
+        for command in commands:
+            guarded.append(
+                '(display (catch #t (lambda () {0}) (lambda (key . args) '
+                '(simple-format #f "{1} ~A ~S" key args))))'
+                '(display "{2}")'.format(command, SCHEME_BATCH_ERROR,
+                                         SCHEME_BATCH_DELIMITER))
+        response = self._send_scheme('(begin ' + '\n'.join(guarded) + ')')
+
+        responses = [segment.strip() for segment
+                     in response.split(SCHEME_BATCH_DELIMITER)[:-1]]
+
+        # If the combined expression could not be read, for example because
+        # of unbalanced parentheses, the remaining commands did not run
+        for command in commands[len(responses):]:
+            responses.append(SCHEME_BATCH_ERROR + ' ' + response.strip())
+
+        return responses
+
+    def _send_top_level_scheme(self, command):
+        """
+        Send a command that is only valid at the top level, and return its
+        response, marked as an error if it did not run to completion
+        """
+        # An error aborts the (begin ...) expression, which is spliced into
+        # the top level, before the delimiter is displayed
+        response = self._send_scheme('(begin {0}\n(display "{1}"))'.format(
+            command, SCHEME_BATCH_DELIMITER))
+        if SCHEME_BATCH_DELIMITER not in response:
+            return SCHEME_BATCH_ERROR + ' ' + response.strip()
+        return response.split(SCHEME_BATCH_DELIMITER)[0].strip()
+
+    def batched(self):
+        """
+        Context manager that queues the Scheme commands sent from this thread
+        and sends them with scheme_batch() when the block exits
+
+        Example:
+            with client.batched() as batch:
+                client.scheme('(cog-set-af-boundary! 10)')
+                client.scheme('(clear)')
+            print batch.responses
+        """
+        return SchemeBatch(self)
+
+    def get_atoms(self, query=None, stream=False):
+        """
+        Retrieve a list of atoms in JSON format from the REST API
+
+        Parameters:
+        query (optional) Query string to append to the request, for example
+          'filterby=attentionalfocus'
+        stream (optional) If True, returns an iterator that parses the atoms
+          one at a time as the response arrives, so that the whole response
+          is never held in memory. Requires ijson.
+        """
+        path = 'atoms' if query is None else 'atoms?' + query
+        if stream:
+            return self._stream_atoms(path)
+        return self.decode(self.get(path))['result']['atoms']
+
+    def query_atoms(self, attentional_focus=False, sti_min=None,
+                    sti_max=None, atom_type=None, handles=None, limit=None,
+                    offset=None, fields=None, stream=False):
+        """
+        Retrieve the atoms that match a set of filters, with only the
+        requested fields
+
+        Filters are sent to the REST API as query parameters where it
+        supports them (atom type, STI range or attentional focus, and limit),
+        and applied to the response otherwise.
+
+        If 'fields' only contains fields in PROJECTED_FIELDS, the atoms are
+        instead listed by a Scheme expression that returns just their handle
+        and STI, which is much smaller than the JSON representation. The
+        returned atoms then have the form
+          {'handle': ..., 'attentionvalue': {'sti': ...}}
+        so that they can still be passed to create_point(). The 'sti' field
+        is returned in that form whichever way the atoms are listed.
+
+        Parameters:
+        attentional_focus (optional) If True, only atoms in the attentional
+          focus are returned
+        sti_min, sti_max (optional) Inclusive bounds of the STI of the atoms
+        atom_type (optional) Type of the atoms, for example 'ConceptNode'
+        handles (optional) Collection of handles of the atoms
+        limit (optional) Maximum number of atoms to return
+        offset (optional) Number of matching atoms to skip
+        fields (optional) Fields of each atom to return. Defaults to None,
+          which returns every field.
+        stream (optional) If True, the JSON response is parsed one atom at a
+          time as it arrives. Requires ijson.
+
+        Returns an iterable of atoms.
+        """
+        projected = fields is not None and \
+            set(fields) <= set(PROJECTED_FIELDS)
+        if projected:
+            atoms = self._query_projected_atoms(attentional_focus, sti_min,
+                                                sti_max, atom_type)
+            sti_filtered = True
+        else:
+            parameters = []
+            sti_filtered = False
+            if attentional_focus:
+                parameters.append('filterby=attentionalfocus')
+            elif sti_min is not None or sti_max is not None:
+                parameters.append('filterby=stirange')
+                if sti_min is not None:
+                    parameters.append('stimin={0}'.format(sti_min))
+                if sti_max is not None:
+                    parameters.append('stimax={0}'.format(sti_max))
+                sti_filtered = True
+            if atom_type is not None:
+                parameters.append('type={0}'.format(atom_type))
+
+            # The limit can only be applied by the REST API when every other
+            # filter has been applied before it
+            if limit is not None and handles is None and \
+                    (sti_filtered or (sti_min is None and sti_max is None)):
+                parameters.append('limit={0}'.format(limit + (offset or 0)))
+
+            atoms = self.get_atoms('&'.join(parameters) or None,
+                                   stream=stream)
+
+        if not sti_filtered and (sti_min is not None or sti_max is not None):
+            atoms = (atom for atom in atoms
+                     if (sti_min is None or
+                         atom['attentionvalue']['sti'] >= sti_min) and
+                     (sti_max is None or
+                      atom['attentionvalue']['sti'] <= sti_max))
+        if handles is not None:
+            handles = set(handles)
+            atoms = (atom for atom in atoms if atom['handle'] in handles)
+        if offset is not None or limit is not None:
+            start = offset or 0
+            atoms = islice(atoms, start,
+                           None if limit is None else start + limit)
+        if fields is not None and not projected:
+            atoms = (_select_fields(atom, fields) for atom in atoms)
+
+        return atoms if stream else list(atoms)
+
+    def _query_projected_atoms(self, attentional_focus, sti_min, sti_max,
+                               atom_type):
+        """
+        List the handle and STI of the atoms that match a set of filters with
+        a single Scheme expression
+        """
+        if attentional_focus:
+            source = '(cog-af)'
+            if atom_type is not None:
+                source = "(filter (lambda (a) (cog-subtype? '{0} " \
+                         "(cog-type a))) {1})".format(atom_type, source)
+        else:
+            source = "(cog-get-atoms '{0} #t)".format(atom_type or 'Atom')
+
+        bounds = []
+        if sti_min is not None:
+            bounds.append('(>= s {0})'.format(sti_min))
+        if sti_max is not None:
+            bounds.append('(<= s {0})'.format(sti_max))
+        if bounds:
+            source = '(filter (lambda (a) (let ((s (cog-av-sti a))) ' \
+                     '(and {0}))) {1})'.format(' '.join(bounds), source)
+
+        # Sent directly, as it is a read that must not be queued by a
+        # batched() block
+        response = self._send_scheme('(map (lambda (a) (list (cog-handle a) '
+                                     '(cog-av-sti a))) {0})'.format(source))
+        return [{'handle': int(handle),
+                 'attentionvalue': {'sti': float(sti) if '.' in sti
+                                    else int(sti)}}
+                for handle, sti in _PROJECTION_PAIR.findall(response)]
+
+    def iter_atoms(self, path='atoms', page_size=None, cursor=0,
+                   prefetch=True):
+        """
+        Iterate over the atoms listed in a REST API response without holding
+        the whole listing in memory
+
+        Without a page size, a single response is parsed one atom at a time
+        as it arrives, which requires ijson. With a page size, the atoms are
+        requested one page at a time; see AtomPages.
+
+        Parameters:
+        path (optional) Path of the resource, relative to the base URI
+        page_size (optional) Number of atoms requested at a time
+        cursor (optional) Number of atoms to skip, for example the cursor of
+          an earlier AtomPages iterator whose connection was dropped
+        prefetch (optional) If True, the next page is requested on a
+          background thread while the current one is being iterated over
+        """
+        if page_size is not None:
+            return AtomPages(self, path, page_size, cursor, prefetch)
+        atoms = self._stream_atoms(path)
+        return islice(atoms, cursor, None) if cursor else atoms
+
+    def _stream_atoms(self, path):
+        # Parses the atoms in a single response as it arrives
+        try:
+            import ijson
+        except ImportError:
+            raise ImportError("Streaming JSON decoding is not enabled; to "
+                              "enable, install ijson")
+
+        start = time.time()
+        timed = metrics.enabled
+        response = self.session.get(self.uri + path, timeout=self.timeout,
+                                    stream=True)
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            if _ijson_version(ijson) >= (3, 1):
+                atoms = ijson.items(response.raw, 'result.atoms.item',
+                                    use_float=True)
+            else:
+                # Versions of ijson before 3.1 return non-integer numbers as
+                # Decimal objects, and the C backend of some of them crashes
+                # when given an unknown option
+                atoms = (_floats(atom) for atom in
+                         ijson.items(response.raw, 'result.atoms.item'))
+            for atom in atoms:
+                yield atom
+        finally:
+            # The response is decoded as it is received, so the request is
+            # recorded from when it was sent until the last atom was parsed
+            if timed:
+                metrics.record('http.get', time.time() - start,
+                               received=response.raw.tell())
+            response.close()
+
+    def close(self):
+        """
+        Close all of the pooled connections
+        """
+        self.session.close()
+
+
+class AtomPages(object):
+    """
+    Iterator over the atoms listed by the REST API, requested one page at a
+    time with the 'limit' and 'offset' query parameters
+
+    Returned by CogServerClient.iter_atoms() when a page size is given. Only
+    one page is held in memory at a time (two while the next one is being
+    prefetched). 'cursor' counts the atoms returned so far: if a request
+    fails, for example because the connection was dropped, iteration can be
+    resumed with a new iterator starting from it:
+
+        pages = client.iter_atoms(page_size=10000)
+        try:
+            for atom in pages:
+                process(atom)
+        except ConnectionError:
+            for atom in client.iter_atoms(page_size=10000,
+                                          cursor=pages.cursor):
+                process(atom)
+
+    If the server ignores the offset, which is detected when a page starts
+    with the same atom as the previous one, the rest of the atoms are
+    retrieved with a single request instead.
+
+    Parameters:
+    client (required) The CogServerClient that sends the requests
+    path (optional) Path of the resource, relative to the base URI
+    page_size (optional) Number of atoms requested at a time
+    cursor (optional) Number of atoms to skip
+    prefetch (optional) If True, the next page is requested on a background
+      thread while the current one is being iterated over
+    """
+    def __init__(self, client, path='atoms', page_size=REST_PAGE_SIZE,
+                 cursor=0, prefetch=True):
+        if page_size < 1:
+            raise ValueError("The page size must be at least 1")
+        self.client = client
+        self.path = path
+        self.page_size = page_size
+        self.cursor = cursor
+        self.prefetch = prefetch
+        self.pages = 0
+
+    def __iter__(self):
+        return self._atoms()
+
+    def _atoms(self):
+        offset = self.cursor
+        pending = self._request(offset)
+        first_handle = None
+
+        while True:
+            page = pending.get()
+            self.pages += 1
+            if page and page[0]['handle'] == first_handle:
+                for atom in self._remainder():
+                    yield atom
+                return
+            if page:
+                first_handle = page[0]['handle']
+
+            complete = len(page) < self.page_size
+            offset += len(page)
+            if not complete and self.prefetch:
+                pending = self._request(offset)
+
+            for atom in page:
+                self.cursor += 1
+                yield atom
+
+            if complete:
+                return
+            if not self.prefetch:
+                pending = self._request(offset)
+
+    def _request(self, offset):
+        separator = '&' if '?' in self.path else '?'
+        path = '{0}{1}limit={2}&offset={3}'.format(self.path, separator,
+                                                   self.page_size, offset)
+        request = _PageRequest(self.client, path)
+        if self.prefetch:
+            request.start()
+        return request
+
+    def _remainder(self):
+        # Used when the server does not support paging
+        atoms = self.client.decode(self.client.get(self.path))
+        for atom in atoms['result']['atoms'][self.cursor:]:
+            self.cursor += 1
+            yield atom
+
+
+class _PageRequest(threading.Thread):
+    # Retrieves one page of atoms, on a background thread if started
+    def __init__(self, client, path):
+        super(_PageRequest, self).__init__()
+        self.daemon = True
+        self.client = client
+        self.path = path
+        self.atoms = None
+        self.error = None
+
+    def run(self):
+        try:
+            response = self.client.get(self.path)
+            self.atoms = self.client.decode(response)['result']['atoms']
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.ident is None:
+            self.run()
+        else:
+            self.join()
+        if self.error is not None:
+            raise self.error
+        return self.atoms
+
+
+def _loads(response):
+    if fast_json is not None:
+        return fast_json.loads(response.content)
+    return response.json()
+
+
+def _floats(value):
+    if isinstance(value, dict):
+        return dict((key, _floats(item)) for key, item in value.items())
+    elif isinstance(value, list):
+        return [_floats(item) for item in value]
+    elif isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _ijson_version(ijson):
+    # The (major, minor) version of the ijson module
+    try:
+        return tuple(int(part) for part in ijson.__version__.split('.')[:2])
+    except (AttributeError, ValueError):
+        return (0, 0)
+
+
+def _select_fields(atom, fields):
+    # Keeps the requested fields of an atom in the JSON format of the REST
+    # API, where 'sti' selects the STI of its attention value
+    selected = {}
+    for field in fields:
+        if field == 'sti':
+            selected.setdefault('attentionvalue',
+                                {'sti': atom['attentionvalue']['sti']})
+        else:
+            selected[field] = atom[field]
+    return selected
@@ -0,0 +1,242 @@
+"""
+Deduplicated store for the Scheme representations of points in time
+
+With scheme=True, every point in time carries the whole output of (cog-af) or
+(cog-prt-atomspace), which is almost the same from one timestep to the next.
+A SchemeSnapshotStore splits each dump into its top-level expressions, one
+per atom, stores each distinct expression once under the SHA-1 hash of its
+text, and keeps each snapshot as a list of references to its expressions.
+The original text is rebuilt exactly when it is needed.
+
+Example:
+    store = SchemeSnapshotStore()
+    experiment = Experiment([importance_diffusion, importance_updating],
+                            scheme=True, scheme_store=store)
+    timeseries = experiment.run(num_steps=100)
+    print str(timeseries['atomspace'][-1]['scheme'])
+    print store.compression_ratio()
+
+See README.md for documentation and instructions.
+"""
+
+import re
+import hashlib
+from array import array
+
+# Tokens that change the nesting depth of a Scheme expression, and the tokens
+# whose parentheses do not: strings, comments and character literals
+_TOKEN = re.compile(r'"(?:[^"\\]|\\[\s\S])*"|;[^\n]*|#\\[\s\S]|[()]')
+_WHITESPACE = re.compile(r'\s*')
+
+
+def split_expressions(text):
+    """
+    Split Scheme text into its top-level expressions
+
+    Each expression keeps the whitespace that follows it, and any text
+    outside of an expression is kept with the expression after it, so that
+    joining the list gives back the original text.
+    """
+    chunks = []
+    start = 0
+    depth = 0
+    for match in _TOKEN.finditer(text):
+        token = match.group()
+        if token == '(':
+            depth += 1
+        elif token == ')' and depth:
+            depth -= 1
+            if not depth:
+                end = _WHITESPACE.match(text, match.end()).end()
+                chunks.append(text[start:end])
+                start = end
+    if start < len(text):
+        chunks.append(text[start:])
+    return chunks
+
+
+def _digest(text):
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).digest()
+
+
+class SchemeSnapshot(object):
+    """
+    Reference to a snapshot in a SchemeSnapshotStore, which takes the place
+    of the Scheme text in a point in time
+
+    str(snapshot) and snapshot.text rebuild the text, so that the CSV
+    exporters write it unchanged. Snapshots of the same text compare equal.
+    """
+    __slots__ = ('store', 'key')
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+
+    @property
+    def text(self):
+        return self.store.get(self.key)
+
+    def digests(self):
+        """
+        Return the hexadecimal SHA-1 hashes of the expressions of the
+        snapshot, in order
+        """
+        return self.store.digests(self.key)
+
+    def __str__(self):
+        return self.text
+
+    def __len__(self):
+        return self.store.length(self.key)
+
+    def __eq__(self, other):
+        if isinstance(other, SchemeSnapshot):
+            return self.store is other.store and self.key == other.key
+        if isinstance(other, basestring):
+            return self.text == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'SchemeSnapshot(key={0})'.format(self.key)
+
+    def __getstate__(self):
+        return self.store, self.key
+
+    def __setstate__(self, state):
+        self.store, self.key = state
+
+
+class SchemeSnapshotStore(object):
+    """
+    Stores Scheme snapshots as references to deduplicated expressions
+
+    Each distinct expression is kept once, whichever snapshots it appears in,
+    and a snapshot whose text was already stored is not stored again.
+    'original_bytes' counts the text of every snapshot that was added, and
+    'stored_bytes' the distinct expressions plus the references to them.
+    """
+    def __init__(self):
+        self.expressions = []
+        self.snapshots = []
+        self.added = 0
+        self.original_bytes = 0
+        self.expression_bytes = 0
+        self._expression_ids = {}
+        self._snapshot_keys = {}
+        self._lengths = []
+
+    def add(self, text):
+        """
+        Store the Scheme text of a snapshot
+
+        Returns a SchemeSnapshot that references it, or None if 'text' is
+        None.
+        """
+        if text is None:
+            return None
+        self.added += 1
+        self.original_bytes += len(text)
+
+        digest = _digest(text)
+        key = self._snapshot_keys.get(digest)
+        if key is None:
+            references = array('L')
+            for expression in split_expressions(text):
+                references.append(self._expression_id(expression))
+            key = len(self.snapshots)
+            self.snapshots.append(references)
+            self._lengths.append(len(text))
+            self._snapshot_keys[digest] = key
+        return SchemeSnapshot(self, key)
+
+    def compact(self, point):
+        """
+        Return a copy of a PointInTime whose Scheme text is replaced by a
+        SchemeSnapshot of this store
+        """
+        if isinstance(point['scheme'], SchemeSnapshot):
+            return point
+        compacted = dict(point)
+        compacted['scheme'] = self.add(point['scheme'])
+        return compacted
+
+    def get(self, key):
+        """
+        Return the exact Scheme text of a snapshot
+        """
+        expressions = self.expressions
+        return ''.join([expressions[index][1]
+                        for index in self.snapshots[key]])
+
+    def digests(self, key):
+        """
+        Return the hexadecimal SHA-1 hashes of the expressions of a
+        snapshot, in order
+        """
+        expressions = self.expressions
+        return [expressions[index][0].encode('hex')
+                for index in self.snapshots[key]]
+
+    def expression(self, digest):
+        """
+        Return the text of an expression from its hexadecimal SHA-1 hash
+        """
+        return self.expressions[
+            self._expression_ids[digest.decode('hex')]][1]
+
+    def length(self, key):
+        """
+        Return the length of the Scheme text of a snapshot
+        """
+        return self._lengths[key]
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    @property
+    def stored_bytes(self):
+        references = sum(len(snapshot) * snapshot.itemsize
+                         for snapshot in self.snapshots)
+        return self.expression_bytes + references
+
+    def compression_ratio(self):
+        """
+        Return the size of the text of every snapshot that was added,
+        divided by the size of the store, or None if it is empty
+        """
+        stored = self.stored_bytes
+        return float(self.original_bytes) / stored if stored else None
+
+    def stats(self):
+        """
+        Return a dictionary with the number of snapshots 'added', the number
+        of distinct 'snapshots' and 'expressions', the 'original_bytes', the
+        'stored_bytes' and the 'compression_ratio'
+        """
+        return {
+            'added': self.added,
+            'snapshots': len(self.snapshots),
+            'expressions': len(self.expressions),
+            'original_bytes': self.original_bytes,
+            'stored_bytes': self.stored_bytes,
+            'compression_ratio': self.compression_ratio()
+        }
+
+    def _expression_id(self, expression):
+        digest = _digest(expression)
+        index = self._expression_ids.get(digest)
+        if index is None:
+            index = len(self.expressions)
+            self.expressions.append((digest, expression))
+            self._expression_ids[digest] = index
+            self.expression_bytes += len(expression)
+        return index
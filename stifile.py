@@ -0,0 +1,426 @@
+"""
+Append-only binary files of the STI of the atoms of a timeseries
+
+A timeseries file is made of three files that share a base name:
+
+- 'name.sti': one fixed-width record per atom at each point in time, with
+  the timestep (32-bit integer), the id of the handle (32-bit unsigned
+  integer) and the STI (64-bit float), little-endian
+- 'name.handles': the handle of each id, one JSON value per line, in order
+  of id
+- 'name.index': one record per point in time, with the timestep (64-bit
+  integer), the position of its first atom record and its number of atom
+  records (64-bit unsigned integers)
+
+Points are written at the end of the files while an experiment is running.
+A point only becomes part of the timeseries once its index record is
+written, which happens after its atom records and handles have been
+written, so that a run that is interrupted leaves a readable file behind.
+
+STIFile memory-maps the files, so that the records of any point in time are
+NumPy views of the file, read from disk only when they are used.
+
+Example:
+    with STIFileWriter('smokes') as writer:
+        experiment = Experiment([importance_diffusion, importance_updating],
+                                capture=['atomspace'],
+                                exporters={'atomspace': [writer]})
+        experiment.run(num_steps=1000)
+
+    series = STIFile('smokes')
+    matrix = series.sti_matrix()
+    records = series.at(500)
+
+See README.md for documentation and instructions.
+"""
+
+import os
+import csv
+import gzip
+import json
+import struct
+from export import FILE_BUFFER_SIZE, MongoTimeseriesExporter
+
+# NumPy is imported the first time it is needed, by _require_numpy()
+numpy = None
+
+_RECORD = struct.Struct('<iId')
+_INDEX = struct.Struct('<qQQ')
+
+# NumPy types of the records, set by _require_numpy()
+RECORD_DTYPE = None
+INDEX_DTYPE = None
+
+
+def _require_numpy():
+    global numpy, RECORD_DTYPE, INDEX_DTYPE
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("NumPy is required for this operation; to "
+                              "enable, install NumPy")
+        RECORD_DTYPE = numpy.dtype([('timestep', '<i4'), ('handle', '<u4'),
+                                    ('sti', '<f8')])
+        INDEX_DTYPE = numpy.dtype([('timestep', '<i8'), ('offset', '<u8'),
+                                   ('count', '<u8')])
+
+
+def _filenames(path):
+    return path + '.sti', path + '.handles', path + '.index'
+
+
+class STIFileWriter(object):
+    """
+    Appends points in time to a timeseries file as they are captured
+
+    If the files already exist, the points are added after those that they
+    hold, and the handles keep their ids. Atom records left after the last
+    indexed point by an interrupted run are discarded.
+
+    Like CSVTimeseriesWriter, it can be used as an exporter of an
+    Experiment.
+
+    Parameters:
+    path (required) The base name of the files, without extension
+    flush_interval (optional) Number of points written between flushes to
+      disk. Points that have not been flushed are lost if the run is
+      interrupted.
+    """
+    def __init__(self, path, flush_interval=1):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.handles = []
+        self.index = {}
+        self.records = 0
+        self.pending = []
+
+        records_name, handles_name, index_name = _filenames(path)
+        self._recover(records_name, handles_name, index_name)
+        self.records_file = open(records_name, 'ab', FILE_BUFFER_SIZE)
+        self.handles_file = open(handles_name, 'ab')
+        self.index_file = open(index_name, 'ab')
+
+    def _recover(self, records_name, handles_name, index_name):
+        # Truncates each file to the part that is referenced by complete
+        # index records, and loads the handles
+        if os.path.exists(index_name):
+            with open(index_name, 'r+b') as infile:
+                data = infile.read()
+                complete = len(data) - len(data) % _INDEX.size
+                infile.truncate(complete)
+            if complete:
+                _, offset, count = _INDEX.unpack_from(data,
+                                                      complete - _INDEX.size)
+                self.records = offset + count
+
+        if os.path.exists(records_name):
+            with open(records_name, 'r+b') as infile:
+                infile.truncate(self.records * _RECORD.size)
+
+        if os.path.exists(handles_name):
+            with open(handles_name, 'r+b') as infile:
+                data = infile.read()
+                complete = data.rfind(b'\n') + 1
+                infile.truncate(complete)
+            self.handles = _load_handles(data[:complete])
+            self.index = dict((handle, handle_id) for handle_id, handle
+                              in enumerate(self.handles))
+
+    def write(self, point):
+        """
+        Append a point in time
+
+        Parameters:
+        point (required) A PointInTime dictionary
+        """
+        self.write_atoms(point['timestep'],
+                         ((atom['handle'], atom['sti'])
+                          for atom in point['atoms']))
+
+    def write_atoms(self, timestep, atoms):
+        """
+        Append a point in time from (handle, sti) pairs
+
+        Parameters:
+        timestep (required) The timestep of the point in time
+        atoms (required) An iterable of (handle, sti) pairs
+        """
+        index = self.index
+        handles = self.handles
+        pack = _RECORD.pack
+        new = []
+        records = []
+        for handle, sti in atoms:
+            handle_id = index.get(handle)
+            if handle_id is None:
+                handle_id = index[handle] = len(handles)
+                handles.append(handle)
+                new.append(handle)
+            records.append(pack(timestep, handle_id, sti))
+
+        self.records_file.write(b''.join(records))
+        if new:
+            self.handles_file.write(''.join(json.dumps(handle) + '\n'
+                                            for handle in new))
+        self.pending.append(_INDEX.pack(timestep, self.records,
+                                        len(records)))
+        self.records += len(records)
+
+        if len(self.pending) >= self.flush_interval:
+            self.flush()
+
+    def write_all(self, timeseries):
+        """
+        Append every point in time of a timeseries
+        """
+        for point in timeseries:
+            self.write(point)
+
+    def flush(self):
+        """
+        Write the points to disk, and then their index records
+        """
+        self.records_file.flush()
+        self.handles_file.flush()
+        if self.pending:
+            self.index_file.write(b''.join(self.pending))
+            self.index_file.flush()
+            self.pending = []
+
+    def rewind(self, timestep):
+        """
+        Discard the points of 'timestep' and of the timesteps after it, so
+        that an experiment resumed from a checkpoint does not write them
+        twice
+
+        The handles of the discarded points keep their ids.
+
+        Parameters:
+        timestep (required) The first timestep to discard
+        """
+        self.flush()
+        with open(_filenames(self.path)[2], 'rb') as infile:
+            data = infile.read()
+        for position in range(0, len(data), _INDEX.size):
+            point_timestep, offset, _ = _INDEX.unpack_from(data, position)
+            if point_timestep >= timestep:
+                break
+        else:
+            return
+
+        # The index is truncated first, so that the points that are left
+        # stay complete if the run is interrupted
+        os.ftruncate(self.index_file.fileno(), position)
+        self.records = offset
+        os.ftruncate(self.records_file.fileno(), offset * _RECORD.size)
+
+    def close(self):
+        """
+        Write the remaining points, and close the files
+        """
+        self.flush()
+        for outfile in (self.records_file, self.handles_file,
+                        self.index_file):
+            outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class STIFile(object):
+    """
+    Memory-mapped reader of a timeseries file written by STIFileWriter
+
+    The records of the points in time are NumPy views of the file with the
+    fields 'timestep', 'handle' (the id of the handle) and 'sti', so that
+    reading a point only reads its records from disk. Handles are mapped to
+    their ids by 'index', and ids to their handles by 'handles'.
+
+    Iterating over the file yields PointInTime dictionaries, so it can be
+    passed anywhere a list of points is accepted. Points that are written
+    after the file was opened are not seen until it is opened again.
+
+    Parameters:
+    path (required) The base name of the files, without extension
+    """
+    def __init__(self, path):
+        _require_numpy()
+        self.path = path
+        records_name, handles_name, index_name = _filenames(path)
+
+        self.points = _map(index_name, INDEX_DTYPE)
+        end = int(self.points['offset'][-1] + self.points['count'][-1]) \
+            if len(self.points) else 0
+        self.records = _map(records_name, RECORD_DTYPE)[:end]
+
+        with open(handles_name, 'rb') as infile:
+            data = infile.read()
+        self.handles = _load_handles(data[:data.rfind(b'\n') + 1])
+        self.index = dict((handle, handle_id)
+                          for handle_id, handle in enumerate(self.handles))
+        self._positions = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        for position in range(len(self.points)):
+            yield self.point(position)
+
+    @property
+    def timesteps(self):
+        """
+        The timestep of each point in time, in the order they were written
+        """
+        return self.points['timestep']
+
+    def slice(self, position):
+        """
+        Return the records of the point in time at a position in the file,
+        as a view of the file
+
+        Parameters:
+        position (required) Index of the point, starting from 0
+        """
+        offset = int(self.points['offset'][position])
+        return self.records[offset:offset + int(self.points['count'][position])]
+
+    def at(self, timestep):
+        """
+        Return the records of the point in time of a timestep, as a view of
+        the file
+        """
+        if self._positions is None:
+            self._positions = dict((int(timestep), position)
+                                   for position, timestep
+                                   in enumerate(self.timesteps))
+        return self.slice(self._positions[timestep])
+
+    def point(self, position):
+        """
+        Return the PointInTime dictionary at a position in the file
+
+        Parameters:
+        position (required) Index of the point, starting from 0
+        """
+        records = self.slice(position)
+        handles = self.handles
+        return {
+            'timestep': int(self.points['timestep'][position]),
+            'atoms': [{'handle': handles[handle_id], 'sti': sti}
+                      for handle_id, sti in zip(records['handle'].tolist(),
+                                                records['sti'].tolist())],
+            'scheme': None
+        }
+
+    def rows(self):
+        """
+        Iterate over (timestep, handle, sti) tuples for every atom at every
+        point in time
+        """
+        handles = self.handles
+        for timestep, handle_id, sti in self.records.tolist():
+            yield timestep, handles[handle_id], sti
+
+    def arrays(self):
+        """
+        Return NumPy views of the timestep, handle id and STI fields of the
+        records, without copying them
+        """
+        return (self.records['timestep'], self.records['handle'],
+                self.records['sti'])
+
+    def sti_matrix(self, fill=float('nan')):
+        """
+        Return the STI values as a NumPy array with one row per point in time
+        and one column per handle id
+
+        Parameters:
+        fill (optional) Value for atoms that are absent at a point in time.
+          Defaults to NaN.
+        """
+        rows = numpy.repeat(numpy.arange(len(self.points)),
+                            self.points['count'].astype(numpy.intp))
+        matrix = numpy.full((len(self.points), len(self.handles)), fill)
+        matrix[rows, self.records['handle']] = self.records['sti']
+        return matrix
+
+
+def _load_handles(data):
+    # Decodes the lines of a handles file as a single JSON array, which is
+    # much faster than decoding them one at a time
+    return json.loads(b'[' + b','.join(data.splitlines()) + b']')
+
+
+def _map(filename, dtype):
+    # NumPy cannot memory-map an empty file
+    if os.path.getsize(filename) < dtype.itemsize:
+        return numpy.zeros(0, dtype=dtype)
+    count = os.path.getsize(filename) // dtype.itemsize
+    return numpy.memmap(filename, dtype=dtype, mode='r', shape=(count,))
+
+
+def convert_csv(filename, path):
+    """
+    Convert a CSV file written by export_timeseries_csv() or
+    CSVTimeseriesWriter into a timeseries file
+
+    Rows are grouped into points in time by their timestep, in the order of
+    the file. A Scheme column is ignored. Files whose name ends in '.gz' are
+    read with gzip.
+
+    Parameters:
+    filename (required) The name of the CSV file
+    path (required) The base name of the timeseries file, which is appended
+      to if it exists
+
+    Returns the number of points in time written.
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    points = 0
+    with opener(filename, 'rb') as infile:
+        with STIFileWriter(path, flush_interval=100) as writer:
+            timestep = None
+            atoms = []
+            for row in csv.reader(infile):
+                if row[0] != timestep:
+                    if atoms:
+                        writer.write_atoms(int(float(timestep)), atoms)
+                        points += 1
+                    timestep = row[0]
+                    atoms = []
+                handle = row[1]
+                atoms.append((int(handle) if handle.isdigit() else handle,
+                              float(row[2])))
+            if atoms:
+                writer.write_atoms(int(float(timestep)), atoms)
+                points += 1
+    return points
+
+
+def convert_mongodb(experiment, path, database=None):
+    """
+    Convert the points of an experiment exported to MongoDB with
+    export_timeseries_mongodb() or MongoTimeseriesExporter into a timeseries
+    file, in order of timestep
+
+    Parameters:
+    experiment (required) Identifier of the experiment
+    path (required) The base name of the timeseries file, which is appended
+      to if it exists
+    database (optional) The database to read from. Defaults to the database
+      configured in configuration.py.
+
+    Returns the number of points in time written.
+    """
+    exporter = MongoTimeseriesExporter(experiment, database=database)
+    points = 0
+    with STIFileWriter(path, flush_interval=100) as writer:
+        for point in exporter.points():
+            writer.write(point)
+            points += 1
+    return points
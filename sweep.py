@@ -0,0 +1,247 @@
+"""
+Parallel parameter sweeps across a pool of local CogServer instances
+
+Starts 'instances' CogServers, each on its own ports and in its own work
+folder, and hands the parameter sets of a sweep out to them: each instance
+takes the next parameter set as soon as it has finished its previous run, so
+that a sweep keeps every instance busy until it is done. The result of each
+run, such as the timeseries it captured, is collected under a run id.
+
+Example:
+    def run(parameters):
+        clear_atomspace()
+        load_scheme_files(["python/pln/examples/tuffy/smokes/smokes.scm"])
+        apply_parameters(parameters)
+        experiment = Experiment([importance_diffusion, importance_updating],
+                                capture=['attentional_focus'])
+        return experiment.run(num_steps=50)
+
+    sweep = Sweep(run, parameter_grid(rent=[4, 8], wages=[2, 3, 4]))
+    results = sweep.run()
+    print results['run-0001']['parameters'], results['run-0001']['seconds']
+
+The run function is called in a separate process for each instance, with the
+default client of opencog.py pointing at that instance, so it must be defined
+at the top level of a module.
+
+See README.md for documentation and instructions.
+"""
+
+import os
+import time
+import random
+import itertools
+import traceback
+from multiprocessing import Process, Queue, cpu_count
+import opencog
+from configuration import COGSERVER_PORT, PORT, SWEEP_FOLDER, \
+    OPENCOG_STARTUP_TIMEOUT
+
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+# Functions that set each parameter that apply_parameters() knows about
+SETTERS = {
+    'diffusion_percent': opencog.set_diffusion_percent,
+    'stimulus_amount': opencog.set_stimulus_amount,
+    'rent': opencog.set_rent,
+    'wages': opencog.set_wages,
+    'af_boundary': opencog.set_af_boundary
+}
+
+
+def parameter_grid(**values):
+    """
+    Return every combination of the values of each parameter, as a list of
+    dictionaries
+
+    Example:
+      parameter_grid(rent=[4, 8], wages=[2, 3]) returns
+      [{'rent': 4, 'wages': 2}, {'rent': 4, 'wages': 3},
+       {'rent': 8, 'wages': 2}, {'rent': 8, 'wages': 3}]
+    """
+    names = sorted(values)
+    return [dict(zip(names, combination)) for combination in
+            itertools.product(*[values[name] for name in names])]
+
+
+def random_sample(count, seed=None, **ranges):
+    """
+    Return 'count' random parameter sets, as a list of dictionaries
+
+    Parameters:
+    count (required) Number of parameter sets
+    seed (optional) Seed for the random number generator
+    ranges (required) For each parameter, either a list of values to choose
+      from, or a (low, high) tuple to draw a uniformly distributed number from
+    """
+    generator = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        sample = {}
+        for name in sorted(ranges):
+            choices = ranges[name]
+            if isinstance(choices, tuple):
+                sample[name] = generator.uniform(*choices)
+            else:
+                sample[name] = generator.choice(choices)
+        samples.append(sample)
+    return samples
+
+
+def apply_parameters(parameters):
+    """
+    Set the parameters in SETTERS in a single request. Other parameters are
+    ignored, so that they can be used by the run function itself.
+    """
+    with opencog.batched():
+        for name in sorted(parameters):
+            if name in SETTERS:
+                SETTERS[name](parameters[name])
+
+
+def local_server(index, workdir):
+    """
+    Return the Server of an instance of a sweep, listening on ports
+    COGSERVER_PORT + index and PORT + index
+    """
+    return opencog.Server(cogserver_port=COGSERVER_PORT + index,
+                          rest_port=int(PORT) + index,
+                          workdir=workdir)
+
+
+class Sweep(object):
+    """
+    Runs a function once for each parameter set of a sweep, in parallel
+    across a pool of CogServer instances
+
+    Parameters:
+    run (required) Function called with a parameter set, which runs an
+      experiment on the default client and returns its result, for example
+      the timeseries it captured. It must be defined at the top level of a
+      module.
+    parameter_sets (required) List of dictionaries of parameters, for example
+      from parameter_grid() or random_sample()
+    instances (optional) Number of CogServers to run at the same time.
+      Defaults to the number of CPU cores.
+    folder (optional) Folder in which the work folder of each instance is
+      created
+    server_factory (optional) Function called with the index of an instance
+      and its work folder, which returns an object with start() and stop()
+      methods and a 'uri' attribute. Defaults to local_server.
+    """
+    def __init__(self, run, parameter_sets, instances=None,
+                 folder=SWEEP_FOLDER, server_factory=local_server):
+        self.run_function = run
+        self.parameter_sets = list(parameter_sets)
+        self.instances = min(instances or cpu_count(),
+                             len(self.parameter_sets)) or 1
+        self.folder = folder
+        self.server_factory = server_factory
+        self.results = {}
+        self.failures = []
+
+    @staticmethod
+    def run_id(position):
+        """
+        Return the run id of the parameter set at a position of the sweep
+        """
+        return 'run-{0:04d}'.format(position + 1)
+
+    def run(self, callback=None):
+        """
+        Run every parameter set, and return the results once all of them
+        have finished
+
+        Parameters:
+        callback (optional) Function called with each result as soon as its
+          run finishes
+
+        Returns a dictionary that maps each run id to a dictionary with the
+        'parameters' of the run, its 'result', the 'instance' it ran on, the
+        number of 'seconds' it took and the 'error' traceback if it failed,
+        or None. Instances that could not be started are listed in
+        'failures', and their share of the runs is taken over by the others.
+        """
+        tasks = Queue()
+        results = Queue()
+        for position, parameters in enumerate(self.parameter_sets):
+            tasks.put((self.run_id(position), parameters))
+        for _ in range(self.instances):
+            tasks.put(None)
+
+        workers = []
+        for index in range(self.instances):
+            workdir = os.path.join(self.folder, 'instance-{0}'.format(index))
+            worker = Process(target=_instance,
+                             args=(index, workdir, self.server_factory,
+                                   self.run_function, tasks, results))
+            # Not a daemon, as an Experiment starts its own worker processes
+            worker.start()
+            workers.append(worker)
+
+        try:
+            pending = len(self.parameter_sets)
+            running = self.instances
+            while pending:
+                try:
+                    result = results.get(timeout=1)
+                except Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        raise RuntimeError("Every instance exited with {0} "
+                                           "runs left".format(pending))
+                    continue
+
+                if result['run_id'] is None:
+                    # An instance could not be started; the others take
+                    # over its share of the parameter sets
+                    self.failures.append(result)
+                    running -= 1
+                    if not running:
+                        raise RuntimeError("No instance could be started: "
+                                           "{0}".format(result['error']))
+                    continue
+
+                self.results[result.pop('run_id')] = result
+                pending -= 1
+                if callback is not None:
+                    callback(result)
+        finally:
+            for worker in workers:
+                worker.join(OPENCOG_STARTUP_TIMEOUT)
+                if worker.is_alive():
+                    worker.terminate()
+
+        return self.results
+
+
+def _instance(index, workdir, server_factory, run, tasks, results):
+    # Runs in a separate process for each instance: starts its server, then
+    # runs parameter sets until it receives None
+    try:
+        server = server_factory(index, workdir)
+        server.start()
+    except Exception:
+        results.put({'run_id': None, 'instance': index,
+                     'error': traceback.format_exc()})
+        return
+
+    try:
+        client = opencog.CogServerClient(server.uri)
+        opencog.set_default_client(client)
+        for task in iter(tasks.get, None):
+            run_id, parameters = task
+            start = time.time()
+            result = error = None
+            try:
+                result = run(parameters)
+            except Exception:
+                error = traceback.format_exc()
+            results.put({'run_id': run_id, 'parameters': parameters,
+                         'result': result, 'error': error, 'instance': index,
+                         'seconds': time.time() - start})
+        client.close()
+    finally:
+        server.stop()
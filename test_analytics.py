@@ -0,0 +1,149 @@
+"""
+Tests of the analyses in analytics.py, against plain loops over the same
+points in time
+"""
+
+import unittest
+import analytics
+from fakeserver import FakeCogServer
+from test_client import FakeServerTestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class AnalyticsTest(FakeServerTestCase):
+    boundary = 130
+
+    def create_server(self):
+        # The STI of half of the atoms changes at each step, so that atoms
+        # enter and leave the attentional focus
+        return FakeCogServer(num_atoms=self.num_atoms, churn=0.5, seed=1)
+
+    def setUp(self):
+        super(AnalyticsTest, self).setUp()
+        points = self.capture(15, attentional_focus=True)
+        matrix, self.handles, self.timesteps = analytics.sti_matrix(points)
+        # Distinct values, so that the atoms are ranked in a single order
+        self.matrix = matrix + numpy.arange(matrix.shape[1]) * 1e-3
+        self.rows = [dict((column, value) for column, value in enumerate(row)
+                          if not numpy.isnan(value))
+                     for row in self.matrix.tolist()]
+        self.chunk_cells = analytics.ANALYTICS_CHUNK_CELLS
+
+    def tearDown(self):
+        analytics.ANALYTICS_CHUNK_CELLS = self.chunk_cells
+        super(AnalyticsTest, self).tearDown()
+
+    def for_each_chunk_size(self, check):
+        # Checks the analyses in a single block and in blocks of a few rows
+        for cells in (self.chunk_cells, 3 * self.matrix.shape[1]):
+            analytics.ANALYTICS_CHUNK_CELLS = cells
+            check()
+
+    def focus(self, row):
+        return set(column for column, value in self.rows[row].items()
+                   if value >= self.boundary)
+
+    def ranks(self, row, k=None):
+        ordered = sorted(self.rows[row], key=lambda c: -self.rows[row][c])
+        return dict((column, rank) for rank, column
+                    in enumerate(ordered[:k]))
+
+    def test_sti_matrix(self):
+        self.assertEqual(list(self.timesteps), range(15))
+        self.assertEqual(len(self.handles), self.matrix.shape[1])
+
+    def test_af_size(self):
+        expected = [len(self.focus(row)) for row in range(len(self.rows))]
+        self.for_each_chunk_size(lambda: self.assertEqual(
+            list(analytics.af_size(self.matrix, self.boundary)), expected))
+
+    def test_af_events(self):
+        entered = []
+        exited = []
+        for row in range(1, len(self.rows)):
+            before, after = self.focus(row - 1), self.focus(row)
+            entered.extend((row, column) for column in after - before)
+            exited.extend((row, column) for column in before - after)
+
+        def check():
+            events = analytics.af_events(self.matrix, self.boundary)
+            self.assertEqual(sorted(zip(*events['entered'])), sorted(entered))
+            self.assertEqual(sorted(zip(*events['exited'])), sorted(exited))
+        self.assertTrue(entered and exited)
+        self.for_each_chunk_size(check)
+
+    def test_top_k(self):
+        expected = []
+        for row in range(len(self.rows)):
+            ranks = self.ranks(row, 5)
+            top = sorted(ranks, key=ranks.get)
+            expected.append(top + [-1] * (5 - len(top)))
+        self.for_each_chunk_size(lambda: self.assertEqual(
+            analytics.top_k(self.matrix, 5).tolist(), expected))
+
+    def test_rank_changes(self):
+        for k in (None, 5):
+            expected = []
+            for row in range(1, len(self.rows)):
+                before, after = self.ranks(row - 1, k), self.ranks(row, k)
+                changes = [abs(after[column] - before[column])
+                           for column in after if column in before]
+                expected.append(float(sum(changes)) / len(changes)
+                                if changes else float('nan'))
+
+            def check():
+                numpy.testing.assert_allclose(
+                    analytics.rank_changes(self.matrix, k), expected)
+            self.for_each_chunk_size(check)
+
+    def test_sti_drift(self):
+        totals = [sum(row.values()) for row in self.rows]
+
+        def check():
+            drift = analytics.sti_drift(self.matrix)
+            numpy.testing.assert_allclose(drift['total'], totals)
+            numpy.testing.assert_allclose(
+                drift['drift'], [total - totals[0] for total in totals])
+            self.assertAlmostEqual(
+                drift['max_relative_drift'],
+                max(abs(total - totals[0]) for total in totals) / totals[0])
+        self.for_each_chunk_size(check)
+
+    def test_diffusion_rate(self):
+        expected = []
+        for row in range(1, len(self.rows)):
+            before, after = self.rows[row - 1], self.rows[row]
+            focus = self.focus(row - 1)
+            loss = sum(before[column] - min(after.get(column, 0.0),
+                                            before[column])
+                       for column in focus)
+            total = sum(before[column] for column in focus)
+            expected.append(loss / total if total else float('nan'))
+        self.for_each_chunk_size(lambda: numpy.testing.assert_allclose(
+            analytics.diffusion_rate(self.matrix, self.boundary), expected))
+
+    def test_rolling_stats(self):
+        window = 4
+        stats = analytics.rolling_stats(self.matrix, window)
+        for start in range(len(self.rows) - window + 1):
+            for column in range(self.matrix.shape[1]):
+                values = [self.rows[row][column]
+                          for row in range(start, start + window)
+                          if column in self.rows[row]]
+                self.assertEqual(stats['count'][start, column], len(values))
+                if values:
+                    mean = sum(values) / len(values)
+                    variance = sum((value - mean) ** 2
+                                   for value in values) / len(values)
+                    self.assertAlmostEqual(stats['mean'][start, column], mean)
+                    self.assertAlmostEqual(stats['std'][start, column],
+                                           variance ** 0.5, places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Tests of the experiment checkpoints in checkpoint.py
+"""
+
+import os
+import csv
+import gzip
+import shutil
+import tempfile
+import unittest
+import opencog
+from checkpoint import Checkpointer
+from export import CSVTimeseriesWriter, MongoTimeseriesExporter, \
+    scheme_filename_for
+from stifile import STIFile, STIFileWriter
+from schemestore import SchemeSnapshotStore
+from timeseries import Timeseries, DeltaTimeseries
+from test_client import FakeServerTestCase, sti_pairs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class CheckpointTest(FakeServerTestCase):
+    def setUp(self):
+        super(CheckpointTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(CheckpointTest, self).tearDown()
+
+    def test_resume(self):
+        store = SchemeSnapshotStore()
+        experiment = opencog.Experiment(
+            [opencog.importance_diffusion], capture=['atomspace'],
+            scheme=True, scheme_store=store, workers=1,
+            checkpointer=Checkpointer(self.directory, interval=3))
+        experiment.run(8)
+        self.assertEqual(experiment.checkpointer.list(), [3, 6])
+
+        checkpoint = Checkpointer(self.directory).load()
+        saved = checkpoint['timeseries']['atomspace']
+        self.assertEqual(checkpoint['timestep'], 6)
+        self.assertEqual([sti_pairs(point) for point in saved],
+                         [sti_pairs(point) for point
+                          in experiment.timeseries['atomspace'][:6]])
+        self.assertEqual(saved[-1]['scheme'].text,
+                         experiment.timeseries['atomspace'][5]['scheme'].text)
+
+        resumed = opencog.Experiment(
+            [opencog.importance_diffusion], capture=['atomspace'], workers=1,
+            checkpointer=Checkpointer(self.directory, interval=3))
+        resumed.resume(10)
+        timeseries = resumed.timeseries['atomspace']
+        self.assertEqual([point['timestep'] for point in timeseries],
+                         range(10))
+        self.assertEqual(Checkpointer(self.directory).list(), [6, 9])
+        self.assertEqual(
+            len(Checkpointer(self.directory).load()['timeseries']
+                ['atomspace']), 9)
+
+    def test_containers(self):
+        timeseries = {'atomspace': DeltaTimeseries(keyframe_interval=2),
+                      'attentional_focus': Timeseries()}
+        experiment = opencog.Experiment(
+            [opencog.importance_diffusion], timeseries=timeseries,
+            workers=1, checkpointer=Checkpointer(self.directory, interval=3))
+        experiment.run(8)
+
+        resumed = opencog.Experiment(
+            [opencog.importance_diffusion], workers=1,
+            checkpointer=Checkpointer(self.directory, interval=3))
+        resumed.resume(10)
+        for name, container in timeseries.items():
+            points = resumed.timeseries[name]
+            self.assertIsInstance(points, type(container))
+            # The fake server does not load the atomspace of the checkpoint,
+            # so only the points saved with it are compared
+            self.assertEqual([sti_pairs(point) for point in points][:6],
+                             [sti_pairs(point) for point in container][:6])
+        self.assertEqual(resumed.timeseries['atomspace'].keyframe_interval, 2)
+        self.assertEqual(len(resumed.timeseries['atomspace']), 10)
+
+    @unittest.skipIf(numpy is None or mongomock is None,
+                     "NumPy and mongomock are required")
+    def test_exporters_rewound(self):
+        filename = os.path.join(self.directory, 'output.csv.gz')
+        path = os.path.join(self.directory, 'series')
+        csv_writer = CSVTimeseriesWriter(filename, scheme=True,
+                                         normalize_scheme=True,
+                                         compression='gzip', buffer_rows=1)
+        mongo = MongoTimeseriesExporter(
+            database=mongomock.MongoClient().db, batch_size=1)
+        sti_writer = STIFileWriter(path)
+        experiment = opencog.Experiment(
+            [opencog.importance_diffusion], capture=['atomspace'],
+            scheme=True, workers=1,
+            exporters={'atomspace': [csv_writer, mongo, sti_writer]},
+            checkpointer=Checkpointer(os.path.join(self.directory,
+                                                   'checkpoints'),
+                                      interval=3))
+        experiment.run(8)
+
+        # Timesteps 6 and 7 are run again, after the checkpoint of 6
+        experiment.resume(10)
+        csv_writer.close()
+        sti_writer.close()
+
+        points = list(mongo.points())
+        self.assertEqual([point['timestep'] for point in points], range(10))
+        for point in points:
+            self.assertEqual(len(point['atoms']), point['atom_count'])
+        self.assertEqual(list(STIFile(path).timesteps), range(10))
+
+        def timesteps(filename):
+            with gzip.open(filename, 'rb') as infile:
+                return [int(row[0]) for row in csv.reader(infile)]
+        self.assertEqual(timesteps(scheme_filename_for(filename)),
+                         range(10))
+        # The fake server does not load the atomspace of the checkpoint, so
+        # the points after it have no atoms
+        self.assertEqual(sorted(set(timesteps(filename))), range(6))
+        self.assertEqual(len(timesteps(filename)), 6 * self.num_atoms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Shared fixture of the tests, and tests of the FakeCogServer itself
+
+FakeServerTestCase starts a FakeCogServer for each test and routes the
+module-level functions of opencog.py to it. The tests of each module of the
+client are in the test module named after it, and subclass it.
+
+Usage:
+
+python -m unittest discover -p 'test_*.py'
+"""
+
+import unittest
+import opencog
+from fakeserver import FakeCogServer
+
+
+def sti_pairs(point):
+    """
+    Return the (handle, STI) pairs of the atoms of a point in time, in order
+    of handle
+    """
+    return sorted((atom['handle'], float(atom['sti']))
+                  for atom in point['atoms'])
+
+
+class FakeServerTestCase(unittest.TestCase):
+    """
+    Starts a FakeCogServer for each test, and routes the module-level
+    functions of opencog.py to it
+    """
+    num_atoms = 60
+
+    def setUp(self):
+        self.server = self.create_server()
+        self.server.start()
+        self.client = opencog.CogServerClient(self.server.uri)
+        self.previous_client = opencog.default_client
+        opencog.set_default_client(self.client)
+
+    def tearDown(self):
+        opencog.set_default_client(self.previous_client)
+        self.client.close()
+        self.server.stop()
+
+    def create_server(self):
+        return FakeCogServer(num_atoms=self.num_atoms, seed=1)
+
+    def capture(self, steps, attentional_focus=False):
+        """
+        Return points in time of the atomspace or the attentional focus, with
+        the agents stepped between them
+        """
+        points = []
+        for timestep in range(steps):
+            if attentional_focus:
+                points.append(opencog.get_attentional_focus(timestep))
+            else:
+                points.append(opencog.get_atomspace(timestep))
+            opencog.importance_diffusion()
+        return points
+
+
+class FakeCogServerTest(FakeServerTestCase):
+    def test_filters(self):
+        atoms = self.client.get_atoms()
+        self.assertEqual(len(atoms), self.num_atoms)
+        self.assertEqual(
+            self.client.get_atoms('filterby=attentionalfocus'),
+            [atom for atom in atoms if atom['attentionvalue']['sti'] >=
+             self.server.af_boundary])
+        self.assertEqual(
+            self.client.get_atoms('filterby=stirange&stimin=20&stimax=80'),
+            [atom for atom in atoms
+             if 20 <= atom['attentionvalue']['sti'] <= 80])
+        self.assertEqual(
+            self.client.get_atoms('type=InheritanceLink'),
+            [atom for atom in atoms if atom['type'] == 'InheritanceLink'])
+        self.assertEqual(self.client.get_atoms('limit=5&offset=10'),
+                         atoms[10:15])
+
+    def test_dot(self):
+        dot = self.client.decode(self.client.get('atoms?dot=True'))['result']
+        self.assertTrue(dot.startswith('digraph OpenCog {'))
+        self.assertEqual(dot.count('[label='), self.num_atoms)
+
+    def test_step(self):
+        before = self.client.get_atoms()
+        opencog.importance_diffusion()
+        self.assertEqual(self.server.steps, 1)
+        self.assertNotEqual(self.client.get_atoms(), before)
+
+    def test_scheme(self):
+        self.client.scheme('(cog-set-af-boundary! 150)')
+        self.assertEqual(self.server.af_boundary, 150)
+        dump = self.client.scheme('(cog-af)')
+        self.assertEqual(dump.count('(av '), len(
+            self.client.get_atoms('filterby=attentionalfocus')))
+        self.client.scheme('(clear)')
+        self.assertEqual(self.client.get_atoms(), [])
+
+    def test_injected_errors(self):
+        server = FakeCogServer(num_atoms=10, error_rate=1, seed=1)
+        server.start()
+        client = opencog.CogServerClient(server.uri, retries=0)
+        try:
+            self.assertEqual(client.get('atoms').status_code, 500)
+        finally:
+            client.close()
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Tests of the exporters in export.py
+"""
+
+import os
+import csv
+import gzip
+import shutil
+import tempfile
+import unittest
+import opencog
+from export import CSVTimeseriesWriter, MongoTimeseriesExporter, \
+    scheme_filename_for
+from timeseries import Timeseries
+from schemestore import SchemeSnapshotStore
+from test_client import FakeServerTestCase
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+def _rows(point):
+    return [[str(point['timestep']), str(atom['handle']), str(atom['sti'])]
+            for atom in point['atoms']]
+
+
+class CSVTimeseriesWriterTest(FakeServerTestCase):
+    num_atoms = 20
+
+    def setUp(self):
+        super(CSVTimeseriesWriterTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.points = []
+        for timestep in range(3):
+            self.points.append(opencog.get_atomspace(timestep, scheme=True))
+            opencog.importance_diffusion()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(CSVTimeseriesWriterTest, self).tearDown()
+
+    def read(self, filename, opener=open):
+        with opener(os.path.join(self.directory, filename), 'rb') as infile:
+            return list(csv.reader(infile))
+
+    def test_rows(self):
+        filename = os.path.join(self.directory, 'output.csv')
+        with CSVTimeseriesWriter(filename, buffer_rows=7) as writer:
+            writer.write_all(self.points)
+        self.assertEqual(self.read('output.csv'),
+                         sum([_rows(point) for point in self.points], []))
+
+    def test_scheme(self):
+        filename = os.path.join(self.directory, 'output.csv')
+        opencog.export_timeseries_csv(self.points, filename, scheme=True)
+        expected = [row + [point['scheme']] for point in self.points
+                    for row in _rows(point)]
+        self.assertEqual(self.read('output.csv'), expected)
+
+    def test_normalized_gzip(self):
+        filename = os.path.join(self.directory, 'output.csv.gz')
+        opencog.export_timeseries_csv(self.points, filename, scheme=True,
+                                      normalize_scheme=True,
+                                      compression='gzip')
+        self.assertEqual(scheme_filename_for(filename),
+                         os.path.join(self.directory,
+                                      'output-scheme.csv.gz'))
+        self.assertEqual(self.read('output.csv.gz', gzip.open),
+                         sum([_rows(point) for point in self.points], []))
+        self.assertEqual(self.read('output-scheme.csv.gz', gzip.open),
+                         [[str(point['timestep']), point['scheme']]
+                          for point in self.points])
+
+    def test_timeseries_container(self):
+        timeseries = Timeseries()
+        timeseries.extend(self.points)
+        filename = os.path.join(self.directory, 'output.csv')
+        opencog.export_timeseries_csv(timeseries, filename)
+        self.assertEqual(
+            [[int(timestep), int(handle), float(sti)]
+             for timestep, handle, sti in self.read('output.csv')],
+            [[point['timestep'], atom['handle'], float(atom['sti'])]
+             for point in self.points for atom in point['atoms']])
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MongoTimeseriesExporterTest(FakeServerTestCase):
+    num_atoms = 20
+
+    def setUp(self):
+        super(MongoTimeseriesExporterTest, self).setUp()
+        self.database = mongomock.MongoClient().db
+        self.points = self.capture(3, attentional_focus=True)
+
+    def exporter(self, **kwargs):
+        return MongoTimeseriesExporter(database=self.database, **kwargs)
+
+    def test_write_flush(self):
+        exporter = self.exporter(batch_size=2)
+        exporter.write(self.points[0])
+        self.assertEqual(self.database.points.count_documents({}), 0)
+        exporter.write(self.points[1])
+        self.assertEqual(self.database.points.count_documents({}), 2)
+        exporter.write(self.points[2])
+        self.assertEqual(self.database.points.count_documents({}), 2)
+        exporter.close()
+        self.assertEqual(self.database.points.count_documents({}), 3)
+        self.assertEqual(self.database.point_atoms.count_documents({}),
+                         sum(len(point['atoms']) for point in self.points))
+
+    def test_points(self):
+        empty = {'timestep': 3, 'atoms': [], 'scheme': None}
+        with self.exporter() as exporter:
+            exporter.write_all(self.points + [empty])
+        # The points of other experiments are not joined
+        with self.exporter() as other:
+            other.write_all(self.points)
+
+        points = list(exporter.points())
+        self.assertEqual([point['timestep'] for point in points],
+                         [0, 1, 2, 3])
+        for point, expected in zip(points, self.points + [empty]):
+            self.assertEqual(point['experiment'], exporter.experiment)
+            self.assertEqual(point['atom_count'], len(expected['atoms']))
+            self.assertEqual(point['atoms'],
+                             sorted(expected['atoms'],
+                                    key=lambda atom: atom['handle']))
+
+    def test_sti_history(self):
+        with self.exporter() as exporter:
+            exporter.write_all(self.points)
+        handle = self.points[0]['atoms'][0]['handle']
+        expected = [(point['timestep'], atom['sti'])
+                    for point in self.points for atom in point['atoms']
+                    if atom['handle'] == handle]
+        self.assertEqual(exporter.sti_history(handle), expected)
+        self.assertEqual(exporter.sti_history(-1), [])
+
+    def test_scheme(self):
+        store = SchemeSnapshotStore()
+        points = []
+        for timestep in range(3):
+            point = opencog.get_atomspace(timestep, scheme=True)
+            points.append(store.compact(point))
+            if timestep:
+                opencog.importance_diffusion()
+
+        with self.exporter() as exporter:
+            exporter.write_all(points)
+        with self.exporter() as other:
+            other.write_all(points)
+        # Each distinct expression is stored once, for both experiments
+        self.assertEqual(
+            self.database.scheme_expressions.count_documents({}),
+            store.stats()['expressions'])
+        self.assertEqual([exporter.scheme(document)
+                          for document in exporter.points()],
+                         [point['scheme'].text for point in points])
+
+        with self.exporter() as plain:
+            plain.write(opencog.get_atomspace(0, scheme=True))
+        document = next(plain.points())
+        self.assertEqual(plain.scheme(document),
+                         opencog.dump_atomspace_scheme())
+
+
+if __name__ == '__main__':
+    unittest.main()
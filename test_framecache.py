@@ -0,0 +1,141 @@
+"""
+Tests of the frame cache in framecache.py, and of its use by graphics.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import opencog
+import graphics
+from framecache import FrameCache
+from test_client import FakeServerTestCase
+
+
+def _write_dot(dot, png_full_path):
+    # Stands in for Graphviz, which the tests do not require
+    with open(png_full_path, 'wb') as outfile:
+        outfile.write(dot.encode('utf-8'))
+
+
+class _RecordingCache(FrameCache):
+    # Records the keys that are kept by each eviction
+    def __init__(self, *args, **kwargs):
+        super(_RecordingCache, self).__init__(*args, **kwargs)
+        self.evictions = []
+
+    def evict(self, keep=()):
+        self.evictions.append(set(keep))
+        return super(_RecordingCache, self).evict(keep)
+
+
+class FrameCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FrameCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_dot(self):
+        key = FrameCache.key(u'(ConceptNode "a")')
+        self.assertEqual(key, FrameCache.key(b'(ConceptNode "a")'))
+        self.assertIsNone(self.cache.get_dot(key))
+        self.cache.put_dot(key, u'digraph OpenCog {}')
+        self.assertEqual(self.cache.get_dot(key), u'digraph OpenCog {}')
+
+    def test_link_png(self):
+        key = FrameCache.key('(ConceptNode "a")')
+        self.assertFalse(self.cache.has_png(key))
+        _write_dot(u'image', self.cache.png_path(key))
+        self.assertTrue(self.cache.has_png(key))
+        destination = os.path.join(self.directory, 'frame.png')
+        self.cache.link_png(key, destination)
+        with open(destination, 'rb') as infile:
+            self.assertEqual(infile.read(), b'image')
+
+    def test_evict_least_recently_used(self):
+        cache = FrameCache(self.cache.directory, max_bytes=250)
+        for age, name in enumerate(('c', 'b', 'a')):
+            key = FrameCache.key(name)
+            cache.put_dot(key, u'x' * 100)
+            os.utime(cache.dot_path(key), (1000 - age, 1000 - age))
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get_dot(FrameCache.key('a')))
+        self.assertIsNotNone(cache.get_dot(FrameCache.key('b')))
+        self.assertIsNotNone(cache.get_dot(FrameCache.key('c')))
+
+    def test_evict_keeps_files_in_use(self):
+        cache = FrameCache(self.cache.directory, max_bytes=1)
+        kept, evicted = FrameCache.key('a'), FrameCache.key('b')
+        cache.put_dot(kept, u'x')
+        cache.put_dot(evicted, u'x')
+        _write_dot(u'x', cache.png_path(kept) + '.rendering')
+        self.assertEqual(cache.evict(keep=set([kept])), 1)
+        self.assertEqual(sorted(os.listdir(cache.directory)),
+                         sorted([kept + '.dot', kept + '.png.rendering']))
+
+
+class RenderPointsTest(FakeServerTestCase):
+    num_atoms = 20
+
+    def setUp(self):
+        super(RenderPointsTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, graphics.sub_dir))
+        self.saved = graphics.ANALYSIS_FOLDER, graphics.render_png
+        graphics.ANALYSIS_FOLDER = self.directory
+        graphics.render_png = _write_dot
+        self.cache = FrameCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        graphics.ANALYSIS_FOLDER, graphics.render_png = self.saved
+        shutil.rmtree(self.directory)
+        super(RenderPointsTest, self).tearDown()
+
+    def frames(self):
+        folder = os.path.join(self.directory, graphics.sub_dir)
+        return sorted(os.listdir(folder))
+
+    def test_hits_and_misses(self):
+        # The first two points have the same attentional focus
+        points = [opencog.get_attentional_focus(0, scheme=True),
+                  opencog.get_attentional_focus(1, scheme=True)]
+        opencog.importance_diffusion()
+        points.append(opencog.get_attentional_focus(2, scheme=True))
+        self.assertEqual(points[0]['scheme'], points[1]['scheme'])
+        self.assertNotEqual(points[1]['scheme'], points[2]['scheme'])
+
+        requests = self.server.requests
+        self.assertEqual(graphics.render_points(points, workers=1,
+                                                cache=self.cache), 3)
+        # Each miss clears the atomspace, loads the snapshot and requests
+        # the DOT graph description
+        self.assertEqual(self.server.requests, requests + 6)
+        self.assertEqual(self.frames(),
+                         ['00000.png', '00001.png', '00002.png'])
+        self.assertEqual(len([name for name in os.listdir(self.cache.directory)
+                              if name.endswith('.png')]), 2)
+
+        # Every point is now a hit
+        requests = self.server.requests
+        self.assertEqual(graphics.render_points(points, workers=1,
+                                                cache=self.cache), 3)
+        self.assertEqual(self.server.requests, requests)
+
+    def test_evicted_during_run(self):
+        cache = _RecordingCache(self.cache.directory, max_bytes=1,
+                               evict_interval=2)
+        points = [{'timestep': timestep, 'atoms': [opencog.Atom(1, 100)],
+                   'scheme': '(ConceptNode "c{0}")'.format(timestep)}
+                  for timestep in range(6)]
+        self.assertEqual(graphics.render_points(points, workers=1,
+                                                cache=cache), 6)
+        self.assertEqual(len(cache.evictions), 4)
+        self.assertEqual(cache.evictions[-1], set())
+        self.assertEqual(len(self.frames()), 6)
+        self.assertEqual(os.listdir(cache.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
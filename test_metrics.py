@@ -0,0 +1,115 @@
+"""
+Tests of the instrumentation in metrics.py
+"""
+
+import json
+import unittest
+import opencog
+import metrics
+from StringIO import StringIO
+from test_client import FakeServerTestCase
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_record(self):
+        self.registry.record('call', 0.003, sent=10, received=20)
+        self.registry.record('call', 100)
+        stats = self.registry.snapshot()['call']
+        self.assertEqual(stats['count'], 2)
+        self.assertAlmostEqual(stats['seconds'], 100.003)
+        self.assertEqual(stats['bytes_sent'], 10)
+        self.assertEqual(stats['bytes_received'], 20)
+        buckets = dict(stats['buckets'])
+        self.assertEqual(buckets[0.005], 1)
+        self.assertEqual(buckets[float('inf')], 1)
+        self.assertEqual(sum(buckets.values()), 2)
+
+    def test_reset(self):
+        self.registry.record('call', 0.1)
+        self.registry.reset()
+        self.assertEqual(self.registry.snapshot(), {})
+
+
+class MetricsTest(FakeServerTestCase):
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+        super(MetricsTest, self).tearDown()
+
+    def test_instrumented(self):
+        @metrics.instrumented('square')
+        def square(value):
+            return value * value
+
+        self.assertEqual(square(3), 9)
+        metrics.disable()
+        self.assertEqual(square(4), 16)
+        self.assertEqual(metrics.snapshot()['square']['count'], 1)
+
+    def test_client_calls(self):
+        opencog.get_atomspace(0)
+        stats = metrics.snapshot()
+        self.assertEqual(stats['get_atomspace']['count'], 1)
+        self.assertEqual(stats['http.get']['count'], 1)
+        self.assertGreater(stats['http.get']['bytes_received'], 0)
+        self.assertEqual(stats['json.decode']['count'], 1)
+
+        opencog.importance_diffusion()
+        self.assertGreater(metrics.snapshot()['http.post']['bytes_sent'], 0)
+
+    def test_streamed_request(self):
+        atoms = list(self.client.query_atoms(stream=True))
+        self.assertEqual(len(atoms), self.num_atoms)
+        stats = metrics.snapshot()['http.get']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['bytes_received'],
+                         len(self.client.get('atoms').content))
+
+    def test_experiment_workers(self):
+        experiment = opencog.Experiment([], capture=['atomspace'], workers=1)
+        experiment.run(3)
+        self.assertEqual(metrics.snapshot()['json.decode']['count'], 3)
+
+    def test_prometheus_text(self):
+        metrics.record('a', 0.003, sent=5)
+        metrics.record('b', 0.2, received=7)
+        lines = metrics.prometheus_text('test').splitlines()
+
+        # Every sample follows the TYPE line of its own family
+        family = None
+        for line in lines:
+            if line.startswith('# TYPE '):
+                family = line.split()[2]
+            else:
+                name = line.split('{')[0]
+                self.assertTrue(name == family or
+                                name.rsplit('_', 1)[0] == family, line)
+        self.assertEqual(len([line for line in lines
+                              if line.startswith('# TYPE ')]), 3)
+
+        self.assertIn('test_seconds_bucket{name="a",le="0.005"} 1', lines)
+        self.assertIn('test_seconds_bucket{name="a",le="+Inf"} 1', lines)
+        self.assertIn('test_seconds_bucket{name="b",le="0.1"} 0', lines)
+        self.assertIn('test_seconds_count{name="b"} 1', lines)
+        self.assertIn('test_bytes_sent_total{name="a"} 5', lines)
+        self.assertIn('test_bytes_received_total{name="b"} 7', lines)
+
+    def test_write_jsonl(self):
+        metrics.record('a', 0.003)
+        output = StringIO()
+        metrics.write_jsonl(output)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['name'] for line in lines], ['a'])
+        self.assertEqual(lines[0]['buckets'][-1], ['+Inf', 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests of the client-side atomspace mirror in mirror.py
+"""
+
+import unittest
+import opencog
+from mirror import AtomSpaceMirror
+from test_client import FakeServerTestCase
+
+
+class AtomSpaceMirrorTest(FakeServerTestCase):
+    def assertMirrors(self, mirror):
+        # The mirror and each of its indexes match the atomspace
+        atoms = self.client.get_atoms()
+        self.assertEqual(sorted(mirror, key=lambda atom: atom['handle']),
+                         atoms)
+
+        def sti(atom):
+            return atom['attentionvalue']['sti']
+        self.assertEqual(
+            sorted(atom['handle'] for atom in mirror.sti_range(50, 120)),
+            sorted(atom['handle'] for atom in atoms
+                   if 50 <= sti(atom) <= 120))
+        self.assertEqual([sti(atom) for atom in mirror.top(5)],
+                         sorted([sti(atom) for atom in atoms],
+                                reverse=True)[:5])
+        self.assertEqual(
+            sorted(atom['handle'] for atom in mirror.of_type('ConceptNode')),
+            [atom['handle'] for atom in atoms
+             if atom['type'] == 'ConceptNode'])
+        for atom in atoms:
+            # A link may contain an atom more than once
+            self.assertEqual(set(link['handle']
+                                 for link in mirror.incoming(atom['handle'])),
+                             set(atom['incoming']))
+            if atom['name']:
+                self.assertEqual(mirror.named(atom['name']), [atom])
+
+    def test_incremental_refresh(self):
+        mirror = AtomSpaceMirror(self.client)
+        self.assertEqual(mirror.refresh(),
+                         {'added': self.num_atoms, 'changed': 0,
+                          'removed': 0})
+        self.assertMirrors(mirror)
+
+        for _ in range(3):
+            opencog.importance_diffusion()
+            requests = self.server.requests
+            changes = mirror.refresh()
+            self.assertEqual(self.server.requests, requests + 1)
+            self.assertEqual(changes['added'], 0)
+            self.assertEqual(changes['removed'], 0)
+            self.assertMirrors(mirror)
+
+    def test_full_refresh(self):
+        mirror = AtomSpaceMirror(self.client, page_size=7)
+        mirror.refresh()
+        with self.server.lock:
+            self.server.atoms[0]['truthvalue']['details']['strength'] = 2.0
+            self.server._invalidate()
+
+        # Only the STI is requested by an incremental refresh
+        self.assertEqual(mirror.refresh(), {'added': 0, 'changed': 0,
+                                            'removed': 0})
+        self.assertNotEqual(mirror[1]['truthvalue']['details']['strength'],
+                            2.0)
+        self.assertEqual(mirror.refresh(full=True),
+                         {'added': 0, 'changed': 1, 'removed': 0})
+        self.assertEqual(mirror[1]['truthvalue']['details']['strength'], 2.0)
+        self.assertMirrors(mirror)
+
+    def test_added_and_removed_atoms(self):
+        mirror = AtomSpaceMirror(self.client)
+        mirror.refresh()
+        self.server.generate(self.num_atoms + 5)
+        self.assertEqual(mirror.refresh()['added'], 5)
+        self.assertMirrors(mirror)
+
+        opencog.clear_atomspace()
+        self.assertEqual(mirror.refresh()['removed'], self.num_atoms + 5)
+        self.assertEqual(len(mirror), 0)
+        self.assertEqual(mirror.top(3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
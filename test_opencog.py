@@ -0,0 +1,68 @@
+"""
+Tests of the Atom records and points in time of opencog.py
+"""
+
+import copy
+import pickle
+import unittest
+import opencog
+from opencog import Atom, create_point
+
+
+class AtomTest(unittest.TestCase):
+    def test_fields(self):
+        atom = Atom(5, 120)
+        self.assertEqual((atom.handle, atom.sti), (5, 120))
+        self.assertEqual((atom['handle'], atom['sti']), (5, 120))
+        self.assertEqual(atom.get('lti', 0), 0)
+        self.assertRaises(KeyError, lambda: atom['lti'])
+        self.assertEqual(dict((key, atom[key]) for key in atom.keys()),
+                         {'handle': 5, 'sti': 120})
+        self.assertFalse(hasattr(atom, '__dict__'))
+
+    def test_equality(self):
+        atom = Atom(5, 120)
+        self.assertEqual(atom, Atom(5, 120))
+        self.assertEqual(atom, {'handle': 5, 'sti': 120})
+        self.assertNotEqual(atom, Atom(5, 121))
+        self.assertNotEqual(atom, Atom(6, 120))
+        self.assertNotEqual(atom, {'handle': 5})
+        self.assertNotEqual(atom, (5, 120))
+        self.assertRaises(TypeError, hash, atom)
+
+    def test_pickle(self):
+        atoms = [Atom(5, 120), Atom(6, -3.5)]
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(pickle.loads(pickle.dumps(atoms, protocol)),
+                             atoms)
+        self.assertEqual(copy.deepcopy(atoms), atoms)
+
+
+def _atoms():
+    # The JSON decoder creates new objects for the handles of every response
+    return [{'handle': int(handle), 'attentionvalue': {'sti': sti}}
+            for handle, sti in (('1000', 5), ('1001', 7))]
+
+
+class CreatePointTest(unittest.TestCase):
+    def tearDown(self):
+        opencog._handles.clear()
+
+    def test_point(self):
+        point = create_point(3, _atoms(), '(scheme)')
+        self.assertEqual(point, {'timestep': 3, 'scheme': '(scheme)',
+                                 'atoms': [Atom(1000, 5), Atom(1001, 7)]})
+
+    def test_shared_handles(self):
+        handles = {}
+        first = create_point(0, _atoms(), handles=handles)
+        second = create_point(1, _atoms(), handles=handles)
+        self.assertIsNot(_atoms()[0]['handle'], _atoms()[0]['handle'])
+        for one, other in zip(first['atoms'], second['atoms']):
+            self.assertIs(one.handle, other.handle)
+        self.assertEqual(sorted(handles), [1000, 1001])
+        self.assertNotIn(1000, opencog._handles)
+
+
+if __name__ == '__main__':
+    unittest.main()
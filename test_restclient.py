@@ -0,0 +1,165 @@
+"""
+Tests of the REST client in restclient.py
+"""
+
+import re
+import unittest
+import opencog
+from restclient import SchemeBatchError
+from fakeserver import FakeCogServer
+from test_client import FakeServerTestCase
+
+
+class SchemeBatchTest(FakeServerTestCase):
+    def test_responses_are_split(self):
+        expected = self.client.scheme('(cog-af)').strip()
+        requests = self.server.requests
+        responses = self.client.scheme_batch(['(cog-set-af-boundary! 150)',
+                                              '(cog-af)'])
+        self.assertEqual(self.server.requests, requests + 1)
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(self.server.af_boundary, 150)
+        self.assertNotEqual(responses[1], expected)
+        self.assertEqual(responses[1],
+                         self.client.scheme('(cog-af)').strip())
+
+    def test_top_level_forms_are_sent_alone(self):
+        requests = self.server.requests
+        responses = self.client.scheme_batch(['(cog-set-af-boundary! 10)',
+                                              '(define x 1)',
+                                              '(cog-set-af-boundary! 20)'])
+        self.assertEqual(self.server.requests, requests + 3)
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(self.server.af_boundary, 20)
+
+    def test_failed_commands(self):
+        with self.assertRaises(SchemeBatchError) as context:
+            self.client.scheme_batch(['(cog-set-af-boundary! 10)',
+                                      '(error "batched")',
+                                      '(cog-set-af-boundary! 20)'])
+        self.assertEqual([index for index, _, _
+                          in context.exception.failures], [1])
+        self.assertEqual(self.server.af_boundary, 20)
+
+    def test_failed_top_level_forms(self):
+        with self.assertRaises(SchemeBatchError) as context:
+            self.client.scheme_batch(['(define x 1)',
+                                      '(define y (error "top level"))',
+                                      '(cog-set-af-boundary! 20)',
+                                      '(load "unbalanced.scm"'])
+        failures = context.exception.failures
+        self.assertEqual([index for index, _, _ in failures], [1, 3])
+        self.assertIn('top level', failures[0][2])
+        self.assertEqual(context.exception.responses[0], '')
+        self.assertEqual(self.server.af_boundary, 20)
+
+    def test_nested_batches(self):
+        requests = self.server.requests
+        with self.client.batched() as outer:
+            self.client.scheme('(cog-set-af-boundary! 1)')
+            with self.client.batched() as inner:
+                self.client.scheme('(cog-set-af-boundary! 3)')
+            self.assertIsNone(inner.responses)
+        self.assertEqual(self.server.requests, requests + 1)
+        self.assertEqual(self.server.af_boundary, 3)
+        self.assertEqual(len(outer.responses), 2)
+        self.assertEqual(len(inner.responses), 1)
+
+
+class QueryAtomsTest(FakeServerTestCase):
+    def test_filters(self):
+        atoms = self.client.get_atoms()
+        self.assertEqual(
+            self.client.query_atoms(sti_min=50, sti_max=120),
+            [atom for atom in atoms
+             if 50 <= atom['attentionvalue']['sti'] <= 120])
+        self.assertEqual(
+            self.client.query_atoms(atom_type='ConceptNode', limit=5,
+                                    offset=2),
+            [atom for atom in atoms if atom['type'] == 'ConceptNode'][2:7])
+        self.assertEqual(
+            self.client.query_atoms(handles=[1, 5, 9]),
+            [atom for atom in atoms if atom['handle'] in (1, 5, 9)])
+        self.assertEqual(
+            self.client.query_atoms(fields=['handle', 'type']),
+            [{'handle': atom['handle'], 'type': atom['type']}
+             for atom in atoms])
+
+    def test_projected_fields(self):
+        focus = self.client.get_atoms('filterby=attentionalfocus')
+        self.assertEqual(
+            self.client.query_atoms(attentional_focus=True,
+                                    fields=['handle', 'sti']),
+            [{'handle': atom['handle'],
+              'attentionvalue': {'sti': atom['attentionvalue']['sti']}}
+             for atom in focus])
+
+    def test_sti_field(self):
+        atoms = self.client.get_atoms()
+        self.assertEqual(
+            self.client.query_atoms(fields=['handle', 'sti', 'type']),
+            [{'handle': atom['handle'], 'type': atom['type'],
+              'attentionvalue': {'sti': atom['attentionvalue']['sti']}}
+             for atom in atoms])
+        self.assertEqual(
+            self.client.query_atoms(fields=['sti', 'attentionvalue']),
+            [{'attentionvalue': atom['attentionvalue']} for atom in atoms])
+
+    def test_point_fields(self):
+        expected = opencog.get_atomspace(0)
+        for fields in (['handle', 'sti', 'type'], ['type'], ['handle']):
+            point = opencog.get_atomspace(0, fields=fields)
+            self.assertEqual(point['atoms'], expected['atoms'])
+        focus = opencog.get_attentional_focus(0)
+        self.assertEqual(
+            opencog.get_attentional_focus(0, fields=['name'])['atoms'],
+            focus['atoms'])
+
+        experiment = opencog.Experiment([], capture=['atomspace'],
+                                        filters={'fields': ['type']},
+                                        workers=1)
+        self.assertEqual(experiment.run(1)['atomspace'][0]['atoms'],
+                         expected['atoms'])
+
+    def test_projected_query_inside_batch(self):
+        with opencog.batched():
+            point = opencog.get_atomspace(0, fields=['handle', 'sti'])
+        self.assertEqual(len(point['atoms']), self.num_atoms)
+
+
+class _NoOffsetServer(FakeCogServer):
+    # A REST API that applies the limit of a request but not its offset
+    def get_atoms(self, query):
+        return FakeCogServer.get_atoms(self,
+                                       re.sub(r'&?offset=\d+', '', query))
+
+
+class AtomPagesTest(FakeServerTestCase):
+    num_atoms = 50
+
+    def test_pages(self):
+        for prefetch in (True, False):
+            pages = self.client.iter_atoms(page_size=7, prefetch=prefetch)
+            self.assertEqual(list(pages), self.client.get_atoms())
+            self.assertEqual(pages.pages, 8)
+            self.assertEqual(pages.cursor, self.num_atoms)
+
+    def test_cursor(self):
+        pages = self.client.iter_atoms(page_size=7, cursor=20)
+        self.assertEqual(list(pages), self.client.get_atoms()[20:])
+
+    def test_offset_ignored(self):
+        server = _NoOffsetServer(num_atoms=self.num_atoms, seed=1)
+        server.start()
+        client = opencog.CogServerClient(server.uri)
+        try:
+            pages = client.iter_atoms(page_size=7)
+            self.assertEqual(list(pages), client.get_atoms())
+            self.assertEqual(pages.pages, 2)
+        finally:
+            client.close()
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
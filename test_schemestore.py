@@ -0,0 +1,106 @@
+"""
+Tests of the deduplicated Scheme snapshot store in schemestore.py
+"""
+
+import pickle
+import hashlib
+import unittest
+import opencog
+from schemestore import SchemeSnapshot, SchemeSnapshotStore, \
+    split_expressions
+from test_client import FakeServerTestCase
+
+
+class SplitExpressionsTest(unittest.TestCase):
+    def test_round_trip(self):
+        text = ('; comment (\n(ConceptNode "a (" (av 1 0 0))\n\n'
+                '(ListLink #\\( (ConceptNode "b\\")"))  trailing')
+        chunks = split_expressions(text)
+        self.assertEqual(''.join(chunks), text)
+        self.assertEqual(chunks, [
+            '; comment (\n(ConceptNode "a (" (av 1 0 0))\n\n',
+            '(ListLink #\\( (ConceptNode "b\\")"))  ',
+            'trailing'])
+
+    def test_empty(self):
+        self.assertEqual(split_expressions(''), [])
+
+
+class SchemeSnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = SchemeSnapshotStore()
+
+    def test_none(self):
+        self.assertIsNone(self.store.add(None))
+        self.assertEqual(self.store.stats()['added'], 0)
+
+    def test_deduplication(self):
+        first = self.store.add('(a)\n(b)\n')
+        second = self.store.add('(b)\n(c)\n')
+        again = self.store.add('(a)\n(b)\n')
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, '(b)\n(c)\n')
+        self.assertEqual(len(first), len('(a)\n(b)\n'))
+
+        stats = self.store.stats()
+        self.assertEqual(stats['added'], 3)
+        self.assertEqual(stats['snapshots'], 2)
+        self.assertEqual(stats['expressions'], 3)
+        self.assertEqual(stats['original_bytes'], 24)
+        self.assertEqual(self.store.expression_bytes, 12)
+        self.assertEqual(self.store.compression_ratio(),
+                         24.0 / stats['stored_bytes'])
+
+    def test_digests(self):
+        snapshot = self.store.add('(a)\n(b)\n')
+        digests = snapshot.digests()
+        self.assertEqual(digests, [hashlib.sha1('(a)\n').hexdigest(),
+                                   hashlib.sha1('(b)\n').hexdigest()])
+        self.assertEqual([self.store.expression(digest)
+                          for digest in digests], ['(a)\n', '(b)\n'])
+
+    def test_compact(self):
+        point = {'timestep': 0, 'atoms': [], 'scheme': '(a)\n'}
+        compacted = self.store.compact(point)
+        self.assertIsInstance(compacted['scheme'], SchemeSnapshot)
+        self.assertEqual(point['scheme'], '(a)\n')
+        self.assertIs(self.store.compact(compacted), compacted)
+
+    def test_pickle(self):
+        snapshots = [self.store.add('(a)\n'), self.store.add('(b)\n')]
+        loaded = pickle.loads(pickle.dumps(snapshots, 2))
+        self.assertIs(loaded[0].store, loaded[1].store)
+        self.assertEqual([str(snapshot) for snapshot in loaded],
+                         ['(a)\n', '(b)\n'])
+
+
+class ExperimentSchemeStoreTest(FakeServerTestCase):
+    num_atoms = 30
+
+    def run_experiment(self, scheme_store=None):
+        # Each run starts from the same atomspace
+        with self.create_server() as server:
+            client = opencog.CogServerClient(server.uri)
+            opencog.set_default_client(client)
+            try:
+                experiment = opencog.Experiment(
+                    [opencog.importance_diffusion], capture=['atomspace'],
+                    scheme=True, scheme_store=scheme_store)
+                return experiment.run(4)['atomspace']
+            finally:
+                opencog.set_default_client(self.client)
+                client.close()
+
+    def test_exact_text(self):
+        expected = [point['scheme'] for point in self.run_experiment()]
+        store = SchemeSnapshotStore()
+        points = self.run_experiment(store)
+        self.assertEqual([point['scheme'].text for point in points],
+                         expected)
+        self.assertEqual(store.stats()['added'], 4)
+        self.assertLess(store.stored_bytes, store.original_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
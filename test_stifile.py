@@ -0,0 +1,66 @@
+"""
+Tests of the binary timeseries files in stifile.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from stifile import STIFile, STIFileWriter
+from test_client import FakeServerTestCase, sti_pairs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class STIFileTest(FakeServerTestCase):
+    num_atoms = 30
+
+    def setUp(self):
+        super(STIFileTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'series')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(STIFileTest, self).tearDown()
+
+    def test_round_trip(self):
+        points = self.capture(4, attentional_focus=True)
+        with STIFileWriter(self.path) as writer:
+            writer.write_all(points)
+        series = STIFile(self.path)
+        self.assertEqual(list(series.timesteps), range(4))
+        self.assertEqual([sti_pairs(point) for point in series],
+                         [sti_pairs(point) for point in points])
+
+    def test_recovery(self):
+        points = self.capture(4)
+        with STIFileWriter(self.path) as writer:
+            writer.write_all(points[:3])
+
+        # A run interrupted while writing a point leaves records, handles
+        # and an index record that are incomplete
+        with open(self.path + '.sti', 'ab') as outfile:
+            outfile.write(b'\x01' * 50)
+        with open(self.path + '.handles', 'ab') as outfile:
+            outfile.write(b'12')
+        with open(self.path + '.index', 'ab') as outfile:
+            outfile.write(b'\x01' * 10)
+
+        with STIFileWriter(self.path) as writer:
+            self.assertEqual(writer.records, 3 * self.num_atoms)
+            writer.write(points[3])
+
+        series = STIFile(self.path)
+        self.assertEqual(len(series), 4)
+        self.assertEqual(len(series.handles), self.num_atoms)
+        self.assertEqual([sti_pairs(point) for point in series],
+                         [sti_pairs(point) for point in points])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Tests of the timeseries containers in timeseries.py
+"""
+
+import unittest
+import opencog
+from timeseries import Timeseries, DeltaTimeseries
+from test_client import FakeServerTestCase, sti_pairs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TimeseriesTest(FakeServerTestCase):
+    num_atoms = 20
+
+    def test_points(self):
+        points = self.capture(3)
+        timeseries = Timeseries()
+        timeseries.extend(points)
+        self.assertEqual(len(timeseries), 3)
+        self.assertEqual([sti_pairs(point) for point in timeseries],
+                         [sti_pairs(point) for point in points])
+        self.assertEqual(list(timeseries.rows()),
+                         [(point['timestep'], atom['handle'],
+                           float(atom['sti']))
+                          for point in points for atom in point['atoms']])
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_arrays(self):
+        timeseries = Timeseries()
+        timeseries.extend(self.capture(2))
+        timesteps, columns, sti = timeseries.arrays()
+        expected = timesteps.tolist(), columns.tolist(), sti.tolist()
+        self.assertEqual(len(sti), 2 * self.num_atoms)
+
+        # Appending moves the memory of the arrays, which the arrays that
+        # were returned must not depend on
+        for timestep in range(2, 200):
+            timeseries.append(opencog.get_atomspace(timestep))
+        self.assertEqual((timesteps.tolist(), columns.tolist(),
+                          sti.tolist()), expected)
+
+        matrix = timeseries.sti_matrix()
+        self.assertEqual(matrix.shape, (200, self.num_atoms))
+        self.assertEqual(matrix[:2].ravel().tolist(), expected[2])
+
+
+class DeltaTimeseriesTest(FakeServerTestCase):
+    def test_replay(self):
+        points = self.capture(12, attentional_focus=True)
+        timeseries = DeltaTimeseries(keyframe_interval=5)
+        for point in points:
+            timeseries.append(point)
+
+        replayed = list(timeseries)
+        self.assertEqual(len(replayed), len(points))
+        for point, expected in zip(replayed, points):
+            self.assertEqual(point['timestep'], expected['timestep'])
+            self.assertEqual(sti_pairs(point), sti_pairs(expected))
+        for expected in points:
+            self.assertEqual(sti_pairs(timeseries.point(expected['timestep'])),
+                             sti_pairs(expected))
+
+    def test_removed_atoms(self):
+        timeseries = DeltaTimeseries()
+        points = self.capture(3)
+        opencog.clear_atomspace()
+        points.append(opencog.get_atomspace(3))
+        for point in points:
+            timeseries.append(point)
+        self.assertEqual([sti_pairs(point) for point in timeseries],
+                         [sti_pairs(point) for point in points])
+        self.assertEqual(len(timeseries.deltas[-1]['removed']),
+                         self.num_atoms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+"""
+Containers for the timeseries captured during an experiment
+
+A timeseries is any sequence of PointInTime dictionaries, as created by
+create_point() in opencog.py. The containers defined here store the same
+information more compactly, and can be iterated over to obtain the
+PointInTime dictionaries again, so they can be passed anywhere a list of
+points is accepted.
+
+See README.md for documentation and instructions.
+"""
+
+from array import array
+
+# NumPy is imported the first time it is needed, by _require_numpy()
+numpy = None
+
+
+class Timeseries(object):
+    """
+    Columnar timeseries that stores the timestep, atom and STI of every atom
+    at every point in time in flat typed arrays
+
+    Each distinct handle is assigned a column the first time it is seen, so
+    that the STI values can be returned as a matrix with one row per point
+    in time and one column per atom. Appending a point only extends the
+    arrays, so it takes amortized constant time per atom.
+
+    Iterating over the timeseries yields PointInTime dictionaries, so it can
+    be passed anywhere a list of points is accepted. STI values are stored as
+    floating point numbers.
+
+    Example:
+        timeseries = Timeseries()
+        for t in range(0, num_steps):
+            timeseries.append(get_attentional_focus(timestep=t))
+            importance_diffusion()
+        sti = timeseries.sti_matrix()
+    """
+    def __init__(self):
+        # One entry per atom at each point in time
+        self.timesteps = array('l')
+        self.columns = array('l')
+        self.sti = array('d')
+
+        # One entry per point in time. The atoms of point i are stored at
+        # positions offsets[i] to offsets[i + 1] of the atom arrays.
+        self.point_timesteps = array('l')
+        self.offsets = array('l', [0])
+        self.schemes = []
+
+        # Maps each column to its handle, and each handle to its column
+        self.handles = []
+        self.index = {}
+
+    def append(self, point):
+        """
+        Add a point in time to the end of the timeseries
+
+        Parameters:
+        point (required) A PointInTime dictionary
+        """
+        self._append(point['timestep'],
+                     ((atom['handle'], atom['sti'])
+                      for atom in point['atoms']),
+                     point['scheme'])
+
+    def append_atoms(self, timestep, atoms, scheme=None):
+        """
+        Add a point in time directly from atoms in the JSON format of the
+        REST API, without building a PointInTime dictionary first
+
+        Combined with CogServerClient.get_atoms(stream=True), each atom is
+        stored as it is parsed from the response.
+
+        Parameters:
+        timestep (required) The timestep of the point in time
+        atoms (required) An iterable of atoms in the JSON format of the REST
+          API
+        scheme (optional) The Scheme representation of the point in time
+        """
+        self._append(timestep,
+                     ((atom['handle'], atom['attentionvalue']['sti'])
+                      for atom in atoms),
+                     scheme)
+
+    def _append(self, timestep, records, scheme):
+        index = self.index
+        for handle, sti in records:
+            column = index.get(handle)
+            if column is None:
+                column = index[handle] = len(self.handles)
+                self.handles.append(handle)
+            self.columns.append(column)
+            self.sti.append(sti)
+
+        count = len(self.sti) - self.offsets[-1]
+        self.timesteps.extend(array('l', [timestep]) * count)
+        self.point_timesteps.append(timestep)
+        self.offsets.append(len(self.sti))
+        self.schemes.append(scheme)
+
+    def extend(self, points):
+        """
+        Add a sequence of points in time to the end of the timeseries
+        """
+        for point in points:
+            self.append(point)
+
+    def __len__(self):
+        return len(self.point_timesteps)
+
+    def __iter__(self):
+        for position in range(len(self.point_timesteps)):
+            yield self.point(position)
+
+    def point(self, position):
+        """
+        Return the PointInTime dictionary at a position in the timeseries
+
+        Parameters:
+        position (required) Index of the point, starting from 0
+        """
+        handles = self.handles
+        start = self.offsets[position]
+        end = self.offsets[position + 1]
+        return {
+            'timestep': self.point_timesteps[position],
+            'atoms': [{'handle': handles[column], 'sti': sti}
+                      for column, sti in zip(self.columns[start:end],
+                                             self.sti[start:end])],
+            'scheme': self.schemes[position]
+        }
+
+    def to_dicts(self):
+        """
+        Convert the timeseries to a list of PointInTime dictionaries
+        """
+        return list(self)
+
+    def rows(self):
+        """
+        Iterate over (timestep, handle, sti) tuples for every atom at every
+        point in time
+        """
+        handles = self.handles
+        for timestep, column, sti in zip(self.timesteps, self.columns,
+                                         self.sti):
+            yield timestep, handles[column], sti
+
+    def column(self, handle):
+        """
+        Return the column of the STI matrix that holds a given atom
+        """
+        return self.index[handle]
+
+    def arrays(self):
+        """
+        Return copies of the timestep, column and STI arrays as NumPy arrays
+
+        They are copied, as appending a point can move the memory of the
+        arrays.
+        """
+        return tuple(view.copy() for view in self._views())
+
+    def _views(self):
+        # NumPy views of the arrays, which are only valid until the next
+        # point is appended
+        _require_numpy()
+        return (numpy.frombuffer(self.timesteps, dtype=numpy.int_),
+                numpy.frombuffer(self.columns, dtype=numpy.int_),
+                numpy.frombuffer(self.sti, dtype=numpy.float64))
+
+    def sti_matrix(self, fill=float('nan')):
+        """
+        Return the STI values as a NumPy array with one row per point in time
+        and one column per atom
+
+        Parameters:
+        fill (optional) Value for atoms that are absent at a point in time.
+          Defaults to NaN.
+        """
+        _, columns, sti = self._views()
+        offsets = numpy.frombuffer(self.offsets, dtype=numpy.int_)
+        rows = numpy.repeat(numpy.arange(len(self)), numpy.diff(offsets))
+
+        matrix = numpy.full((len(self), len(self.handles)), fill)
+        matrix[rows, columns] = sti
+        return matrix
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("NumPy is required for this operation; to "
+                              "enable, install NumPy")
+
+
+class DeltaTimeseries(object):
+    """
+    Timeseries that stores each point in time as the changes since the
+    previous point
+
+    Each delta records the atoms that were added, the atoms that were
+    removed and the atoms whose STI changed, so that atoms which are the same
+    from one timestep to the next are only stored once. Iterating over the
+    timeseries replays the deltas and yields the full PointInTime dictionary
+    at each timestep, with the atoms ordered by handle.
+
+    Parameters:
+    keyframe_interval (optional) If set, the full state is also kept every
+      'keyframe_interval' points, so that point() does not have to replay
+      every delta from the start of the timeseries. Defaults to None, which
+      stores no keyframes.
+
+    Example:
+        timeseries = DeltaTimeseries()
+        for t in range(0, num_steps):
+            timeseries.append(get_atomspace(timestep=t))
+            importance_diffusion()
+        export_timeseries_csv(timeseries, "output.csv")
+    """
+    def __init__(self, keyframe_interval=None):
+        self.keyframe_interval = keyframe_interval
+        self.deltas = []
+        self._index = {}
+        self._keyframes = {}
+        self._state = {}
+        self._scheme = None
+
+    def append(self, point):
+        """
+        Add a point in time to the end of the timeseries
+
+        Parameters:
+        point (required) A PointInTime dictionary
+        """
+        previous = self._state
+        current = {}
+        added = []
+        changed = []
+        for atom in point['atoms']:
+            handle = atom['handle']
+            sti = atom['sti']
+            current[handle] = sti
+            if handle not in previous:
+                added.append((handle, sti))
+            elif previous[handle] != sti:
+                changed.append((handle, sti))
+
+        if len(current) - len(added) < len(previous):
+            removed = [handle for handle in previous
+                       if handle not in current]
+        else:
+            removed = []
+
+        delta = {
+            'timestep': point['timestep'],
+            'added': added,
+            'changed': changed,
+            'removed': removed
+        }
+        if point['scheme'] != self._scheme:
+            delta['scheme'] = point['scheme']
+            self._scheme = point['scheme']
+
+        self._index[point['timestep']] = len(self.deltas)
+        self.deltas.append(delta)
+        self._state = current
+
+        if self.keyframe_interval and \
+                len(self.deltas) % self.keyframe_interval == 0:
+            self._keyframes[len(self.deltas) - 1] = (dict(current),
+                                                     self._scheme)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def __iter__(self):
+        return self.replay()
+
+    def replay(self, start=0, stop=None):
+        """
+        Iterate over the full PointInTime dictionaries of the timeseries
+
+        Parameters:
+        start (optional) Position of the first point to yield
+        stop (optional) Position after the last point to yield. Defaults to
+          the end of the timeseries.
+        """
+        if stop is None:
+            stop = len(self.deltas)
+
+        # Resume from the closest keyframe at or before the start
+        state = {}
+        scheme = None
+        position = 0
+        for keyframe in sorted(self._keyframes, reverse=True):
+            if keyframe < start:
+                state, scheme = self._keyframes[keyframe]
+                state = dict(state)
+                position = keyframe + 1
+                break
+
+        for position in range(position, stop):
+            delta = self.deltas[position]
+            for handle in delta['removed']:
+                del state[handle]
+            for handle, sti in delta['added']:
+                state[handle] = sti
+            for handle, sti in delta['changed']:
+                state[handle] = sti
+            scheme = delta.get('scheme', scheme)
+
+            if position >= start:
+                yield {
+                    'timestep': delta['timestep'],
+                    'atoms': [{'handle': handle, 'sti': state[handle]}
+                              for handle in sorted(state)],
+                    'scheme': scheme
+                }
+
+    def point(self, timestep):
+        """
+        Rebuild the full PointInTime dictionary at a given timestep
+
+        Parameters:
+        timestep (required) The timestep of the point, as passed to
+          get_atomspace() or get_attentional_focus()
+        """
+        position = self._index[timestep]
+        return next(self.replay(position, position + 1))